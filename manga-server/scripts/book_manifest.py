@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Book Manifest
+
+Per-book JSON file (``book-manifest.json``) describing what the reader
+generator produced, for the bookshelf, the server and the readers:
+- Title, page and chapter counts, total image bytes and average dimensions
+- The reader mode chosen by ``reader_policy`` and why
+- Preload hints for the first pages of each reader file, which the server
+  sends as ``Link`` headers (early hints)
+- Written through ``OutputWriter``: byte-deterministic (sorted keys, no
+  timestamps) and only rewritten when its content changes
+
+Author: mastersamasama
+Version: 1.0
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+MANIFEST_NAME = 'book-manifest.json'
+MANIFEST_VERSION = 1
+
+# First pages of a reader preloaded from its <head> and announced as early hints
+PRELOAD_PAGES = 2
+
+
+def read_manifest(book_path: Path) -> Optional[Dict]:
+    """The manifest of a book, or None if it has none (or an unusable one)."""
+    try:
+        with open(Path(book_path) / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable book manifest in {book_path}: {e}")
+        return None
+    if not isinstance(data, dict) or data.get('version') != MANIFEST_VERSION:
+        return None
+    return data
+
+
+def manifest_reader_file(book_path: Path) -> Optional[Path]:
+    """The reader recorded in the manifest, if it exists."""
+    manifest = read_manifest(book_path)
+    name = (manifest or {}).get('reader', {}).get('file')
+    if not name:
+        return None
+    path = Path(book_path) / name
+    return path if path.is_file() else None
+
+
+def preload_hints(sources: List[str], count: int = PRELOAD_PAGES,
+                  srcsets: Optional[Dict[str, Optional[Tuple[str, str]]]] = None) -> List[Dict[str, str]]:
+    """
+    Preload hints for the first pages of a reader, in reading order.
+
+    The same list is rendered as ``<link rel=preload>`` by the reader and
+    stored in the manifest, where the server picks it up as ``Link`` headers.
+    Pages with responsive variants carry their ``srcset``/``sizes``, so the
+    preload fetches the same candidate the ``<img>`` will pick.
+    """
+    hints = []
+    for i, src in enumerate(sources[:count]):
+        hint = {'href': src, 'as': 'image', 'fetchpriority': 'high' if i == 0 else 'auto'}
+        srcset = (srcsets or {}).get(src)
+        if srcset:
+            hint['imagesrcset'], hint['imagesizes'] = srcset
+        hints.append(hint)
+    return hints
+
+
+def preload_links(hints: List[Dict[str, str]]) -> str:
+    """The hints as ``<link>`` elements, one per line, for a reader's <head>."""
+    links = []
+    for hint in hints:
+        responsive = (f' imagesrcset="{hint["imagesrcset"]}" imagesizes="{hint["imagesizes"]}"'
+                      if 'imagesrcset' in hint else '')
+        links.append(f'\n    <link rel="preload" href="{hint["href"]}" as="{hint["as"]}"{responsive} '
+                     f'fetchpriority="{hint["fetchpriority"]}">')
+    return ''.join(links)
+
+
+def write_manifest(book_path: Path, manifest: Dict, writer) -> bool:
+    """
+    Write a book's manifest.
+
+    Args:
+        book_path: Book folder
+        manifest: Manifest content (``version`` is added)
+        writer: ``output_writer.OutputWriter`` used for the file
+
+    Returns:
+        True if the file changed on disk
+    """
+    data = {'version': MANIFEST_VERSION, **manifest}
+    content = json.dumps(data, ensure_ascii=False, sort_keys=True, indent=1) + '\n'
+    # Read by name by the bookshelf and the server, so no content-hashed copy
+    return writer.write_text(Path(book_path) / MANIFEST_NAME, content, hashed=False)
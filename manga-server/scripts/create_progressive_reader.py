@@ -24,6 +24,8 @@ def get_manga_images(folder_path: Path) -> Tuple[List[Dict], int]:
         # Get all image files recursively
         for root, dirs, files in os.walk(folder_path):
             root_path = Path(root)
+            # Visit chapters in a stable order, not the filesystem's listing order
+            dirs.sort()
             
             # Sort files naturally
             image_files = []
@@ -32,7 +34,7 @@ def get_manga_images(folder_path: Path) -> Tuple[List[Dict], int]:
                     image_files.append(file)
             
             # Sort naturally (handle numeric ordering)
-            image_files.sort(key=lambda x: [int(c) if c.isdigit() else c.lower() for c in re.split(r'(\d+)', x)])
+            image_files.sort(key=lambda x: ([int(c) if c.isdigit() else c.lower() for c in re.split(r'(\d+)', x)], x))
             
             for file in image_files:
                 file_path = root_path / file
@@ -76,10 +78,11 @@ def create_progressive_reader(folder_path: str) -> bool:
     # The working reader already handles large collections well
     output_path = folder / "index-mb-virtualscroll.html"
     try:
-        import shutil
-        shutil.copy2(working_reader, output_path)
-        
-        print(f"[OK] Successfully created virtual scroll reader: {output_path}")
+        from output_writer import write_atomic
+        if write_atomic(output_path, working_reader.read_bytes()):
+            print(f"[OK] Successfully created virtual scroll reader: {output_path}")
+        else:
+            print(f"[OK] Virtual scroll reader already up to date: {output_path}")
         return True
         
     except Exception as e:
@@ -10,15 +10,37 @@ Version: 3.0
 """
 
 import os
+import re
 import sys
+import json
+import time
 import logging
+import argparse
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional, Set
-from dataclasses import dataclass
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Dict, Tuple, Optional, Set
+from dataclasses import dataclass, field, asdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
 import mimetypes
 from datetime import datetime
 
+from book_manifest import PRELOAD_PAGES, preload_hints, preload_links, read_manifest, write_manifest
+from image_probe import read_dimensions
+from image_tiles import Tiles, available as tiles_available, build_tiles, is_strip
+from image_transcode import avif_pages, read_transcode_map, transcoded_pages
+from image_variants import Variants, available as variants_available, build_variants, srcset_attributes
+from offline_cache import hash_pages, offline_script, write_offline_files
+from output_writer import OutputWriter
+from page_check import EXCLUDE, FLAG, MODES as CHECK_MODES, OFF, check_pages, env_mode as env_check_mode
+from page_placeholders import (available as placeholders_available, build_placeholders,
+                               encode_placeholders, placeholder_css)
+from prefetch_window import encode_page_kib, page_kib_json, prefetch_window_script
+from safe_walk import NEVER, SYMLINK_MODES, SafeWalker, WalkReport, env_mode as env_symlink_mode
+from scrubber_thumbs import (Thumbs, available as thumbs_available, build_thumbs, scrubber_json,
+                             scrubber_script)
+from reader_policy import (MODES, PLAIN, SPLIT, BookStats, ReaderCostModel, ReaderDecision,
+                           choose_reader_mode, estimate)
+
 
 # Configure logging
 logging.basicConfig(
@@ -49,6 +71,73 @@ class MangaMetadata:
     chapters: List[Chapter]
     total_pages: int
     base_path: Path
+    page_bytes: Dict[Path, int] = field(default_factory=dict)  # File size of every page, from the scan
+    variants: Variants = field(default_factory=dict)  # Responsive variants per page URL (image_variants.py)
+    transcoded: Dict[str, Tuple[str, int]] = field(default_factory=dict)  # src -> (URL, bytes) of smaller copies (image_transcode.py)
+    tiles: Tiles = field(default_factory=dict)  # Tiles of tall strips per page URL (image_tiles.py)
+    placeholders: Dict[str, str] = field(default_factory=dict)  # Placeholder code per page URL (page_placeholders.py)
+    thumbs: Thumbs = field(default_factory=dict)  # Slider preview thumbnail per page URL (scrubber_thumbs.py)
+    damaged: Dict[str, str] = field(default_factory=dict)  # Truncated or misnamed pages by src (page_check.py)
+    avif: Dict[str, Tuple[str, int]] = field(default_factory=dict)  # Page URL -> (URL, bytes) of AVIF copies (image_transcode.py)
+    dimensions: Dict[Path, Optional[Tuple[int, int]]] = field(default_factory=dict)  # Header width and height of every page, from the scan (page_check.py)
+    
+    def page_dimensions(self, path: Path) -> Optional[Tuple[int, int]]:
+        """Width and height of a page as recorded by the scan (read from its header otherwise)."""
+        if path in self.dimensions:
+            return self.dimensions[path]
+        return read_dimensions(path)
+
+
+@dataclass
+class BookResult:
+    """Outcome of generating one reader in a batch run."""
+    path: str
+    status: str  # 'ok', 'error' or 'skipped' (claimed by another run)
+    output: Optional[str] = None
+    chapters: int = 0
+    pages: int = 0
+    bytes: int = 0
+    written: bool = False  # False if the existing file was already identical
+    mode: Optional[str] = None  # Reader mode chosen by reader_policy
+    files_written: int = 0  # All files of the book (reader, manifest, ...)
+    files_unchanged: int = 0
+    bytes_written: int = 0
+    seconds: float = 0.0
+    worker: int = 0  # Process id of the worker that generated it
+    error: Optional[str] = None
+    # Directory listings timed in the worker (scan_latency.DirectoryListing)
+    listings: List = field(default_factory=list)
+    
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        del data['listings']
+        return data
+
+
+def _span(tracer, name: str, category: str = 'substage', **args):
+    """
+    Open a timing span on an optional tracer.
+    
+    Any object with a ``span(name, category, **args)`` context manager works
+    (e.g. ``htmlcs_v4.PerformanceMetrics``); without one this is a no-op.
+    """
+    return tracer.span(name, category, **args) if tracer is not None else nullcontext()
+
+
+@contextmanager
+def _stage(tracer, profiler, name: str, book: Path):
+    """
+    Run a named pipeline stage under an optional tracer span and profiler.
+    
+    ``profiler`` is a ``stage_profiler.StageProfiler`` (or compatible); the
+    stage is profiled as ``reader.<name>`` and attributed to ``book``.
+    """
+    with _span(tracer, name):
+        if profiler is None:
+            yield
+        else:
+            with profiler.stage(f"reader.{name}", book=str(book)):
+                yield
 
 
 class ImageValidator:
@@ -105,9 +194,26 @@ class ImageValidator:
 class FileSystemScanner:
     """Efficiently scans filesystem for manga files and folders."""
     
-    def __init__(self, base_path: Path):
+    def __init__(self, base_path: Path, recorder=None, check: str = EXCLUDE, symlinks: str = NEVER):
+        """
+        Args:
+            base_path: Manga directory to scan
+            recorder: Optional ``scan_latency.DirectoryLatencyRecorder`` timing
+                every directory listing
+            check: What to do with truncated or misnamed images (see
+                ``page_check.py``): ``exclude`` them, ``flag`` them or ``off``
+            symlinks: Which symlinked folders to scan (see ``safe_walk.py``):
+                ``never``, ``inside`` the manga directory or ``always``
+        """
         self.base_path = base_path
         self.validator = ImageValidator()
+        self.recorder = recorder
+        self.check = check
+        self.symlinks = symlinks
+        self.sizes: Dict[Path, int] = {}  # File size of every image found, set by scan_directory()
+        self.damaged: Dict[Path, str] = {}  # Damaged images and their problem, set by scan_directory()
+        self.dimensions: Dict[Path, Optional[Tuple[int, int]]] = {}  # Header dimensions, set by scan_directory()
+        self.skipped = WalkReport()  # Loops and duplicates left out, set by scan_directory()
     
     def scan_directory(self) -> Tuple[List[Path], List[Path]]:
         """
@@ -120,9 +226,13 @@ class FileSystemScanner:
         image_files = []
         
         try:
-            # Use os.walk for better performance on large directories
-            for root, dirs, files in os.walk(self.base_path):
+            # Every physical folder and file once: symlink loops, bind mounts and
+            # hardlinked pages would otherwise be walked forever or counted twice
+            walker = SafeWalker(self.symlinks, self.recorder, book=str(self.base_path), component='reader')
+            for root, dirs, files in walker.walk(self.base_path):
                 root_path = Path(root)
+                # Hidden folders hold generated files (.manga-gen), never pages
+                dirs[:] = [name for name in dirs if not name.startswith('.')]
                 
                 # Add subdirectories (skip the base directory itself)
                 if root_path != self.base_path:
@@ -133,12 +243,29 @@ class FileSystemScanner:
                 valid_images = self._batch_validate_images(file_paths)
                 image_files.extend(valid_images)
                 
+                # Recorded once here for the policy, the readers' prefetch window and the manifest
+                for path in valid_images:
+                    try:
+                        self.sizes[path] = os.stat(path).st_size
+                    except OSError:
+                        self.sizes[path] = 0
+                
         except PermissionError as e:
             logger.error(f"Permission denied accessing directory: {e}")
             raise
         except Exception as e:
             logger.error(f"Error scanning directory {self.base_path}: {e}")
             raise
+        
+        self.skipped = walker.report
+        self.skipped.log(str(self.base_path))
+        
+        # Read once here (with the integrity check) for every later stage that needs the shape of a page
+        result = check_pages(self.base_path, self.sizes, check=self.check != OFF)
+        self.dimensions = result.dimensions
+        logger.debug(f"Read {result.read} image headers ({result.cached} unchanged since the last scan)")
+        if self.check != OFF:
+            image_files = self._check_images(image_files, result.damaged)
             
         # Sort for consistent ordering
         folders.sort()
@@ -147,6 +274,21 @@ class FileSystemScanner:
         logger.info(f"Found {len(folders)} chapters and {len(image_files)} images")
         return folders, image_files
     
+    def _check_images(self, image_files: List[Path], damaged: Dict[Path, str]) -> List[Path]:
+        """Report truncated and misnamed images; excluded ones are dropped from the scan."""
+        self.damaged = damaged
+        if not self.damaged:
+            return image_files
+        for path, problem in sorted(self.damaged.items()):
+            logger.warning(f"Damaged image {path}: {problem}")
+        if self.check == FLAG:
+            logger.warning(f"Keeping {len(self.damaged)} damaged images, flagged in the reader")
+            return image_files
+        logger.warning(f"Leaving {len(self.damaged)} damaged images out of the reader")
+        for path in self.damaged:
+            self.sizes.pop(path, None)
+        return [path for path in image_files if path not in self.damaged]
+    
     def _batch_validate_images(self, file_paths: List[Path], batch_size: int = 50) -> List[Path]:
         """Validate images in parallel batches for better performance."""
         valid_images = []
@@ -178,13 +320,15 @@ class MangaAnalyzer:
     def __init__(self, base_path: Path):
         self.base_path = base_path
         
-    def analyze_manga(self, folders: List[Path], image_files: List[Path]) -> MangaMetadata:
+    def analyze_manga(self, folders: List[Path], image_files: List[Path],
+                      page_bytes: Optional[Dict[Path, int]] = None) -> MangaMetadata:
         """
         Analyze manga structure and create metadata.
         
         Args:
             folders: List of chapter folders
             image_files: List of all image files
+            page_bytes: File sizes recorded by the scan (``FileSystemScanner.sizes``)
             
         Returns:
             MangaMetadata object with complete manga information
@@ -238,22 +382,24 @@ class MangaAnalyzer:
             title=title,
             chapters=chapters,
             total_pages=len(image_files),
-            base_path=self.base_path
+            base_path=self.base_path,
+            page_bytes=page_bytes or {}
         )
     
     def _group_images_by_chapter(self, folders: List[Path], image_files: List[Path]) -> Dict[Path, List[Path]]:
         """Group image files by their parent chapter folder."""
         chapter_images = {folder: [] for folder in folders}
         
+        # An image belongs to the first listed folder containing it; looking up its
+        # ancestors keeps this linear in the number of images
+        folder_order = {}
+        for i, folder in enumerate(folders):
+            folder_order.setdefault(folder, i)
+        
         for image in image_files:
-            for folder in folders:
-                try:
-                    # Check if image is within this folder
-                    image.relative_to(folder)
-                    chapter_images[folder].append(image)
-                    break
-                except ValueError:
-                    continue
+            matches = [folder_order[parent] for parent in image.parents if parent in folder_order]
+            if matches:
+                chapter_images[folders[min(matches)]].append(image)
         
         return chapter_images
     
@@ -277,8 +423,21 @@ class MangaAnalyzer:
 class MangaHTMLGenerator:
     """Generates the V3 final HTML template with manga content."""
     
-    def __init__(self, metadata: MangaMetadata):
+    # Assumed page size (px) when no page header of a chapter could be read
+    FALLBACK_PAGE_SIZE = (800, 1200)
+    # Pages loaded right away; later ones are lazy until the prefetch window reaches them
+    EAGER_PAGES = 3
+    
+    def __init__(self, metadata: MangaMetadata, tracer=None, profiler=None,
+                 writer: Optional[OutputWriter] = None):
         self.metadata = metadata
+        self.tracer = tracer
+        self.profiler = profiler
+        self.writer = writer or OutputWriter()
+        self.written = False  # Whether the last generate_html() changed the file
+        self.reading_order: List[Tuple[str, int]] = []  # (src, bytes) of every page, set while rendering
+        self.hints: List[Dict[str, str]] = []  # Preload hints of the rendered page
+        self._chapter_by_folder: Optional[Dict[Path, int]] = None
         
     def generate_html(self, output_path: Optional[Path] = None) -> Path:
         """
@@ -294,12 +453,16 @@ class MangaHTMLGenerator:
             output_path = self.metadata.base_path / "index-mb.html"
         
         try:
-            html_content = self._build_html_content()
+            with _stage(self.tracer, self.profiler, 'render', self.metadata.base_path):
+                html_content = self._build_html_content()
             
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
-                
-            logger.info(f"Successfully generated HTML: {output_path}")
+            with _stage(self.tracer, self.profiler, 'write', self.metadata.base_path):
+                self.written = self.writer.write_text(output_path, html_content)
+            
+            if self.written:
+                logger.info(f"Successfully generated HTML: {output_path}")
+            else:
+                logger.info(f"HTML unchanged, kept existing file: {output_path}")
             return output_path
             
         except Exception as e:
@@ -308,6 +471,14 @@ class MangaHTMLGenerator:
     
     def _build_html_content(self) -> str:
         """Build the complete HTML content."""
+        # The page list and chapter table dominate render time on large books
+        with _span(self.tracer, 'reader_content'):
+            reader_content = self._generate_reader_content()
+        sources = [self._first_image(src) for src, _ in self.reading_order[:PRELOAD_PAGES]]
+        self.hints = preload_hints(sources, srcsets={src: self._srcset(src) for src in sources})
+        with _span(self.tracer, 'javascript'):
+            javascript = self._generate_javascript()
+        
         return f"""<!DOCTYPE html>
 <html lang="ja">
 <head>
@@ -317,20 +488,24 @@ class MangaHTMLGenerator:
     <meta name="apple-mobile-web-app-capable" content="yes">
     <meta name="apple-mobile-web-app-status-bar-style" content="black-translucent">
     <title>{self.metadata.title}</title>
-    {self._get_css_styles()}
+    {self._get_css_styles()}{self._generate_head_links()}
 </head>
 <body data-theme="dark">
     {self._generate_navigation()}
     {self._generate_progress_bar()}
     {self._generate_nav_trigger()}
-    {self._generate_reader_content()}
+    {reader_content}
     {self._generate_chapter_sidebar()}
     {self._generate_settings_panel()}
     {self._generate_controls()}
-    {self._generate_javascript()}
+    {javascript}
 </body>
 </html>"""
     
+    def _generate_head_links(self) -> str:
+        """``<link>`` elements after the styles: preloads of the first pages."""
+        return preload_links(self.hints)
+    
     def _get_css_styles(self) -> str:
         """Return the V3 final CSS styles."""
         return """<style>
@@ -534,7 +709,36 @@ class MangaHTMLGenerator:
             background: var(--bg-elevated);
         }
 
+        /* Pages with an AVIF copy: the img lays out as if unwrapped */
+        picture {
+            display: contents;
+        }
+
+        /* Strips cut into tiles (image_tiles.py), stacked without gaps */
+        .page-tile {
+            display: block;
+            width: 100%;
+            height: auto;
+            -webkit-user-drag: none;
+            user-select: none;
+        }
+
+        /* Kept pages that failed the integrity check (page_check.py) */
+        .page-image[data-damaged] {
+            outline: 2px dashed #e5534b;
+            outline-offset: -2px;
+        }
+
         /* Hidden chapter markers - no visual disruption */
+        .chapter-section {
+            width: 100%;
+            display: flex;
+            flex-direction: column;
+            align-items: center;
+            /* Offscreen chapters are neither laid out nor painted */
+            content-visibility: auto;
+        }
+
         .chapter-marker {
             position: absolute;
             visibility: hidden;
@@ -701,6 +905,37 @@ class MangaHTMLGenerator:
             box-shadow: 0 2px 6px rgba(0,0,0,0.2);
         }
 
+        /* Slider preview while dragging (scrubber_thumbs.py) */
+        .scrubber-preview {
+            position: absolute;
+            bottom: calc(100% + 8px);
+            transform: translateX(-50%);
+            display: none;
+            flex-direction: column;
+            align-items: center;
+            gap: 4px;
+            padding: 6px;
+            border-radius: var(--border-radius);
+            background: var(--bg-surface);
+            box-shadow: 0 2px 12px rgba(0,0,0,0.3);
+            pointer-events: none;
+        }
+
+        .scrubber-preview.visible {
+            display: flex;
+        }
+
+        .scrubber-thumb {
+            background-color: var(--bg-elevated);
+            background-repeat: no-repeat;
+        }
+
+        .scrubber-label {
+            font-size: 12px;
+            color: var(--text-primary);
+            white-space: nowrap;
+        }
+
         /* Touch zones - Better implementation, reduced sensitivity */
         .touch-zone {
             position: fixed;
@@ -847,6 +1082,24 @@ class MangaHTMLGenerator:
             margin-top: 2px;
         }
 
+        .setting-item[hidden] {
+            display: none;
+        }
+
+        .setting-action {
+            padding: 8px 14px;
+            border: none;
+            border-radius: var(--border-radius);
+            background: var(--accent);
+            color: #000;
+            font-size: 14px;
+            cursor: pointer;
+        }
+
+        .setting-action:disabled {
+            opacity: 0.5;
+        }
+
         .toggle-switch {
             position: relative;
             width: 44px;
@@ -945,20 +1198,154 @@ class MangaHTMLGenerator:
         """Generate the main reader content with all images."""
         content = ['    <!-- Reading Area -->',
                   '    <main class="reader-container" id="readerContainer">']
+        self.reading_order = []
         
+        chapter_images = self._collect_chapter_images()
+        
+        # Output images in chapter order
+        page_counter = 1
+        for chapter in sorted(self.metadata.chapters, key=lambda ch: ch.number):
+            chapter_num = chapter.number
+            if chapter_num not in chapter_images:
+                continue
+                
+            # One section per chapter, so offscreen chapters are skipped by the renderer
+            images = chapter_images[chapter_num]
+            content.extend(self._generate_chapter_section(
+                chapter_num, page_counter, images, chapter.name if chapter_num > 1 else None))
+            page_counter += len(images)
+        
+        content.append('    </main>')
+        return '\n'.join(content)
+    
+    def _generate_chapter_section(self, chapter_num: int, first_page: int, images: List[Path],
+                                  marker: Optional[str] = None) -> List[str]:
+        """
+        A chapter's pages in a ``content-visibility: auto`` section.
+        
+        The placeholder height of the skipped section is the sum of its page
+        heights at the width they are shown (natural width, at most the
+        viewport), so the scrollbar stays accurate before pages are rendered.
+        The pages are appended to ``reading_order``.
+        """
+        pages = self._page_urls(images)
+        sources = [url for url, _ in pages]
+        sizes = self._page_sizes(images)
+        self.reading_order.extend(pages)
+        natural_height = sum(height for _, height in sizes)
+        viewport_height = sum(height / width for width, height in sizes) * 100
+        content = [f'        <section class="chapter-section" data-chapter="{chapter_num}" '
+                   f'style="contain-intrinsic-size: auto 100vw auto min({natural_height}px, {viewport_height:.2f}vw)">']
+        
+        # Add chapter marker (except for the first chapter)
+        if marker:
+            content.append(f'            <div class="chapter-marker" id="chp_{chapter_num}">{marker}</div>')
+        
+        for page, (src_path, (width, height)) in enumerate(zip(sources, sizes), first_page):
+            loading = ' loading="lazy"' if page > self.EAGER_PAGES else ''
+            if src_path in self.metadata.tiles:
+                content.extend(self._tiled_page(src_path, page, chapter_num, loading))
+                continue
+            srcset = self._srcset(src_path)
+            responsive = f' srcset="{srcset[0]}" sizes="{srcset[1]}"' if srcset else ''
+            placeholder = self._placeholder(src_path)
+            style = f' style="{placeholder}"' if placeholder else ''
+            problem = self.metadata.damaged.get(src_path)
+            damaged = f' data-damaged title="Damaged image: {problem}"' if problem else ''
+            image = (f'<img src="{src_path}"{responsive} id="page-{page}" class="page-image" alt="Page {page}" '
+                     f'data-chapter="{chapter_num}" width="{width}" height="{height}"{style}{damaged}{loading} />')
+            avif = None if srcset else self.metadata.avif.get(src_path)
+            if avif:
+                # Browsers without AVIF skip the source and load the src
+                image = f'<picture><source type="image/avif" srcset="{avif[0]}" />{image}</picture>'
+            content.append(f'            {image}')
+        content.append('        </section>')
+        return content
+    
+    def _srcset(self, src: str) -> Optional[Tuple[str, str]]:
+        """``srcset`` and ``sizes`` of a page, if it has responsive variants."""
+        entry = self.metadata.variants.get(src)
+        return srcset_attributes(src, entry) if entry else None
+    
+    def _tiled_page(self, src: str, page: int, chapter_num: int, loading: str) -> List[str]:
+        """A strip as one page element of stacked tiles (see ``image_tiles.py``)."""
+        width, tiles = self.metadata.tiles[src]
+        placeholder = self._placeholder(src)
+        style = f"width: {width}px; {placeholder}" if placeholder else f"width: {width}px"
+        content = [f'            <div id="page-{page}" class="page-image page-tiles" role="img" aria-label="Page {page}" '
+                   f'data-chapter="{chapter_num}" style="{style}">']
+        for index, (tile_url, tile_height, _) in enumerate(tiles):
+            # Tiles further down only load (and decode) near the viewport
+            tile_loading = loading if index == 0 else ' loading="lazy"'
+            content.append(f'                <img src="{tile_url}" class="page-tile" alt="" '
+                           f'width="{width}" height="{tile_height}"{tile_loading} />')
+        content.append('            </div>')
+        return content
+    
+    def _placeholder(self, src: str) -> str:
+        """Inline background shown until a page loads, if it has a placeholder."""
+        code = self.metadata.placeholders.get(src)
+        return f"background: {placeholder_css(code)}" if code else ''
+    
+    def _first_image(self, src: str) -> str:
+        """What the reader loads first for a page: its top tile if it is tiled."""
+        tiled = self.metadata.tiles.get(src)
+        return tiled[1][0][0] if tiled else src
+    
+    def _page_urls(self, images: List[Path]) -> List[Tuple[str, int]]:
+        """(URL, bytes) of the pages as the reader loads them: the transcoded copy if there is one."""
+        transcoded = self.metadata.transcoded
+        pages = []
+        for path, size in zip(images, self._page_bytes(images)):
+            src = path.relative_to(self.metadata.base_path).as_posix()
+            pages.append(transcoded.get(src, (src, size)))
+        return pages
+    
+    def _page_sizes(self, images: List[Path]) -> List[Tuple[int, int]]:
+        """Page dimensions from the image headers; unreadable ones get the average shape."""
+        sizes = [self.metadata.page_dimensions(path) for path in images]
+        known = [size for size in sizes if size and size[0] > 0 and size[1] > 0]
+        if known:
+            fallback = (round(sum(w for w, _ in known) / len(known)), round(sum(h for _, h in known) / len(known)))
+        else:
+            fallback = self.FALLBACK_PAGE_SIZE
+        return [size if size and size[0] > 0 and size[1] > 0 else fallback for size in sizes]
+    
+    def _page_bytes(self, images: List[Path]) -> List[int]:
+        """File sizes of the pages as recorded by the scan (stat otherwise, 0 if unreadable)."""
+        recorded = self.metadata.page_bytes
+        sizes = []
+        for path in images:
+            if path in recorded:
+                sizes.append(recorded[path])
+                continue
+            try:
+                sizes.append(os.stat(path).st_size)
+            except OSError:
+                sizes.append(0)
+        return sizes
+    
+    def _collect_chapter_images(self) -> Dict[int, List[Path]]:
+        """All images of the book grouped by chapter number, naturally sorted."""
         # Get all image files and group them by chapter
-        all_images = []
-        for root, _, files in os.walk(self.metadata.base_path):
-            for file in files:
-                file_path = Path(root) / file
-                if self.validator.is_valid_image(file_path):
-                    all_images.append(file_path)
+        if self.metadata.page_bytes or self.metadata.damaged:
+            # The scan's images: damaged ones it left out are not pages
+            all_images = list(self.metadata.page_bytes)
+        else:
+            all_images = []
+            for root, dirs, files in SafeWalker().walk(self.metadata.base_path):
+                dirs[:] = [name for name in dirs if not name.startswith('.')]  # Generated files
+                for file in files:
+                    file_path = Path(root) / file
+                    if self.validator.is_valid_image(file_path):
+                        all_images.append(file_path)
         
         # Natural sort function for filenames with numbers
         import re
         def natural_sort_key(path):
             """Sort key function for natural ordering of filenames with numbers."""
-            path_str = str(path.relative_to(self.metadata.base_path))
+            # POSIX separators so that the order is the same on every OS
+            path_str = path.relative_to(self.metadata.base_path).as_posix()
             # Split path into text and number parts for proper sorting
             parts = re.split(r'(\d+)', path_str.lower())
             result = []
@@ -967,7 +1354,8 @@ class MangaHTMLGenerator:
                     result.append(int(part))
                 else:
                     result.append(part)
-            return result
+            # Exact name breaks ties between names differing only in case
+            return result, path_str
         
         # Group images by chapter and sort within each chapter
         chapter_images = {}
@@ -982,57 +1370,22 @@ class MangaHTMLGenerator:
         for chapter_num in chapter_images:
             chapter_images[chapter_num].sort(key=natural_sort_key)
         
-        # Output images in chapter order
-        page_counter = 1
-        for chapter in sorted(self.metadata.chapters, key=lambda ch: ch.number):
-            chapter_num = chapter.number
-            if chapter_num not in chapter_images:
-                continue
-                
-            # Add chapter marker (except for the first chapter)
-            if chapter_num > 1:
-                content.append(f'        <div class="chapter-marker" id="chp_{chapter_num}">{chapter.name}</div>')
-            
-            # Add all images for this chapter
-            for image_path in chapter_images[chapter_num]:
-                relative_path = image_path.relative_to(self.metadata.base_path)
-                src_path = str(relative_path).replace('\\', '/')
-                content.append(f'        <img src="{src_path}" id="page-{page_counter}" class="page-image" alt="Page {page_counter}" data-chapter="{chapter_num}" />')
-                page_counter += 1
-        
-        content.append('    </main>')
-        return '\n'.join(content)
+        return chapter_images
     
     def _determine_image_chapter(self, image_path: Path) -> int:
         """Determine which chapter an image belongs to."""
-        # Check for exact parent directory match first (most specific)
-        image_parent = image_path.parent
-        
-        for chapter in self.metadata.chapters:
-            if chapter.folder_path == image_parent:
-                return chapter.number
+        if self._chapter_by_folder is None:
+            self._chapter_by_folder = {}
+            for chapter in self.metadata.chapters:
+                self._chapter_by_folder.setdefault(chapter.folder_path, chapter.number)
         
-        # If no exact match, find the chapter that contains this image
-        # with the shortest relative path (most specific match)
-        best_match = None
-        best_match_depth = float('inf')
-        
-        for chapter in self.metadata.chapters:
-            try:
-                # Check if image is within this chapter's folder
-                relative_path = image_path.relative_to(chapter.folder_path)
-                
-                # Calculate path depth - fewer parts means more specific
-                depth = len(relative_path.parts)
-                
-                if depth < best_match_depth:
-                    best_match = chapter.number
-                    best_match_depth = depth
-                    
-            except ValueError:
-                continue
+        # The nearest enclosing chapter folder is the most specific match
+        # (the exact parent directory first)
+        for folder in image_path.parents:
+            if folder in self._chapter_by_folder:
+                return self._chapter_by_folder[folder]
         
-        return best_match if best_match is not None else 1
+        return 1
     
     def _generate_chapter_sidebar(self) -> str:
         """Generate the chapter navigation sidebar."""
@@ -1092,6 +1445,14 @@ class MangaHTMLGenerator:
             </div>
             <div class="toggle-switch active" id="edgeTouchToggle"></div>
         </div>
+
+        <div class="setting-item" id="offlineSetting" hidden>
+            <div class="setting-info">
+                <div class="setting-label">Offline Reading</div>
+                <div class="setting-description" id="downloadStatus">Keep this chapter's pages on this device</div>
+            </div>
+            <button class="setting-action" id="downloadChapterBtn">Download chapter</button>
+        </div>
     </div>"""
     
     def _generate_controls(self) -> str:
@@ -1123,7 +1484,7 @@ class MangaHTMLGenerator:
                 'name': chapter.name
             }
         
-        return f"""    <script>
+        return f"""    <script>{prefetch_window_script(' ' * 8)}{offline_script(' ' * 8)}{scrubber_script(' ' * 8)}
         class FinalMangaReader {{
             constructor() {{
                 this.currentPage = 1;
@@ -1139,10 +1500,14 @@ class MangaHTMLGenerator:
                 // Chapter configuration
                 this.chapterRanges = {str(chapter_ranges).replace("'", '"')};
                 
+                // Reading-order prefetch plan: size of every page in KiB
+                this.prefetch = new PrefetchWindow({page_kib_json([size for _, size in self.reading_order])});
+                
                 this.initializeElements();
                 this.setupEventListeners();
                 this.loadSettings();
                 this.setupObservers();
+                this.prefetchAhead();
                 this.updateProgress();
                 this.startAutoHideIfEnabled();
             }}
@@ -1169,6 +1534,8 @@ class MangaHTMLGenerator:
                 // Progress slider
                 this.progressSliderContainer = document.getElementById('progressSliderContainer');
                 this.progressSlider = document.getElementById('progressSlider');
+                this.scrubber = new ScrubberPreview(this.progressSliderContainer,
+                    {scrubber_json(self.metadata.thumbs, [url for url, _ in self.reading_order])});
                 
                 // Reader elements
                 this.readerContainer = document.getElementById('readerContainer');
@@ -1185,6 +1552,11 @@ class MangaHTMLGenerator:
                 this.autoHideToggle = document.getElementById('autoHideToggle');
                 this.darkThemeToggle = document.getElementById('darkThemeToggle');
                 this.edgeTouchToggle = document.getElementById('edgeTouchToggle');
+                
+                // Offline reading
+                this.offlineSetting = document.getElementById('offlineSetting');
+                this.downloadChapterBtn = document.getElementById('downloadChapterBtn');
+                this.downloadStatus = document.getElementById('downloadStatus');
             }}
 
             setupEventListeners() {{
@@ -1200,6 +1572,13 @@ class MangaHTMLGenerator:
                 // Overlay
                 this.overlay.addEventListener('click', () => this.closePanels());
                 
+                // Offline reading through the book's service worker
+                this.offline = new OfflineCache();
+                if (this.offline.supported) {{
+                    this.offlineSetting.hidden = false;
+                    this.downloadChapterBtn.addEventListener('click', () => this.downloadChapter());
+                }}
+                
                 // Touch zones - narrower and only when nav hidden
                 this.touchZoneLeft.addEventListener('click', () => this.previousPage());
                 this.touchZoneRight.addEventListener('click', () => this.nextPage());
@@ -1207,15 +1586,17 @@ class MangaHTMLGenerator:
                 // Navigation trigger zone - small area at top
                 this.navTriggerZone.addEventListener('click', () => this.showNavigation());
                 
-                // Progress slider with real-time sync
+                // Progress slider: previews pages while dragging, so pages
+                // dragged past are not loaded; jumps where it is released
                 this.progressSlider.addEventListener('input', (e) => {{
                     this.isSliderActive = true;
-                    const targetPage = parseInt(e.target.value);
-                    this.goToPageImmediate(targetPage); // Real-time page change
+                    this.previewPage(parseInt(e.target.value));
                 }});
                 
                 this.progressSlider.addEventListener('change', (e) => {{
                     this.isSliderActive = false;
+                    this.scrubber.hide();
+                    this.goToPageImmediate(parseInt(e.target.value));
                 }});
                 
                 // Settings toggles
@@ -1311,7 +1692,7 @@ class MangaHTMLGenerator:
                             
                             if (distance < bestDistance) {{
                                 bestDistance = distance;
-                                bestPage = entry.target;
+                                bestPage = entry.target.closest('.page-image');
                             }}
                         }}
                     }});
@@ -1320,6 +1701,7 @@ class MangaHTMLGenerator:
                         const pageNum = parseInt(bestPage.id.split('-')[1]);
                         if (pageNum && pageNum !== this.currentPage) {{
                             this.currentPage = pageNum;
+                            this.prefetchAhead();
                             if (!this.isSliderActive) {{
                                 this.updateProgress();
                                 this.updateChapter();
@@ -1331,12 +1713,34 @@ class MangaHTMLGenerator:
                     rootMargin: '0px'
                 }});
 
-                // Performance warning for large collections
-                if (this.pages.length > 3000) {{
-                    console.warn(`Large collection detected (${{this.pages.length}} pages). Consider using virtual scroll version.`);
-                }}
+                // Only pages of chapters near the viewport are observed
+                const sectionObserver = new IntersectionObserver((entries) => {{
+                    entries.forEach(entry => {{
+                        // Tiles stand in for their strip, which is never 20% visible
+                        const pages = entry.target.querySelectorAll('img.page-image, .page-tile');
+                        if (entry.isIntersecting) {{
+                            pages.forEach(page => observer.observe(page));
+                        }} else {{
+                            pages.forEach(page => observer.unobserve(page));
+                        }}
+                    }});
+                }}, {{
+                    rootMargin: '100% 0px'
+                }});
                 
-                this.pages.forEach(page => observer.observe(page));
+                document.querySelectorAll('.chapter-section').forEach(section => sectionObserver.observe(section));
+            }}
+
+            // Start loading the pages after the current one that fit in the prefetch window
+            prefetchAhead() {{
+                const last = Math.min(this.pages.length, this.currentPage + this.prefetch.pagesAhead(this.currentPage));
+                for (let page = this.currentPage + 1; page <= last; page++) {{
+                    // The top tile of a strip; the rest load as they near the viewport
+                    const image = this.pages[page - 1].querySelector('img') || this.pages[page - 1];
+                    if (image.loading === 'lazy') {{
+                        image.loading = 'eager';
+                    }}
+                }}
             }}
 
             // Navigation methods
@@ -1434,6 +1838,7 @@ class MangaHTMLGenerator:
             goToPageImmediate(pageNum) {{
                 if (pageNum >= 1 && pageNum <= this.totalPages) {{
                     this.currentPage = pageNum;
+                    this.prefetchAhead();
                     this.updateProgress();
                     this.updateChapter();
                     
@@ -1447,6 +1852,11 @@ class MangaHTMLGenerator:
                 }}
             }}
 
+            previewPage(pageNum) {{
+                const ratio = (pageNum - 1) / Math.max(1, this.totalPages - 1);
+                this.scrubber.show(pageNum, ratio, `${{pageNum}} / ${{this.totalPages}}`);
+            }}
+
             // Chapter navigation
             goToChapter(chapter) {{
                 if (this.chapterRanges[chapter]) {{
@@ -1509,6 +1919,25 @@ class MangaHTMLGenerator:
                 this.overlay.classList.add('visible');
             }}
 
+            // Cache every page of the current chapter for offline reading
+            downloadChapter() {{
+                this.downloadChapterBtn.disabled = true;
+                this.offline.downloadChapter(this.currentChapter, ({{ done, total, failed, error, complete }}) => {{
+                    if (error) {{
+                        this.downloadStatus.textContent = error;
+                    }} else if (complete) {{
+                        this.downloadStatus.textContent = failed
+                            ? `${{failed}} of ${{total}} pages could not be saved`
+                            : `Saved ${{total}} pages for offline reading`;
+                    }} else {{
+                        this.downloadStatus.textContent = `Downloading ${{done}} / ${{total}}`;
+                    }}
+                    if (error || complete) {{
+                        this.downloadChapterBtn.disabled = false;
+                    }}
+                }});
+            }}
+
             toggleSettingsPanel() {{
                 if (this.settingsPanel.classList.contains('open')) {{
                     this.closePanels();
@@ -1654,17 +2083,452 @@ class MangaHTMLGenerator:
         return ImageValidator()
 
 
+@dataclass
+class ReaderPart:
+    """One file of a split reader: a chapter, or a slice of a long chapter."""
+    chapter: Chapter
+    file_name: str
+    images: List[str]  # Page URLs relative to the book folder
+    start_page: int  # Book-wide number of the first page
+    slice: int = 1  # 1-based slice of the chapter
+
+
+class ChapterHTMLGenerator(MangaHTMLGenerator):
+    """
+    Reader page for one part of a split book.
+    
+    Same reader UI as the whole-book page, but its size only depends on the
+    part's own pages: the chapter sidebar lists just the neighbouring parts
+    and links to the book index for the rest.
+    """
+    
+    # Pages of the next part prefetched once the reader gets this close to the end
+    PREFETCH_PAGES = 3
+    
+    def __init__(self, metadata: MangaMetadata, part: ReaderPart, index_file: str,
+                 prev_part: Optional[ReaderPart] = None, next_part: Optional[ReaderPart] = None,
+                 writer: Optional[OutputWriter] = None):
+        chapter = part.chapter
+        page_count = len(part.images)
+        part_chapter = Chapter(chapter.number, chapter.name, chapter.folder_path, page_count, 1, page_count)
+        super().__init__(MangaMetadata(metadata.title, [part_chapter], page_count, metadata.base_path,
+                                       metadata.page_bytes, metadata.variants, metadata.transcoded,
+                                       metadata.tiles, metadata.placeholders, metadata.thumbs,
+                                       metadata.damaged, metadata.avif, metadata.dimensions),
+                         writer=writer)
+        self.part = part
+        self.index_file = index_file
+        self.prev_part = prev_part
+        self.next_part = next_part
+    
+    @staticmethod
+    def part_label(part: ReaderPart) -> str:
+        return part.chapter.name if part.slice == 1 else f"{part.chapter.name} ({part.slice})"
+    
+    def _generate_head_links(self) -> str:
+        links = [f'\n    <link rel="prefetch" href="{part.file_name}">'
+                 for part in (self.next_part, self.prev_part) if part]
+        return super()._generate_head_links() + ''.join(links)
+    
+    def _get_css_styles(self) -> str:
+        return super()._get_css_styles() + """
+    <style>
+        .part-nav {
+            display: flex;
+            gap: 12px;
+            justify-content: center;
+            flex-wrap: wrap;
+            padding: 32px 16px calc(48px + var(--safe-bottom));
+        }
+        
+        .part-link {
+            padding: 12px 20px;
+            border-radius: var(--border-radius);
+            background: var(--bg-elevated);
+            color: var(--text-primary);
+            text-decoration: none;
+        }
+        
+        .part-link.next {
+            background: var(--accent);
+            color: #000;
+        }
+        
+        a.chapter-item {
+            display: block;
+            color: inherit;
+            text-decoration: none;
+        }
+    </style>"""
+    
+    def _generate_reader_content(self) -> str:
+        chapter_num = self.part.chapter.number
+        content = ['    <!-- Reading Area -->',
+                   '    <main class="reader-container" id="readerContainer">']
+        self.reading_order = []
+        base_path = self.metadata.base_path
+        content.extend(self._generate_chapter_section(chapter_num, 1, [base_path / src for src in self.part.images]))
+        
+        # End of the part: continue reading
+        content.append('        <nav class="part-nav" id="partNav">')
+        if self.prev_part:
+            content.append(f'            <a class="part-link" href="{self.prev_part.file_name}">← {self.part_label(self.prev_part)}</a>')
+        content.append(f'            <a class="part-link" href="{self.index_file}">📚 All chapters</a>')
+        if self.next_part:
+            content.append(f'            <a class="part-link next" href="{self.next_part.file_name}">{self.part_label(self.next_part)} →</a>')
+        content.append('        </nav>')
+        content.append('    </main>')
+        return '\n'.join(content)
+    
+    def _generate_chapter_sidebar(self) -> str:
+        content = [
+            '    <!-- Chapter Sidebar -->',
+            '    <aside class="chapter-sidebar" id="chapterSidebar">',
+            '        <div class="sidebar-header">',
+            f'            <div class="sidebar-title">{self.metadata.title}</div>',
+            '            <button class="sidebar-close" id="sidebarClose">✕</button>',
+            '        </div>',
+            '        <div class="chapter-list">'
+        ]
+        
+        # Only the neighbours; the full list lives on the book index
+        if self.prev_part:
+            content.append(self._sidebar_link(self.prev_part.file_name, self.part_label(self.prev_part),
+                                              f"{len(self.prev_part.images)} pages"))
+        content.append(f'''            <div class="chapter-item active" data-chapter="{self.part.chapter.number}">
+                <div class="chapter-title">{self.part_label(self.part)}</div>
+                <div class="chapter-pages">{len(self.part.images)} pages</div>
+            </div>''')
+        if self.next_part:
+            content.append(self._sidebar_link(self.next_part.file_name, self.part_label(self.next_part),
+                                              f"{len(self.next_part.images)} pages"))
+        content.append(self._sidebar_link(self.index_file, "📚 All chapters", ''))
+        
+        content.extend([
+            '        </div>',
+            '    </aside>'
+        ])
+        return '\n'.join(content)
+    
+    @staticmethod
+    def _sidebar_link(href: str, title: str, pages: str) -> str:
+        return f'''            <a class="chapter-item" href="{href}">
+                <div class="chapter-title">{title}</div>
+                <div class="chapter-pages">{pages}</div>
+            </a>'''
+    
+    def _generate_javascript(self) -> str:
+        javascript = super()._generate_javascript().replace(
+            'this.currentChapter = 1;', f'this.currentChapter = {self.part.chapter.number};', 1)
+        part = {
+            'file': self.part.file_name,
+            'label': self.part_label(self.part),
+            'prev': self.prev_part.file_name if self.prev_part else None,
+            'next': self.next_part.file_name if self.next_part else None,
+            'nextImages': self.next_part.images[:self.PREFETCH_PAGES] if self.next_part else [],
+            'prefetchAt': self.PREFETCH_PAGES,
+        }
+        return javascript + f"""
+    <script>
+        // Split reader: continue into the neighbouring parts of the book
+        (() => {{
+            const part = {json.dumps(part, ensure_ascii=False)};
+            const progressKey = 'mangaSplitProgress:' + location.pathname.replace(/[^/]*$/, '');
+            const proto = FinalMangaReader.prototype;
+            const nextPage = proto.nextPage;
+            const previousPage = proto.previousPage;
+            const updateProgress = proto.updateProgress;
+            
+            proto.nextPage = function () {{
+                if (this.currentPage >= this.totalPages && part.next) {{
+                    location.href = part.next;
+                }} else {{
+                    nextPage.call(this);
+                }}
+            }};
+            
+            proto.previousPage = function () {{
+                if (this.currentPage <= 1 && part.prev) {{
+                    location.href = part.prev + '#end';
+                }} else {{
+                    previousPage.call(this);
+                }}
+            }};
+            
+            proto.updateProgress = function () {{
+                updateProgress.call(this);
+                try {{
+                    localStorage.setItem(progressKey, JSON.stringify({{
+                        file: part.file, label: part.label, page: this.currentPage
+                    }}));
+                }} catch (e) {{}}
+                
+                // Warm the cache for the next part before the reader gets there
+                if (!this.nextPartPrefetched && part.nextImages.length &&
+                    this.currentPage >= this.totalPages - part.prefetchAt) {{
+                    this.nextPartPrefetched = true;
+                    for (const src of part.nextImages) {{
+                        const link = document.createElement('link');
+                        link.rel = 'prefetch';
+                        link.as = 'image';
+                        link.href = src;
+                        document.head.appendChild(link);
+                    }}
+                }}
+            }};
+            
+            // Coming back from the next part: continue at the last page
+            if (location.hash === '#end') {{
+                document.addEventListener('DOMContentLoaded', () => {{
+                    const last = document.getElementById('page-{len(self.part.images)}');
+                    if (last) last.scrollIntoView({{ block: 'start' }});
+                }});
+            }}
+        }})();
+    </script>"""
+
+
+class SplitReaderGenerator:
+    """
+    Writes a split reader: one small reader page per chapter (long chapters
+    in slices) plus a lightweight book index.
+    
+    All parts use the book's images in place, so nothing is copied. Parts
+    link to their neighbours by their fixed names; only the index gets a
+    content-hashed copy, since it is the entry linked from the bookshelf.
+    """
+    
+    def __init__(self, metadata: MangaMetadata, tracer=None, profiler=None,
+                 writer: Optional[OutputWriter] = None, part_pages: int = 500):
+        self.metadata = metadata
+        self.tracer = tracer
+        self.profiler = profiler
+        self.writer = writer or OutputWriter()
+        self.part_pages = max(1, part_pages)
+        self.parts: List[ReaderPart] = []  # Set by generate_html()
+        self.hints: Dict[str, List[Dict[str, str]]] = {}  # Preload hints per part file
+        self.reading_order: List[Tuple[str, int]] = []  # (src, bytes) of every page over all parts
+        self.written = False  # Whether any file changed on disk
+    
+    def generate_html(self, output_path: Path) -> Path:
+        """
+        Write the part readers and the book index.
+        
+        Args:
+            output_path: Book index file; parts are named after its stem
+                (``index-mb-split.html`` -> ``index-mb-ch0001.html``)
+        
+        Returns:
+            Path to the book index
+        """
+        output_path = Path(output_path)
+        stem = output_path.stem[:-len('-split')] if output_path.stem.endswith('-split') else output_path.stem
+        
+        with _stage(self.tracer, self.profiler, 'render', self.metadata.base_path):
+            self.parts = self._plan_parts(stem)
+            self.reading_order = []
+            contents = []
+            for i, part in enumerate(self.parts):
+                generator = ChapterHTMLGenerator(
+                    self.metadata, part, output_path.name,
+                    prev_part=self.parts[i - 1] if i > 0 else None,
+                    next_part=self.parts[i + 1] if i + 1 < len(self.parts) else None,
+                )
+                contents.append(generator._build_html_content())
+                self.hints[part.file_name] = generator.hints
+                self.reading_order.extend(generator.reading_order)
+            index_content = self._build_index_content()
+        
+        with _stage(self.tracer, self.profiler, 'write', self.metadata.base_path):
+            for part, content in zip(self.parts, contents):
+                if self.writer.write_text(output_path.parent / part.file_name, content, hashed=False):
+                    self.written = True
+            if self.writer.write_text(output_path, index_content):
+                self.written = True
+            prune_split_readers(output_path.parent, stem, {part.file_name for part in self.parts}, self.writer)
+        
+        logger.info(f"Split reader: {len(self.parts)} parts, index {output_path}")
+        return output_path
+    
+    def _plan_parts(self, stem: str) -> List[ReaderPart]:
+        """Chapters in book order, long ones cut into slices of ``part_pages``."""
+        chapter_images = MangaHTMLGenerator(self.metadata)._collect_chapter_images()
+        parts = []
+        page = 1
+        for chapter in sorted(self.metadata.chapters, key=lambda ch: ch.number):
+            images = [path.relative_to(self.metadata.base_path).as_posix()
+                      for path in chapter_images.get(chapter.number, [])]
+            for offset in range(0, len(images), self.part_pages):
+                slice_number = offset // self.part_pages + 1
+                suffix = f"-{slice_number}" if slice_number > 1 else ''
+                parts.append(ReaderPart(
+                    chapter=chapter,
+                    file_name=f"{stem}-ch{chapter.number:04d}{suffix}.html",
+                    images=images[offset:offset + self.part_pages],
+                    start_page=page,
+                    slice=slice_number,
+                ))
+                page += len(parts[-1].images)
+        return parts
+    
+    def _thumbnail(self, part: ReaderPart) -> str:
+        """URL of a part's first page: its transcoded copy or top tile if it has one."""
+        src = part.images[0]
+        url = self.metadata.transcoded.get(src, (src, 0))[0]
+        tiled = self.metadata.tiles.get(url)
+        return tiled[1][0][0] if tiled else url
+    
+    def _build_index_content(self) -> str:
+        """Book index: one entry per part, thumbnails loaded lazily."""
+        title = self.metadata.title
+        entries = []
+        for part in self.parts:
+            src = part.images[0]
+            code = self.metadata.placeholders.get(self.metadata.transcoded.get(src, (src, 0))[0])
+            style = f' style="background: {placeholder_css(code)}"' if code else ''
+            entries.append(f'''        <a class="part" href="{part.file_name}">
+            <img src="{self._thumbnail(part)}" alt=""{style} loading="lazy" decoding="async" />
+            <span class="part-title">{ChapterHTMLGenerator.part_label(part)}</span>
+            <span class="part-pages">p.{part.start_page} · {len(part.images)} pages</span>
+        </a>''')
+        first = self.parts[0].file_name if self.parts else ''
+        return f"""<!DOCTYPE html>
+<html lang="ja">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0, viewport-fit=cover">
+    <meta name="theme-color" content="#0a0a0a">
+    <title>{title}</title>
+    <link rel="prefetch" href="{first}">
+    <style>
+        * {{ box-sizing: border-box; margin: 0; padding: 0; }}
+        body {{
+            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
+            background: #0a0a0a;
+            color: #ffffff;
+            padding: calc(16px + env(safe-area-inset-top, 0px)) 16px 32px;
+        }}
+        h1 {{ font-size: 20px; margin-bottom: 4px; }}
+        .summary {{ color: #b3b3b3; font-size: 14px; margin-bottom: 16px; }}
+        .actions {{ display: flex; gap: 12px; flex-wrap: wrap; margin-bottom: 20px; }}
+        .action {{
+            padding: 10px 18px;
+            border-radius: 8px;
+            background: #2a2a2a;
+            color: #ffffff;
+            text-decoration: none;
+        }}
+        .action.primary {{ background: #00d4ff; color: #000; }}
+        .parts {{
+            display: grid;
+            grid-template-columns: repeat(auto-fill, minmax(140px, 1fr));
+            gap: 12px;
+        }}
+        .part {{
+            display: flex;
+            flex-direction: column;
+            background: #1a1a1a;
+            border-radius: 8px;
+            overflow: hidden;
+            color: inherit;
+            text-decoration: none;
+            content-visibility: auto;
+            contain-intrinsic-size: 140px 260px;
+        }}
+        .part img {{ width: 100%; aspect-ratio: 2 / 3; object-fit: cover; background: #2a2a2a; }}
+        .part-title {{ padding: 8px 8px 2px; font-size: 14px; }}
+        .part-pages {{ padding: 0 8px 8px; font-size: 12px; color: #666666; }}
+    </style>
+</head>
+<body>
+    <h1>{title}</h1>
+    <div class="summary">{len(self.metadata.chapters)} chapters · {self.metadata.total_pages} pages</div>
+    <div class="actions">
+        <a class="action primary" id="continueLink" href="{first}">Start reading</a>
+    </div>
+    <main class="parts">
+{chr(10).join(entries)}
+    </main>
+    <script>
+        // Resume where the split reader left off (written by the part pages)
+        try {{
+            const progress = JSON.parse(localStorage.getItem(
+                'mangaSplitProgress:' + location.pathname.replace(/[^/]*$/, '')) || 'null');
+            if (progress && progress.file) {{
+                const link = document.getElementById('continueLink');
+                link.href = progress.file;
+                link.textContent = `Continue: ${{progress.label}} · p.${{progress.page}}`;
+            }}
+        }} catch (e) {{}}
+    </script>
+</body>
+</html>"""
+
+
+def prune_split_readers(book_path: Path, stem: str, keep: Set[str], writer: OutputWriter):
+    """Delete part readers of an earlier split that are not in ``keep``."""
+    pattern = re.compile(re.escape(stem) + r'-ch\d{4}(-\d+)?\.html$')
+    try:
+        stale = sorted(path for path in Path(book_path).iterdir()
+                       if pattern.match(path.name) and path.name not in keep)
+    except OSError:
+        return
+    for path in stale:
+        writer.remove(path)
+
+
 class MangaReaderGenerator:
     """Main class that orchestrates the manga reader generation process."""
     
-    def __init__(self, base_path: str | Path):
+    def __init__(self, base_path: str | Path, tracer=None, profiler=None, scan_recorder=None,
+                 writer: Optional[OutputWriter] = None, cost_model: Optional[ReaderCostModel] = None,
+                 variants: bool = False, tiles: bool = False, placeholders: bool = False,
+                 scrubber: bool = False, page_check: str = EXCLUDE, symlinks: str = NEVER):
         """
         Initialize the manga reader generator.
         
         Args:
             base_path: Path to the manga directory
+            tracer: Optional span recorder (see ``_span``) timing each stage
+            profiler: Optional ``stage_profiler.StageProfiler`` profiling each stage
+            scan_recorder: Optional ``scan_latency.DirectoryLatencyRecorder``
+                timing the directory listings of the scan stage
+            writer: Shared OutputWriter counting written/unchanged files
+            cost_model: Reader mode cost model (default: ``ReaderCostModel.load()``)
+            variants: Make responsive width variants of the pages (needs Pillow,
+                see ``image_variants.py``)
+            tiles: Cut tall strips into tiles (needs Pillow, see ``image_tiles.py``)
+            placeholders: Give every page a tiny placeholder shown while it
+                loads (needs Pillow, see ``page_placeholders.py``)
+            scrubber: Make the progress slider's preview thumbnails (needs
+                Pillow, see ``scrubber_thumbs.py``)
+            page_check: What to do with truncated or misnamed images
+                (``exclude``, ``flag`` or ``off``, see ``page_check.py``)
+            symlinks: Which symlinked folders to scan (``never``, ``inside``
+                the book or ``always``, see ``safe_walk.py``)
         """
         self.base_path = Path(base_path).resolve()
+        self.tracer = tracer
+        self.profiler = profiler
+        self.scan_recorder = scan_recorder
+        self.writer = writer or OutputWriter()
+        self.cost_model = cost_model
+        self.variants = variants
+        self.tiles = tiles
+        self.placeholders = placeholders
+        self.scrubber = scrubber
+        self.page_check = page_check
+        self.symlinks = symlinks
+        self.metadata: Optional[MangaMetadata] = None  # Set by generate()
+        self.page_bytes: Dict[Path, int] = {}  # File sizes recorded by scan()
+        self.damaged: Dict[Path, str] = {}  # Damaged images found by scan()
+        self.dimensions: Dict[Path, Optional[Tuple[int, int]]] = {}  # Header dimensions read by scan()
+        self.skipped = WalkReport()  # Symlink loops and duplicates left out by scan()
+        self.page_hashes: Optional[Dict[str, Tuple[str, int]]] = None  # Set by source_hashes()
+        self.hashes: Optional[Dict[str, Tuple[str, int]]] = None  # Set by source_hashes()
+        self.transcode_records: Dict[str, Dict] = {}  # Set by find_transcoded()
+        self.decision: Optional[ReaderDecision] = None  # Set by generate()
+        self.written = False  # Whether generate() changed the reader file
         
         if not self.base_path.exists():
             raise FileNotFoundError(f"Directory not found: {self.base_path}")
@@ -1672,12 +2536,16 @@ class MangaReaderGenerator:
         if not self.base_path.is_dir():
             raise NotADirectoryError(f"Path is not a directory: {self.base_path}")
     
-    def generate(self, output_filename: str = "index-mb.html") -> Path:
+    def generate(self, output_filename: str = "index-mb.html", mode: Optional[str] = None) -> Path:
         """
-        Generate the manga reader HTML file.
+        Generate the manga reader HTML file and the book manifest.
         
         Args:
-            output_filename: Name of the output HTML file
+            output_filename: Name of the plain reader; the virtual-scroll
+                reader gets a ``-virtualscroll`` suffix, the split reader's
+                index ``-split``
+            mode: Force a reader mode (see ``reader_policy.MODES``); None or
+                ``auto`` lets the policy decide
             
         Returns:
             Path to the generated HTML file
@@ -1688,24 +2556,100 @@ class MangaReaderGenerator:
         try:
             # Step 1: Scan filesystem
             logger.info("Scanning directory structure...")
-            scanner = FileSystemScanner(self.base_path)
-            folders, image_files = scanner.scan_directory()
+            with _stage(self.tracer, self.profiler, 'scan', self.base_path):
+                folders, image_files = self.scan()
             
             # Step 2: Analyze manga structure
             logger.info("Analyzing manga structure...")
-            analyzer = MangaAnalyzer(self.base_path)
-            metadata = analyzer.analyze_manga(folders, image_files)
+            with _stage(self.tracer, self.profiler, 'analyze', self.base_path):
+                metadata = self.analyze(folders, image_files)
+            self.metadata = metadata
             
             # Log metadata summary
             logger.info(f"Manga: {metadata.title}")
             logger.info(f"Chapters: {len(metadata.chapters)}")
             logger.info(f"Total pages: {metadata.total_pages}")
             
-            # Step 3: Generate HTML
+            # Step 3: Smaller copies made by image_transcode.py, if any
+            with _stage(self.tracer, self.profiler, 'transcoded', self.base_path):
+                metadata.transcoded = self.find_transcoded(metadata)
+                metadata.avif = self.find_avif(metadata)
+            
+            # Step 4: Choose the reader mode (on the bytes the reader will load)
+            with _stage(self.tracer, self.profiler, 'policy', self.base_path):
+                stats = BookStats.collect(image_files, sizes=self._loaded_bytes(metadata),
+                                          dimensions=metadata.dimensions)
+                decision = self.choose_mode(stats, mode)
+            self.decision = decision
+            logger.info(f"Reader mode: {decision.mode} ({decision.reason})")
+            
+            # Step 5: Responsive image variants (optional, needs Pillow)
+            if self.variants:
+                with _stage(self.tracer, self.profiler, 'variants', self.base_path):
+                    metadata.variants = self.build_variants(metadata)
+            
+            # Step 6: Tiles of tall strips (optional, needs Pillow)
+            if self.tiles:
+                with _stage(self.tracer, self.profiler, 'tiles', self.base_path):
+                    metadata.tiles = self.build_tiles(metadata)
+            
+            # Step 7: Placeholders shown while pages load (optional, needs Pillow)
+            if self.placeholders:
+                with _stage(self.tracer, self.profiler, 'placeholders', self.base_path):
+                    metadata.placeholders = self.build_placeholders(metadata)
+            
+            # Step 8: Progress slider preview thumbnails (optional, needs Pillow)
+            if self.scrubber:
+                with _stage(self.tracer, self.profiler, 'scrubber', self.base_path):
+                    metadata.thumbs = self.build_thumbs(metadata)
+            
+            # Step 9: Generate HTML
             logger.info("Generating HTML file...")
-            generator = MangaHTMLGenerator(metadata)
-            output_path = self.base_path / output_filename
-            result_path = generator.generate_html(output_path)
+            previous = (read_manifest(self.base_path) or {}).get('reader') or {}
+            parts = None
+            hints = {}
+            if decision.mode == SPLIT:
+                generator = SplitReaderGenerator(metadata, tracer=self.tracer, profiler=self.profiler,
+                                                 writer=self.writer, part_pages=self.model.split_part_pages)
+                result_path = generator.generate_html(self.base_path / _split_index_name(output_filename))
+                parts = generator.parts
+                hints = generator.hints
+            elif decision.mode == PLAIN:
+                generator = MangaHTMLGenerator(metadata, tracer=self.tracer, profiler=self.profiler,
+                                               writer=self.writer)
+                result_path = generator.generate_html(self.base_path / output_filename)
+            else:
+                from htmlcmb_v3_virtualscroll import VirtualScrollMangaGenerator
+                generator = VirtualScrollMangaGenerator(metadata, use_virtual_scroll=True, writer=self.writer)
+                result_path = generator.generate_html(
+                    self.base_path / _virtual_scroll_name(output_filename),
+                    stage=lambda name: _stage(self.tracer, self.profiler, name, self.base_path))
+            self.written = generator.written
+            if parts is None:
+                hints = {result_path.name: generator.hints}
+                prune_split_readers(self.base_path, Path(output_filename).stem, set(), self.writer)
+            # Readers of an earlier mode would otherwise linger next to the new one
+            for name in (output_filename, _virtual_scroll_name(output_filename), _split_index_name(output_filename)):
+                if name != result_path.name and self.writer.remove(self.base_path / name):
+                    logger.info(f"Removed the {name} reader of an earlier mode")
+            # A reader that moved to another file is news to the server even if its content is not
+            if (previous.get('file'), previous.get('mode')) != (result_path.name, decision.mode):
+                self.written = True
+            
+            # Step 10: Record what was generated
+            with _stage(self.tracer, self.profiler, 'manifest', self.base_path):
+                page_sizes = [size for _, size in generator.reading_order]
+                codes = ([metadata.placeholders.get(url, '') for url, _ in generator.reading_order]
+                         if metadata.placeholders else None)
+                write_manifest(self.base_path, self.manifest(metadata, stats, decision, result_path, parts, hints,
+                                                             page_sizes, codes), self.writer)
+            
+            # Step 11: Page list and service worker for offline reading
+            with _stage(self.tracer, self.profiler, 'offline', self.base_path):
+                readers = [result_path.name] + [part.file_name for part in parts or []]
+                write_offline_files(self.base_path, metadata.chapters, generator.reading_order, self.writer,
+                                    hashes=self.page_hashes, tiles=metadata.tiles, variants=metadata.variants,
+                                    readers=readers, avif=metadata.avif)
             
             # Completion
             duration = datetime.now() - start_time
@@ -1717,10 +2661,549 @@ class MangaReaderGenerator:
         except Exception as e:
             logger.error(f"Error generating manga reader: {e}")
             raise
+    
+    @property
+    def model(self) -> ReaderCostModel:
+        """The cost model, loaded on first use."""
+        if self.cost_model is None:
+            self.cost_model = ReaderCostModel.load()
+        return self.cost_model
+    
+    def find_transcoded(self, metadata: MangaMetadata) -> Dict[str, Tuple[str, int]]:
+        """Transcoded copies of the pages that are still current (see ``image_transcode.py``)."""
+        self.transcode_records = read_transcode_map(self.base_path)
+        if not self.transcode_records:
+            return {}
+        pages = {path.relative_to(self.base_path).as_posix(): size for path, size in metadata.page_bytes.items()}
+        transcoded = transcoded_pages(self.base_path, pages, self.transcode_records)
+        logger.info(f"Using transcoded copies of {len(transcoded)} of {len(pages)} pages")
+        return transcoded
+    
+    def find_avif(self, metadata: MangaMetadata) -> Dict[str, Tuple[str, int]]:
+        """AVIF copies offered next to the pages, keyed by the URL the reader loads otherwise."""
+        if not self.transcode_records:
+            return {}
+        pages = {path.relative_to(self.base_path).as_posix(): size for path, size in metadata.page_bytes.items()}
+        copies = avif_pages(self.base_path, pages, self.transcode_records)
+        return {metadata.transcoded.get(src, (src, 0))[0]: copy for src, copy in copies.items()}
+    
+    def _loaded_bytes(self, metadata: MangaMetadata) -> Dict[Path, int]:
+        """Page sizes by file, with the size of the transcoded copy where the reader loads one."""
+        if not metadata.transcoded:
+            return metadata.page_bytes
+        return {path: metadata.transcoded.get(path.relative_to(self.base_path).as_posix(), (None, size))[1]
+                for path, size in metadata.page_bytes.items()}
+    
+    def build_variants(self, metadata: MangaMetadata) -> Variants:
+        """Responsive variants of every page whose dimensions can be read, keyed by the page's URL."""
+        if not variants_available():
+            logger.info("Pillow is not installed; skipping responsive image variants")
+            return {}
+        sources = {path: path.relative_to(self.base_path).as_posix() for path in metadata.page_bytes}
+        hashes = self.source_hashes(metadata)
+        pages = {}
+        for path, src in sources.items():
+            size = metadata.page_dimensions(path)
+            if size and size[0] > 0 and size[1] > 0:
+                # Variants of a transcoded page are made from (and in the format of) its copy
+                url = metadata.transcoded.get(src, (src, 0))[0]
+                pages[url] = (hashes[src][0], size)
+        return build_variants(self.base_path, pages)
+    
+    def build_tiles(self, metadata: MangaMetadata) -> Tiles:
+        """Tiles of every page whose header dimensions make it a strip, keyed by the page's URL."""
+        strips = {}
+        for path, size in metadata.page_bytes.items():
+            dimensions = metadata.page_dimensions(path)
+            if dimensions and is_strip(*dimensions):
+                strips[path.relative_to(self.base_path).as_posix()] = (size, dimensions)
+        if not strips:
+            return {}
+        if not tiles_available():
+            logger.info(f"Pillow is not installed; not tiling {len(strips)} tall strips")
+            return {}
+        hashes = hash_pages(self.base_path, [(src, size) for src, (size, _) in strips.items()],
+                            known=self.transcode_records)
+        pages = {}
+        for src, (_, dimensions) in strips.items():
+            # Transcoded strips are cut from (and in the format of) their copy
+            url = metadata.transcoded.get(src, (src, 0))[0]
+            pages[url] = (hashes[src][0], dimensions)
+        return build_tiles(self.base_path, pages)
+    
+    def build_placeholders(self, metadata: MangaMetadata) -> Dict[str, str]:
+        """Placeholder code of every page, keyed by the page's URL."""
+        if not placeholders_available():
+            logger.info("Pillow is not installed; skipping page placeholders")
+            return {}
+        hashes = self.source_hashes(metadata)
+        pages = {}
+        for src, (digest, _) in hashes.items():
+            # A transcoded copy looks the same, so the original is decoded
+            url = metadata.transcoded.get(src, (src, 0))[0]
+            pages[url] = (digest, src)
+        return build_placeholders(self.base_path, pages)
+    
+    def build_thumbs(self, metadata: MangaMetadata) -> Thumbs:
+        """Slider preview thumbnail of every page in reading order, keyed by the page's URL."""
+        if not thumbs_available():
+            logger.info("Pillow is not installed; skipping scrubber thumbnails")
+            return {}
+        hashes = self.source_hashes(metadata)
+        chapter_images = MangaHTMLGenerator(metadata)._collect_chapter_images()
+        pages = []
+        for chapter in sorted(metadata.chapters, key=lambda ch: ch.number):
+            for path in chapter_images.get(chapter.number, []):
+                src = path.relative_to(self.base_path).as_posix()
+                url = metadata.transcoded.get(src, (src, 0))[0]
+                pages.append((url, hashes[src][0], src, metadata.page_dimensions(path)))
+        return build_thumbs(self.base_path, pages)
+    
+    def source_hashes(self, metadata: MangaMetadata) -> Dict[str, Tuple[str, int]]:
+        """Content hash and mtime of every page by src, hashed once per run."""
+        if self.hashes is None:
+            sources = [(path.relative_to(self.base_path).as_posix(), size)
+                       for path, size in metadata.page_bytes.items()]
+            self.hashes = hash_pages(self.base_path, sources, known=self.transcode_records)
+            if not metadata.transcoded:
+                # Shared with the offline asset list, which lists the same URLs
+                self.page_hashes = self.hashes
+        return self.hashes
+    
+    def choose_mode(self, stats: BookStats, mode: Optional[str] = None) -> ReaderDecision:
+        """Apply the reader mode policy, unless a mode is forced."""
+        model = self.model
+        if mode and mode != 'auto':
+            if mode not in MODES:
+                raise ValueError(f"Unknown reader mode '{mode}', expected one of {', '.join(MODES)}")
+            return ReaderDecision(mode, "forced", estimate(stats, model))
+        return choose_reader_mode(stats, model)
+    
+    def manifest(self, metadata: MangaMetadata, stats: BookStats, decision: ReaderDecision,
+                 reader_path: Path, parts: Optional[List[ReaderPart]] = None,
+                 hints: Optional[Dict[str, List[Dict[str, str]]]] = None,
+                 page_sizes: Optional[List[int]] = None, placeholders: Optional[List[str]] = None) -> Dict:
+        """
+        Book manifest content (see book_manifest.py).
+        
+        ``page_sizes`` and ``placeholders`` (codes, see ``page_placeholders.py``)
+        are in reading order.
+        """
+        manifest = {
+            'title': metadata.title,
+            'pages': stats.pages,
+            'bytes': stats.total_bytes,
+            'avg_width': stats.avg_width,
+            'avg_height': stats.avg_height,
+            'chapters': [
+                {
+                    'number': chapter.number,
+                    'name': chapter.name,
+                    'path': chapter.folder_path.relative_to(self.base_path).as_posix(),
+                    'start_page': chapter.start_page,
+                    'pages': chapter.page_count,
+                }
+                for chapter in metadata.chapters
+            ],
+            'reader': {**decision.to_dict(), 'file': reader_path.name},
+            'hints': {name: file_hints for name, file_hints in (hints or {}).items() if file_hints},
+            'page_kib': encode_page_kib(page_sizes or []),
+        }
+        if placeholders:
+            manifest['placeholders'] = encode_placeholders(placeholders)
+        if metadata.damaged:
+            manifest['damaged_pages'] = {'action': self.page_check, 'pages': metadata.damaged}
+        if self.skipped:
+            manifest['scan_skipped'] = self.skipped.to_dict(self.base_path)
+        if parts is not None:
+            manifest['parts'] = [
+                {
+                    'file': part.file_name,
+                    'chapter': part.chapter.number,
+                    'start_page': part.start_page,
+                    'pages': len(part.images),
+                }
+                for part in parts
+            ]
+        return manifest
+    
+    # Individual pipeline stages (also used by pipeline_benchmark.py)
+    
+    def scan(self) -> Tuple[List[Path], List[Path]]:
+        """Stage 1: scan the filesystem for chapter folders and image files."""
+        scanner = FileSystemScanner(self.base_path, recorder=self.scan_recorder, check=self.page_check,
+                                    symlinks=self.symlinks)
+        result = scanner.scan_directory()
+        self.page_bytes = scanner.sizes
+        self.damaged = scanner.damaged
+        self.dimensions = scanner.dimensions
+        self.skipped = scanner.skipped
+        return result
+    
+    def analyze(self, folders: List[Path], image_files: List[Path]) -> MangaMetadata:
+        """Stage 2: build chapter/page metadata from the scan results."""
+        analyzer = MangaAnalyzer(self.base_path)
+        metadata = analyzer.analyze_manga(folders, image_files, self.page_bytes)
+        metadata.damaged = {path.relative_to(self.base_path).as_posix(): problem
+                            for path, problem in self.damaged.items()}
+        metadata.dimensions = self.dimensions
+        return metadata
+    
+    def render(self, metadata: MangaMetadata) -> str:
+        """Stage 3: render the reader HTML without writing it to disk."""
+        return MangaHTMLGenerator(metadata)._build_html_content()
 
 
-def main():
-    """Main entry point for the script."""
+def _virtual_scroll_name(output_filename: str) -> str:
+    """``index-mb.html`` -> ``index-mb-virtualscroll.html``."""
+    path = Path(output_filename)
+    return f"{path.stem}-virtualscroll{path.suffix}"
+
+
+def _split_index_name(output_filename: str) -> str:
+    """``index-mb.html`` -> ``index-mb-split.html``."""
+    path = Path(output_filename)
+    return f"{path.stem}-split{path.suffix}"
+
+
+def generate_book(path: str, output_filename: str = "index-mb.html",
+                  record_scan: bool = False, hashed_names: bool = False,
+                  mode: Optional[str] = None, variants: bool = False, tiles: bool = False,
+                  placeholders: bool = False, scrubber: bool = False, page_check: str = EXCLUDE,
+                  symlinks: str = NEVER) -> BookResult:
+    """
+    Generate one reader and report the outcome instead of raising.
+    
+    Module-level so that it can run in a process pool worker.
+    
+    Args:
+        path: Manga directory
+        output_filename: Name of the output HTML file
+        record_scan: Time the directory listings of the scan stage; they are
+            returned in ``BookResult.listings``
+        hashed_names: Also write a content-hashed copy of the reader (see
+            ``output_writer.OutputWriter``)
+        mode: Force a reader mode instead of the policy's choice
+        variants: Make responsive image variants (needs Pillow)
+        tiles: Cut tall strips into tiles (needs Pillow)
+        placeholders: Give every page a placeholder shown while it loads (needs Pillow)
+        scrubber: Make the slider's preview thumbnails (needs Pillow)
+        page_check: What to do with truncated or misnamed images (exclude, flag, off)
+        symlinks: Which symlinked folders to scan (never, inside, always)
+    """
+    start = time.perf_counter()
+    recorder = _make_scan_recorder() if record_scan else None
+    writer = OutputWriter(hashed_names=hashed_names)
+    try:
+        generator = MangaReaderGenerator(path, scan_recorder=recorder, writer=writer, variants=variants,
+                                         tiles=tiles, placeholders=placeholders, scrubber=scrubber,
+                                         page_check=page_check, symlinks=symlinks)
+        output_path = generator.generate(output_filename, mode)
+        metadata = generator.metadata
+        result = BookResult(
+            path=str(path),
+            status='ok',
+            output=str(output_path),
+            chapters=len(metadata.chapters),
+            pages=metadata.total_pages,
+            bytes=output_path.stat().st_size,
+            written=generator.written,
+            mode=generator.decision.mode,
+            files_written=writer.stats.written,
+            files_unchanged=writer.stats.unchanged,
+            bytes_written=writer.stats.bytes_written
+        )
+    except Exception as e:
+        result = BookResult(path=str(path), status='error', error=f"{type(e).__name__}: {e}")
+    result.seconds = time.perf_counter() - start
+    result.worker = os.getpid()
+    if recorder is not None:
+        result.listings = recorder.listings
+    return result
+
+
+def run_batch(books: List[Path], jobs: int = 1, output_filename: str = "index-mb.html",
+              record_scan: bool = False, claim: Optional[Callable[[str], bool]] = None,
+              on_result: Optional[Callable[[BookResult], None]] = None,
+              hashed_names: bool = False, mode: Optional[str] = None,
+              variants: bool = False, tiles: bool = False, placeholders: bool = False,
+              scrubber: bool = False, page_check: str = EXCLUDE, symlinks: str = NEVER) -> List[BookResult]:
+    """
+    Generate readers for many books, in parallel worker processes if ``jobs > 1``.
+    
+    Args:
+        books: Manga directories
+        jobs: Worker processes (1 = in this process)
+        output_filename: Name of the output HTML file
+        record_scan: Return the timed directory listings with each result
+        claim: Called with the book path right before the book is started;
+            returning False skips it (see ``run_coordinator.RunCoordinator``)
+        on_result: Called with each result as soon as it is available
+        hashed_names: Also write content-hashed copies of the readers
+        mode: Force a reader mode for every book (None = policy decides)
+        variants: Make responsive image variants (needs Pillow)
+        tiles: Cut tall strips into tiles (needs Pillow)
+        placeholders: Give every page a placeholder shown while it loads (needs Pillow)
+        scrubber: Make the slider's preview thumbnails (needs Pillow)
+        page_check: What to do with truncated or misnamed images (exclude, flag, off)
+        symlinks: Which symlinked folders to scan (never, inside, always)
+    
+    Returns:
+        One BookResult per book, in input order
+    """
+    paths = [str(book) for book in books]
+    results: Dict[str, BookResult] = {}
+    
+    def finish(result: BookResult):
+        results[result.path] = result
+        if on_result:
+            on_result(result)
+        if len(results) % 50 == 0:
+            logger.info(f"Generated readers for {len(results)}/{len(paths)} manga...")
+    
+    def claimed(path: str) -> bool:
+        if claim is None or claim(path):
+            return True
+        finish(BookResult(path=path, status='skipped'))
+        return False
+    
+    if jobs <= 1 or len(paths) <= 1:
+        for path in paths:
+            if claimed(path):
+                finish(generate_book(path, output_filename, record_scan, hashed_names, mode, variants, tiles,
+                                     placeholders, scrubber, page_check, symlinks))
+        return [results[path] for path in paths]
+    
+    # Books are claimed only when a worker is about to be free, so that
+    # concurrent runs keep splitting the remaining books between them
+    pending = iter(paths)
+    max_in_flight = jobs * 2
+    with ProcessPoolExecutor(max_workers=min(jobs, len(paths))) as executor:
+        futures = {}
+        while True:
+            for path in pending:
+                if claimed(path):
+                    futures[executor.submit(generate_book, path, output_filename, record_scan,
+                                            hashed_names, mode, variants, tiles, placeholders, scrubber,
+                                            page_check, symlinks)] = path
+                    if len(futures) >= max_in_flight:
+                        break
+            if not futures:
+                break
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = futures.pop(future)
+                try:
+                    finish(future.result())
+                except Exception as e:  # Worker process died
+                    finish(BookResult(path=path, status='error', error=f"{type(e).__name__}: {e}"))
+    return [results[path] for path in paths]
+
+
+def expand_books(books: List[str], libraries: List[str]) -> List[Path]:
+    """
+    Resolve book folders plus every subfolder of the given library roots.
+    
+    Hidden folders are skipped and duplicates are dropped (first one wins).
+    """
+    resolved: List[Path] = []
+    seen: Set[Path] = set()
+    
+    def add(path: Path):
+        path = path.resolve()
+        if path not in seen:
+            seen.add(path)
+            resolved.append(path)
+    
+    for library in libraries:
+        root = Path(library)
+        if not root.is_dir():
+            raise NotADirectoryError(f"Library is not a directory: {library}")
+        for child in sorted(root.iterdir()):
+            if child.is_dir() and not child.name.startswith('.'):
+                add(child)
+    
+    for book in books:
+        add(Path(book.strip('\'"')))
+    
+    return resolved
+
+
+def batch_main(argv: List[str]) -> int:
+    """Non-interactive entry point; returns the process exit status."""
+    parser = argparse.ArgumentParser(
+        prog='htmlcmb_v3.py',
+        description="Generate manga reader HTML files for many books at once. "
+                    "Run without arguments for the interactive prompt."
+    )
+    parser.add_argument('books', nargs='*', help="Manga book folders")
+    parser.add_argument('-l', '--library', action='append', default=[], metavar='ROOT',
+                        help="Library root; every subfolder is a book (repeatable)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (default: number of CPUs)")
+    parser.add_argument('-o', '--output-name', default='index-mb.html',
+                        help="Reader file name inside each book (default: index-mb.html)")
+    parser.add_argument('--json', metavar='FILE',
+                        help="Write machine-readable results to FILE ('-' for stdout)")
+    parser.add_argument('-q', '--quiet', action='store_true', help="Only log warnings and errors")
+    parser.add_argument('--shard', metavar='I/N',
+                        help="Only process books of shard I of N (0-based, by folder name hash)")
+    parser.add_argument('--notify-server', metavar='ADDRESS',
+                        help="Tell the running server which books changed: port, http://127.0.0.1:PORT "
+                             "or unix:SOCKET (like MANGA_NOTIFY_SERVER)")
+    parser.add_argument('--hashed-names', action='store_true',
+                        help="Also write content-hashed copies (index-mb.<hash>.html) listed in "
+                             "asset-map.json, for immutable HTTP caching (like MANGA_HASHED_NAMES=1)")
+    parser.add_argument('--mode', choices=('auto',) + MODES, default='auto',
+                        help="Reader mode; 'auto' picks one per book from page count, image bytes "
+                             "and dimensions (default: auto)")
+    parser.add_argument('--variants', action='store_true',
+                        help="Make 720/1080/1440px variants of the pages and emit srcset, so phones load "
+                             "smaller images; needs Pillow (like MANGA_IMAGE_VARIANTS=1)")
+    parser.add_argument('--tiles', action='store_true',
+                        help="Cut tall strips (webtoon pages) into tiles that phones decode quickly; "
+                             "needs Pillow (like MANGA_TILE_STRIPS=1)")
+    parser.add_argument('--placeholders', action='store_true',
+                        help="Show each page's average colors while it loads, stored in the readers and "
+                             "the manifest; needs Pillow (like MANGA_PAGE_PLACEHOLDERS=1)")
+    parser.add_argument('--scrubber', action='store_true',
+                        help="Pack page thumbnails into sprite strips that the progress slider previews "
+                             "while dragging; needs Pillow (like MANGA_SCRUBBER_THUMBS=1)")
+    parser.add_argument('--damaged-pages', choices=CHECK_MODES,
+                        default=env_check_mode(),
+                        help="Truncated or misnamed images: leave them out of the readers, flag them, or "
+                             "skip the check (default: exclude, or MANGA_DAMAGED_PAGES)")
+    parser.add_argument('--follow-symlinks', choices=SYMLINK_MODES,
+                        default=env_symlink_mode(),
+                        help="Symlinked folders to scan: none, those pointing inside the book, or all; "
+                             "loops and duplicate files are skipped either way "
+                             "(default: never, or MANGA_FOLLOW_SYMLINKS)")
+    args = parser.parse_args(argv)
+    
+    if not args.books and not args.library:
+        parser.error("give at least one book folder or --library root")
+    if args.quiet:
+        logging.getLogger().setLevel(logging.WARNING)
+    
+    try:
+        books = expand_books(args.books, args.library)
+    except NotADirectoryError as e:
+        parser.error(str(e))
+    
+    if args.shard:
+        from shard_catalog import ShardSpec
+        try:
+            shard = ShardSpec.parse(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+        books = [book for book in books if shard.owns(book.name)]
+        logger.info(f"Shard {shard}: {len(books)} books")
+    
+    start = time.perf_counter()
+    logger.info(f"Generating readers for {len(books)} books with {args.jobs} jobs...")
+    recorder = _make_scan_recorder()
+    results = run_batch(books, args.jobs, args.output_name, record_scan=recorder is not None,
+                        hashed_names=args.hashed_names or _env_flag('MANGA_HASHED_NAMES'), mode=args.mode,
+                        variants=args.variants or _env_flag('MANGA_IMAGE_VARIANTS'),
+                        tiles=args.tiles or _env_flag('MANGA_TILE_STRIPS'),
+                        placeholders=args.placeholders or _env_flag('MANGA_PAGE_PLACEHOLDERS'),
+                        scrubber=args.scrubber or _env_flag('MANGA_SCRUBBER_THUMBS'),
+                        page_check=args.damaged_pages, symlinks=args.follow_symlinks)
+    elapsed = time.perf_counter() - start
+    
+    failed = [r for r in results if r.status == 'error']
+    for result in failed:
+        logger.error(f"Failed: {result.path}: {result.error}")
+    
+    _notify_server([(Path(r.path), Path(r.output)) for r in results if r.written],
+                   args.notify_server or os.environ.get('MANGA_NOTIFY_SERVER'))
+    
+    written = sum(1 for r in results if r.written)
+    summary = {
+        'books': len(results),
+        'succeeded': len(results) - len(failed),
+        'failed': len(failed),
+        'written': written,
+        'unchanged': len(results) - len(failed) - written,
+        'jobs': args.jobs,
+        'seconds': elapsed,
+        'results': [r.to_dict() for r in results],
+    }
+    
+    if args.json == '-':
+        json.dump(summary, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        if recorder is not None:
+            for result in results:
+                recorder.extend(result.listings)
+            _report_scan_latency(recorder)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"\nGenerated {summary['succeeded']}/{len(results)} readers in {elapsed:.2f}s "
+              f"({written} written, {summary['unchanged']} unchanged, {len(failed)} failed)")
+    
+    return 1 if failed else 0
+
+
+def _env_flag(name: str) -> bool:
+    """Whether a boolean environment option is set (1/true/yes)."""
+    return os.environ.get(name, '').strip().lower() in ('1', 'true', 'yes')
+
+
+def _make_scan_recorder():
+    """Directory latency recorder for the CLI, if scan_latency.py is available."""
+    try:
+        from scan_latency import DirectoryLatencyRecorder
+    except ImportError:
+        return None
+    return DirectoryLatencyRecorder()
+
+
+def _report_scan_latency(recorder, top_n: int = 10):
+    """Print the listing latency report and honour MANGA_SCAN_LATENCY_FILE."""
+    if recorder is None:
+        return
+    recorder.print_report(top_n)
+    dump_path = os.environ.get('MANGA_SCAN_LATENCY_FILE')
+    if dump_path:
+        recorder.dump_jsonl(Path(dump_path))
+
+
+def _notify_server(changed: List[Tuple[Path, Path]], target: Optional[str]):
+    """
+    Tell the running server which books got new readers (see server_notify.py).
+    
+    Args:
+        changed: (book folder, written reader) pairs
+        target: Server address; nothing is sent when empty
+    """
+    if not target or not changed:
+        return
+    from server_notify import ServerNotifier
+    
+    # The server serves one library, so books are grouped by their library root
+    notifiers: Dict[Path, ServerNotifier] = {}
+    for book, output_path in changed:
+        library = book.resolve().parent
+        if library not in notifiers:
+            try:
+                notifiers[library] = ServerNotifier(target, library)
+            except ValueError as e:
+                logger.warning(f"Server notifications disabled: {e}")
+                return
+        notifiers[library].book_changed(book, output_path)
+    for notifier in notifiers.values():
+        notifier.flush()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Main entry point: batch mode with arguments, interactive prompt without."""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        return batch_main(argv)
+    
     print("🖼️  Enhanced Manga Reader HTML Generator V3")
     print("=" * 50)
     
@@ -1737,8 +3220,19 @@ def main():
             path_input = path_input.strip('\'"')
             
             # Generate manga reader
-            generator = MangaReaderGenerator(path_input)
+            recorder = _make_scan_recorder()
+            generator = MangaReaderGenerator(path_input, scan_recorder=recorder,
+                                             writer=OutputWriter(hashed_names=_env_flag('MANGA_HASHED_NAMES')),
+                                             variants=_env_flag('MANGA_IMAGE_VARIANTS'),
+                                             tiles=_env_flag('MANGA_TILE_STRIPS'),
+                                             placeholders=_env_flag('MANGA_PAGE_PLACEHOLDERS'),
+                                             scrubber=_env_flag('MANGA_SCRUBBER_THUMBS'),
+                                             page_check=env_check_mode(),
+                                             symlinks=env_symlink_mode())
             output_path = generator.generate()
+            _report_scan_latency(recorder)
+            if generator.written:
+                _notify_server([(Path(path_input), output_path)], os.environ.get('MANGA_NOTIFY_SERVER'))
             
             print(f"\n✅ Success! Generated: {output_path.name}")
             
@@ -1752,7 +3246,9 @@ def main():
             print(f"\n❌ Unexpected error occurred. Check the log for details.")
             
         print("\n" + "=" * 50)
+    
+    return 0
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
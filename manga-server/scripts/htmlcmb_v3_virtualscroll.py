@@ -2,7 +2,8 @@
 """
 Enhanced Manga Reader HTML Generator V3 - Virtual Scroll Edition
 
-Optimized for large manga collections (>5000 pages) using virtual scrolling.
+Optimized for large manga collections using virtual scrolling; whether a
+book needs it is decided by reader_policy.py.
 Only renders visible pages to prevent browser crashes and improve performance.
 
 Author: mastersamasama  
@@ -15,12 +16,22 @@ import logging
 import json
 import re
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional, Set
-from dataclasses import dataclass
+from typing import Callable, ContextManager, List, Dict, Tuple, Optional, Set
+from contextlib import nullcontext
+from dataclasses import dataclass, field
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import mimetypes
 from datetime import datetime
 
+from book_manifest import PRELOAD_PAGES, preload_hints, preload_links
+from image_variants import srcset_attributes
+from offline_cache import offline_script
+from output_writer import OutputWriter
+from page_placeholders import placeholder_css
+from prefetch_window import page_kib_json, prefetch_window_script
+from reader_policy import PLAIN, BookStats, ReaderCostModel, choose_reader_mode
+from safe_walk import SafeWalker
+
 
 # Configure logging
 logging.basicConfig(
@@ -51,6 +62,12 @@ class MangaMetadata:
     chapters: List[Chapter]
     total_pages: int
     base_path: Path
+    page_bytes: Dict[Path, int] = field(default_factory=dict)  # File size of every page, from the scan
+    variants: Dict = field(default_factory=dict)  # Responsive variants per page URL (image_variants.py)
+    transcoded: Dict = field(default_factory=dict)  # src -> (URL, bytes) of smaller copies (image_transcode.py)
+    tiles: Dict = field(default_factory=dict)  # Tiles of tall strips per page URL (image_tiles.py)
+    placeholders: Dict = field(default_factory=dict)  # Placeholder code per page URL (page_placeholders.py)
+    avif: Dict = field(default_factory=dict)  # Page URL -> (URL, bytes) of AVIF copies (image_transcode.py)
 
 
 @dataclass
@@ -102,31 +119,50 @@ class ImageValidator:
 class VirtualScrollMangaGenerator:
     """Generates virtual scroll manga readers for large collections."""
     
-    def __init__(self, metadata: MangaMetadata, use_virtual_scroll: bool = None):
+    def __init__(self, metadata: MangaMetadata, use_virtual_scroll: bool = None,
+                 writer: Optional[OutputWriter] = None):
         self.metadata = metadata
         self.validator = ImageValidator()
+        self.writer = writer or OutputWriter()
+        self.written = False  # Whether generate_html() changed the file
+        self.hints: List[Dict[str, str]] = []  # Preload hints of the first pages
+        self.reading_order: List[Tuple[str, int]] = []  # (src, bytes) of every page, set while rendering
         
-        # Auto-enable virtual scroll for large collections
+        # Auto-enable virtual scroll when the plain reader would be over budget
         if use_virtual_scroll is None:
-            use_virtual_scroll = metadata.total_pages > 1000
+            image_files = [metadata.base_path / image.src for image in self._collect_image_metadata()]
+            decision = choose_reader_mode(BookStats.collect(image_files), ReaderCostModel.load())
+            use_virtual_scroll = decision.mode != PLAIN
         
         self.use_virtual_scroll = use_virtual_scroll
         logger.info(f"Virtual scroll {'enabled' if use_virtual_scroll else 'disabled'} "
                    f"for {metadata.total_pages} pages")
     
-    def generate_html(self, output_path: Optional[Path] = None) -> Path:
-        """Generate the manga reader HTML file."""
+    def generate_html(self, output_path: Optional[Path] = None,
+                      stage: Optional[Callable[[str], ContextManager]] = None) -> Path:
+        """
+        Generate the manga reader HTML file.
+        
+        Args:
+            output_path: Optional custom output path
+            stage: Opens a named pipeline stage (``render``, ``write``) around
+                each step, e.g. the main generator's tracer and profiler
+        """
         if output_path is None:
             suffix = "-mb-virtualscroll" if self.use_virtual_scroll else "-mb"
             output_path = self.metadata.base_path / f"index{suffix}.html"
+        stage = stage or (lambda name: nullcontext())
         
         try:
-            html_content = self._build_html_content()
+            with stage('render'):
+                html_content = self._build_html_content()
             
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
-                
-            logger.info(f"Successfully generated HTML: {output_path}")
+            with stage('write'):
+                self.written = self.writer.write_text(output_path, html_content)
+            if self.written:
+                logger.info(f"Successfully generated HTML: {output_path}")
+            else:
+                logger.info(f"HTML unchanged, kept existing file: {output_path}")
             return output_path
             
         except Exception as e:
@@ -135,13 +171,17 @@ class VirtualScrollMangaGenerator:
     
     def _build_html_content(self) -> str:
         """Build the complete HTML content."""
+        images = self._collect_image_metadata()
+        self.reading_order = [(image.src, self._page_bytes(image.src)) for image in images]
+        first = [self._first_image(image.src) for image in images[:PRELOAD_PAGES]]
+        self.hints = preload_hints(first, srcsets={src: self._srcset(src) for src in first})
         return f"""<!DOCTYPE html>
 <html lang="zh-CN">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0, user-scalable=no">
     <title>{self.metadata.title}</title>
-    {self._generate_css()}
+    {self._generate_css()}{preload_links(self.hints)}
 </head>
 <body data-theme="dark">
 {self._generate_navigation()}
@@ -222,6 +262,24 @@ class VirtualScrollMangaGenerator:
             opacity: 0.5;
         }
 
+        /* Pages with an AVIF copy: the img lays out as if unwrapped */
+        picture {
+            display: contents;
+        }
+
+        /* Strips cut into tiles (image_tiles.py), stacked without gaps */
+        .page-tile {
+            display: block;
+            width: 100%;
+            height: auto;
+        }
+
+        /* Kept pages that failed the integrity check (page_check.py) */
+        .page-image[data-damaged] {
+            outline: 2px dashed #e5534b;
+            outline-offset: -2px;
+        }
+
         .chapter-marker {
             position: absolute;
             left: 50%;
@@ -300,6 +358,10 @@ class VirtualScrollMangaGenerator:
             font-size: 16px;
         }
 
+        .nav-btn[hidden] {
+            display: none;
+        }
+
         .nav-btn:hover {
             background: var(--bg-elevated);
             color: var(--accent-primary);
@@ -332,6 +394,7 @@ class VirtualScrollMangaGenerator:
         <div class="nav-controls">
             <button class="nav-btn" id="themeBtn" title="Toggle theme">🌓</button>
             <button class="nav-btn" id="chaptersBtn" title="Chapters">📚</button>
+            <button class="nav-btn" id="downloadChapterBtn" title="Download chapter" hidden>⬇️</button>
             <button class="nav-btn" id="settingsBtn" title="Settings">⚙️</button>
         </div>
     </nav>"""
@@ -368,9 +431,28 @@ class VirtualScrollMangaGenerator:
         image_metadata = self._collect_image_metadata()
         
         for img_data in image_metadata:
-            content.append(f'        <img src="{img_data.src}" id="page-{img_data.page}" '
-                          f'class="page-image" alt="{img_data.name}" '
-                          f'data-chapter="{img_data.chapter}" loading="lazy" />')
+            tiled = self._tiles(img_data.src)
+            placeholder = self._placeholder(img_data.src)
+            style = f' style="{placeholder}"' if placeholder else ''
+            if tiled:
+                width, tiles = tiled
+                content.append(f'        <div id="page-{img_data.page}" class="page-image page-tiles" role="img" '
+                               f'aria-label="{img_data.name}" data-chapter="{img_data.chapter}"{style}>')
+                content.extend(f'            <img src="{tile_url}" class="page-tile" alt="" width="{width}" '
+                               f'height="{tile_height}" loading="lazy" />' for tile_url, tile_height, _ in tiles)
+                content.append('        </div>')
+                continue
+            srcset = self._srcset(img_data.src)
+            responsive = f' srcset="{srcset[0]}" sizes="{srcset[1]}"' if srcset else ''
+            problem = getattr(self.metadata, 'damaged', {}).get(img_data.src)
+            damaged = f' data-damaged title="Damaged image: {problem}"' if problem else ''
+            image = (f'<img src="{img_data.src}"{responsive} id="page-{img_data.page}" '
+                     f'class="page-image" alt="{img_data.name}" '
+                     f'data-chapter="{img_data.chapter}"{style}{damaged} loading="lazy" />')
+            avif = None if srcset else self._avif(img_data.src)
+            if avif:
+                image = f'<picture><source type="image/avif" srcset="{avif}" />{image}</picture>'
+            content.append(f'        {image}')
         
         content.append('    </main>')
         return '\n'.join(content)
@@ -378,18 +460,25 @@ class VirtualScrollMangaGenerator:
     def _collect_image_metadata(self) -> List[ImageMetadata]:
         """Collect metadata for all images."""
         metadata = []
+        transcoded = getattr(self.metadata, 'transcoded', {})
         
         # Get all image files
-        all_images = []
-        for root, _, files in os.walk(self.metadata.base_path):
-            for file in files:
-                file_path = Path(root) / file
-                if self.validator.is_valid_image(file_path):
-                    all_images.append(file_path)
+        if getattr(self.metadata, 'page_bytes', None) or getattr(self.metadata, 'damaged', None):
+            # The scan's images: damaged ones it left out are not pages
+            all_images = list(self.metadata.page_bytes)
+        else:
+            all_images = []
+            for root, dirs, files in SafeWalker().walk(self.metadata.base_path):
+                dirs[:] = [name for name in dirs if not name.startswith('.')]  # Generated files (.manga-gen)
+                for file in files:
+                    file_path = Path(root) / file
+                    if self.validator.is_valid_image(file_path):
+                        all_images.append(file_path)
         
         # Natural sort function
         def natural_sort_key(path):
-            path_str = str(path.relative_to(self.metadata.base_path))
+            # POSIX separators so that the order is the same on every OS
+            path_str = path.relative_to(self.metadata.base_path).as_posix()
             parts = re.split(r'(\d+)', path_str.lower())
             result = []
             for part in parts:
@@ -397,7 +486,8 @@ class VirtualScrollMangaGenerator:
                     result.append(int(part))
                 else:
                     result.append(part)
-            return result
+            # Exact name breaks ties between names differing only in case
+            return result, path_str
         
         # Group by chapter and sort
         chapter_images = {}
@@ -420,6 +510,8 @@ class VirtualScrollMangaGenerator:
             for image_path in chapter_images[chapter_num]:
                 relative_path = image_path.relative_to(self.metadata.base_path)
                 src_path = str(relative_path).replace('\\', '/')
+                # Pages transcoded by image_transcode.py load their smaller copy
+                src_path = transcoded.get(src_path, (src_path, 0))[0]
                 
                 metadata.append(ImageMetadata(
                     page=page_counter,
@@ -431,6 +523,41 @@ class VirtualScrollMangaGenerator:
         
         return metadata
     
+    def _srcset(self, src: str) -> Optional[Tuple[str, str]]:
+        """``srcset`` and ``sizes`` of a page, if it has responsive variants."""
+        entry = getattr(self.metadata, 'variants', {}).get(src)
+        return srcset_attributes(src, entry) if entry else None
+    
+    def _avif(self, src: str) -> Optional[str]:
+        """URL of a page's AVIF copy, offered next to ``src`` for the browsers that decode it."""
+        copy = getattr(self.metadata, 'avif', {}).get(src)
+        return copy[0] if copy else None
+    
+    def _tiles(self, src: str) -> Optional[Tuple[int, List]]:
+        """Width and tiles of a page, if it is a tiled strip (see ``image_tiles.py``)."""
+        return getattr(self.metadata, 'tiles', {}).get(src)
+    
+    def _placeholder(self, src: str) -> str:
+        """Inline background shown until a page loads, if it has a placeholder."""
+        code = getattr(self.metadata, 'placeholders', {}).get(src)
+        return f"background: {placeholder_css(code)}" if code else ''
+    
+    def _first_image(self, src: str) -> str:
+        """What the reader loads first for a page: its top tile if it is tiled."""
+        tiled = self._tiles(src)
+        return tiled[1][0][0] if tiled else src
+    
+    def _page_bytes(self, src: str) -> int:
+        """File size of a page as recorded by the scan (stat otherwise, 0 if unreadable)."""
+        path = self.metadata.base_path / src
+        recorded = getattr(self.metadata, 'page_bytes', {})
+        if path in recorded:
+            return recorded[path]
+        try:
+            return os.stat(path).st_size
+        except OSError:
+            return 0
+    
     def _determine_image_chapter(self, image_path: Path) -> int:
         """Determine which chapter an image belongs to."""
         # Simple implementation - can be enhanced
@@ -449,19 +576,36 @@ class VirtualScrollMangaGenerator:
     
     def _generate_javascript(self) -> str:
         """Generate optimized JavaScript with virtual scroll support."""
-        image_metadata_json = json.dumps([
-            {
+        image_data = []
+        for img in self._collect_image_metadata():
+            entry = {
                 'page': img.page,
                 'src': img.src,
                 'chapter': img.chapter,
                 'name': img.name
             }
-            for img in self._collect_image_metadata()
-        ])
+            tiled = self._tiles(img.src)
+            srcset = self._srcset(img.src)
+            if tiled:
+                entry['width'] = tiled[0]
+                entry['tiles'] = [[tile_url, tile_height] for tile_url, tile_height, _ in tiled[1]]
+            elif srcset:
+                entry['srcset'], entry['sizes'] = srcset
+            elif self._avif(img.src):
+                entry['avif'] = self._avif(img.src)
+            code = getattr(self.metadata, 'placeholders', {}).get(img.src)
+            if code:
+                entry['placeholder'] = code
+            problem = getattr(self.metadata, 'damaged', {}).get(img.src)
+            if problem:
+                entry['damaged'] = problem
+            image_data.append(entry)
+        image_metadata_json = json.dumps(image_data)
         
         return f"""<script>
 window.mangaImageData = {image_metadata_json};
-
+window.mangaPageKiB = {page_kib_json([size for _, size in self.reading_order])};
+{prefetch_window_script()}{offline_script()}
 /**
  * Optimized manga reader with virtual scroll support.
  */
@@ -505,6 +649,37 @@ class OptimizedMangaReader {{
             if (e.key === 'ArrowLeft') this.previousPage();
             else if (e.key === 'ArrowRight') this.nextPage();
         }});
+        
+        // Offline reading through the book's service worker
+        this.offline = new OfflineCache();
+        this.downloadChapterBtn = document.getElementById('downloadChapterBtn');
+        if (this.offline.supported && this.downloadChapterBtn) {{
+            this.downloadChapterBtn.hidden = false;
+            this.downloadChapterBtn.addEventListener('click', () => this.downloadChapter());
+        }}
+    }}
+    
+    /**
+     * Cache every page of the current page's chapter for offline reading.
+     */
+    downloadChapter() {{
+        const info = (window.mangaImageData || [])[this.currentPage - 1];
+        if (!info) return;
+        const button = this.downloadChapterBtn;
+        button.disabled = true;
+        this.offline.downloadChapter(info.chapter, ({{ done, total, failed, error, complete }}) => {{
+            if (error) {{
+                button.title = error;
+            }} else if (complete) {{
+                button.title = failed ? `${{failed}} of ${{total}} pages could not be saved` : `Saved ${{total}} pages`;
+            }} else {{
+                button.title = `Downloading ${{done}} / ${{total}}`;
+            }}
+            button.textContent = error || failed ? '⚠️' : complete ? '✅' : '⏳';
+            if (error || complete) {{
+                button.disabled = false;
+            }}
+        }});
     }}
     
     setupIntersectionObserver() {{
@@ -522,7 +697,7 @@ class OptimizedMangaReader {{
                     
                     if (distance < bestDistance) {{
                         bestDistance = distance;
-                        bestPage = entry.target;
+                        bestPage = entry.target.closest('.page-image');
                     }}
                 }}
             }});
@@ -536,7 +711,8 @@ class OptimizedMangaReader {{
             }}
         }}, {{ threshold: [0.2, 0.5, 0.8] }});
         
-        document.querySelectorAll('.page-image').forEach(page => observer.observe(page));
+        // Tiles stand in for their strip, which is never 20% visible
+        document.querySelectorAll('img.page-image, .page-tile').forEach(page => observer.observe(page));
     }}
     
     /**
@@ -597,8 +773,10 @@ class VirtualScrollManager {{
         this.spacer = reader.spacer;
         this.visiblePages = new Map();
         this.pageHeight = 800;
-        this.renderBuffer = 3;
+        this.renderBuffer = 3; // Pages kept behind the viewport
+        this.maxRenderAhead = 40; // DOM cap of the prefetch window
         this.imageData = window.mangaImageData || [];
+        this.prefetch = new PrefetchWindow(window.mangaPageKiB || []);
         
         this.setupVirtualScroll();
     }}
@@ -618,15 +796,16 @@ class VirtualScrollManager {{
         const scrollTop = window.scrollY;
         const viewportHeight = window.innerHeight;
         
-        // Calculate visible range
+        // Calculate visible range; ahead of it, as many pages as fit in the prefetch window
         const startPage = Math.max(1, Math.floor(scrollTop / this.pageHeight) - this.renderBuffer);
-        const endPage = Math.min(this.reader.totalPages, 
-            Math.ceil((scrollTop + viewportHeight) / this.pageHeight) + this.renderBuffer);
+        const lastVisible = Math.ceil((scrollTop + viewportHeight) / this.pageHeight);
+        const ahead = Math.min(this.maxRenderAhead, Math.max(1, this.prefetch.pagesAhead(lastVisible)));
+        const endPage = Math.min(this.reader.totalPages, lastVisible + ahead);
         
         // Remove pages outside range
         this.visiblePages.forEach((element, pageNum) => {{
             if (pageNum < startPage || pageNum > endPage) {{
-                element.remove();
+                (element.closest('picture') || element).remove();
                 this.visiblePages.delete(pageNum);
             }}
         }});
@@ -650,28 +829,97 @@ class VirtualScrollManager {{
         const imageInfo = this.imageData[pageNum - 1];
         if (!imageInfo) return;
         
+        if (imageInfo.tiles) {{
+            this.renderTiles(pageNum, imageInfo);
+            return;
+        }}
+        
         const pageElement = document.createElement('img');
         pageElement.id = `page-${{pageNum}}`;
         pageElement.className = 'page-image loading';
+        if (imageInfo.srcset) {{
+            pageElement.sizes = imageInfo.sizes;
+            pageElement.srcset = imageInfo.srcset;
+        }}
         pageElement.src = imageInfo.src;
         pageElement.alt = imageInfo.name;
         pageElement.dataset.chapter = imageInfo.chapter;
-        pageElement.loading = 'lazy';
+        if (imageInfo.damaged) {{
+            pageElement.dataset.damaged = '';
+            pageElement.title = `Damaged image: ${{imageInfo.damaged}}`;
+        }}
+        // Rendered pages are within the prefetch window, so they load right away
+        pageElement.loading = 'eager';
         
         // Position for virtual scroll
         pageElement.style.top = `${{(pageNum - 1) * this.pageHeight}}px`;
+        if (imageInfo.placeholder) {{
+            // Holds the page's slot until the image has a height of its own
+            this.showPlaceholder(pageElement, imageInfo.placeholder);
+            pageElement.style.minHeight = `${{this.pageHeight}}px`;
+        }}
         
         // Handle load completion
         pageElement.onload = () => {{
             pageElement.classList.remove('loading');
+            pageElement.style.minHeight = '';
             const actualHeight = pageElement.offsetHeight;
             if (actualHeight && actualHeight !== this.pageHeight) {{
                 this.adjustPageHeight(pageNum, actualHeight);
             }}
         }};
         
+        if (imageInfo.avif) {{
+            // Browsers without AVIF skip the source and load the src
+            const picture = document.createElement('picture');
+            const source = document.createElement('source');
+            source.type = 'image/avif';
+            source.srcset = imageInfo.avif;
+            picture.append(source, pageElement);
+            this.viewport.appendChild(picture);
+        }} else {{
+            this.viewport.appendChild(pageElement);
+        }}
+        this.visiblePages.set(pageNum, pageElement);
+    }}
+    
+    // A strip as stacked tiles: its height is known from the tile sizes before
+    // anything loads, and only the tiles near the viewport are decoded
+    renderTiles(pageNum, imageInfo) {{
+        const pageElement = document.createElement('div');
+        pageElement.id = `page-${{pageNum}}`;
+        pageElement.className = 'page-image page-tiles';
+        pageElement.setAttribute('role', 'img');
+        pageElement.setAttribute('aria-label', imageInfo.name);
+        pageElement.dataset.chapter = imageInfo.chapter;
+        pageElement.style.top = `${{(pageNum - 1) * this.pageHeight}}px`;
+        if (imageInfo.placeholder) {{
+            this.showPlaceholder(pageElement, imageInfo.placeholder);
+        }}
+        imageInfo.tiles.forEach(([src, height], index) => {{
+            const tile = document.createElement('img');
+            tile.className = 'page-tile';
+            tile.width = imageInfo.width;
+            tile.height = height;
+            tile.loading = index === 0 ? 'eager' : 'lazy';
+            tile.alt = '';
+            tile.src = src;
+            pageElement.appendChild(tile);
+        }});
+        
         this.viewport.appendChild(pageElement);
         this.visiblePages.set(pageNum, pageElement);
+        const actualHeight = pageElement.offsetHeight;
+        if (actualHeight && actualHeight !== this.pageHeight) {{
+            this.adjustPageHeight(pageNum, actualHeight);
+        }}
+    }}
+    
+    // A page's band colors (page_placeholders.py) as a gradient, shown without
+    // any request while the page loads
+    showPlaceholder(pageElement, code) {{
+        const colors = code.match(/.{{6}}/g).map(color => '#' + color);
+        pageElement.style.background = `linear-gradient(${{colors.join(', ')}})`;
     }}
     
     adjustPageHeight(pageNum, actualHeight) {{
@@ -15,8 +15,13 @@ Version: 4.0
 
 import os
 import sys
+import json
+import argparse
 import logging
+import threading
 import time
+import uuid
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
 from typing import List, Dict, Optional, Set, Tuple
 from dataclasses import dataclass, field
@@ -24,6 +29,17 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 import mimetypes
 from datetime import datetime
 
+from scan_latency import DirectoryLatencyRecorder
+from book_manifest import manifest_reader_file, read_manifest
+from output_writer import OutputWriter, WriteStats, resolve_asset
+from page_check import EXCLUDE, MODES as CHECK_MODES, env_mode as env_check_mode
+from progress_journal import ProgressJournal
+from run_coordinator import STATE_DIR_NAME, RunCoordinator
+from safe_walk import NEVER, SYMLINK_MODES, SafeWalker, env_mode as env_symlink_mode
+from server_notify import ServerNotifier
+from shard_catalog import ShardSpec, load_partial_catalogs, write_partial_catalog, write_server_index
+from stage_profiler import StageProfiler
+
 
 # Configure logging
 logging.basicConfig(
@@ -42,6 +58,28 @@ class BookItem:
     reader_link: str
     page_count: int
     subfolders: int = 0
+    
+    def to_dict(self) -> Dict:
+        """Serializable form; links stay relative to the library root."""
+        return {
+            'folder': self.folder_path.name,
+            'title': self.title,
+            'cover_image': self.cover_image,
+            'reader_link': self.reader_link,
+            'page_count': self.page_count,
+            'subfolders': self.subfolders,
+        }
+    
+    @classmethod
+    def from_dict(cls, base_path: Path, data: Dict) -> 'BookItem':
+        return cls(
+            title=data['title'],
+            folder_path=base_path / data['folder'],
+            cover_image=data['cover_image'],
+            reader_link=data['reader_link'],
+            page_count=data['page_count'],
+            subfolders=data['subfolders']
+        )
 
 
 @dataclass 
@@ -51,64 +89,364 @@ class GenerationConfig:
     generate_readers: bool = True
     output_filename: str = "index.html"
     max_workers: int = 4
+    reader_jobs: int = 1  # Worker processes for reader generation (1 = in-process)
     enable_metrics: bool = True
+    trace_output: Optional[Path] = None  # Chrome/Perfetto trace JSON destination
+    metrics_textfile: Optional[Path] = None  # Prometheus textfile collector output
+    profile_dir: Optional[Path] = None  # Per-stage .pstats/tracemalloc output directory
+    profile_stages: Optional[Set[str]] = None  # Stages to profile (None = all)
+    profile_top_n: int = 25  # Allocation sites listed per stage
+    profile_slowest: Optional[int] = None  # Only profile the K slowest books
+    scan_latency_file: Optional[Path] = None  # JSONL dump of per-directory listing latency
+    scan_report_top: int = 10  # Rows in the slowest books/directories report
+    shard: Optional[ShardSpec] = None  # Only process the books of this shard
+    catalog_output: Optional[Path] = None  # Partial catalog path in shard mode
+    coordinate: bool = True  # Split books with concurrent runs via lockfiles
+    resume: bool = True  # Journal finished books and resume interrupted runs
+    lease_seconds: float = 600.0  # Claim lease; renewed while the run is alive
+    notify_server: Optional[str] = None  # Server to tell about changed books (port, URL or unix:PATH)
+    hashed_names: bool = False  # Content-hashed reader copies for immutable caching
+    image_variants: bool = False  # Responsive width variants of the pages (needs Pillow)
+    tile_strips: bool = False  # Cut tall strips into tiles (needs Pillow)
+    page_placeholders: bool = False  # Tiny per-page placeholders shown while pages load (needs Pillow)
+    scrubber_thumbs: bool = False  # Progress slider preview thumbnails (needs Pillow)
+    damaged_pages: str = EXCLUDE  # Truncated or misnamed images: exclude, flag or off (page_check.py)
+    follow_symlinks: str = NEVER  # Symlinked folders to scan: never, inside the book or always (safe_walk.py)
+
+
+@dataclass
+class TimingSpan:
+    """A timed section of a run (run → book → stage → sub-stage)."""
+    name: str
+    category: str
+    start: float
+    end: float = 0.0
+    depth: int = 0
+    thread_id: int = 0
+    parent: str = ''
+    args: Dict[str, str] = field(default_factory=dict)
+    
+    @property
+    def duration(self) -> float:
+        return max(0.0, self.end - self.start)
 
 
 @dataclass
 class PerformanceMetrics:
-    """Tracks detailed performance metrics."""
+    """Tracks detailed performance metrics as a hierarchy of timing spans."""
     start_time: float = field(default_factory=time.perf_counter)
-    scan_start: float = 0.0
-    html_start: float = 0.0
-    scan_time: float = 0.0
-    image_search_time: float = 0.0
-    html_generation_time: float = 0.0
     total_books: int = 0
     books_with_images: int = 0
     books_without_images: int = 0
     total_images_found: int = 0
+    books_skipped: int = 0
+    books_resumed: int = 0
+    readers_regenerated: int = 0  # Books whose reader changed on disk
+    writes: WriteStats = field(default_factory=WriteStats)  # The run's OutputWriter totals (set by the run)
+    errors: Dict[str, int] = field(default_factory=dict)
+    spans: List[TimingSpan] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _local: threading.local = field(default_factory=threading.local, repr=False)
+    
+    @contextmanager
+    def span(self, name: str, category: str = 'stage', **args):
+        """
+        Time a section of the run.
+        
+        Spans nest per thread, so a span opened inside another one becomes its
+        child in the exported trace and in the stage totals.
+        """
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        
+        timing = TimingSpan(
+            name=name,
+            category=category,
+            start=time.perf_counter(),
+            depth=len(stack),
+            thread_id=threading.get_ident(),
+            parent=stack[-1].name if stack else '',
+            args={key: str(value) for key, value in args.items()}
+        )
+        stack.append(timing)
+        try:
+            yield timing
+        finally:
+            timing.end = time.perf_counter()
+            stack.pop()
+            with self._lock:
+                self.spans.append(timing)
+    
+    def record_span(self, name: str, category: str, duration: float, thread_id: int = 0, **args):
+        """
+        Add a span timed elsewhere (e.g. in a worker process) that ended just now.
+        
+        It becomes a child of this thread's open span, like a span opened here.
+        """
+        stack = getattr(self._local, 'stack', None) or []
+        end = time.perf_counter()
+        timing = TimingSpan(
+            name=name,
+            category=category,
+            start=end - duration,
+            end=end,
+            depth=len(stack),
+            thread_id=thread_id or threading.get_ident(),
+            parent=stack[-1].name if stack else '',
+            args={key: str(value) for key, value in args.items()}
+        )
+        with self._lock:
+            self.spans.append(timing)
+    
+    def record_error(self, stage: str):
+        """Count a failure in the given stage."""
+        with self._lock:
+            self.errors[stage] = self.errors.get(stage, 0) + 1
+    
+    def book_latencies(self, stage: str) -> List[float]:
+        """Durations of the per-book spans opened inside the given stage."""
+        return [s.duration for s in self.spans if s.category == 'book' and s.parent == stage]
     
-    def mark_scan_complete(self):
-        current_time = time.perf_counter()
-        self.scan_time = current_time - self.start_time
-        self.html_start = current_time
+    def stage_time(self, name: str, category: Optional[str] = None) -> float:
+        """Total time of all spans with the given name (and category)."""
+        return sum(s.duration for s in self.spans
+                   if s.name == name and (category is None or s.category == category))
     
-    def mark_html_complete(self):
-        if self.html_start > 0:
-            self.html_generation_time = time.perf_counter() - self.html_start
-        else:
-            # Fallback if html_start wasn't set properly
-            self.html_generation_time = 0.001  # Set minimum time to show it ran
+    @property
+    def scan_time(self) -> float:
+        return self.stage_time('scan', 'stage')
+    
+    @property
+    def image_search_time(self) -> float:
+        return self.stage_time('cover_search')
+    
+    @property
+    def reader_generation_time(self) -> float:
+        return self.stage_time('readers', 'stage')
+    
+    @property
+    def html_generation_time(self) -> float:
+        return self.stage_time('bookshelf', 'stage')
     
     def get_total_time(self) -> float:
         return time.perf_counter() - self.start_time
     
+    def export_chrome_trace(self, output_path: Path) -> Path:
+        """
+        Write all spans as Chrome trace JSON (chrome://tracing, ui.perfetto.dev).
+        
+        Each span becomes a complete ("X") event; timestamps are microseconds
+        relative to the start of the run.
+        """
+        thread_ids: Dict[int, int] = {}
+        events = [{
+            'name': 'process_name', 'ph': 'M', 'pid': 1, 'tid': 0,
+            'args': {'name': 'manga-generation'}
+        }]
+        
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: (s.start, s.depth))
+        
+        for timing in spans:
+            tid = thread_ids.setdefault(timing.thread_id, len(thread_ids) + 1)
+            events.append({
+                'name': timing.name,
+                'cat': timing.category,
+                'ph': 'X',
+                'ts': round((timing.start - self.start_time) * 1_000_000, 3),
+                'dur': round(timing.duration * 1_000_000, 3),
+                'pid': 1,
+                'tid': tid,
+                'args': timing.args
+            })
+        
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+        
+        logger.info(f"Wrote timing trace ({len(spans)} spans): {output_path}")
+        return output_path
+    
     def print_summary(self):
         total = self.get_total_time()
         
-        # Calculate accounted time and remaining time
-        accounted_time = self.scan_time + self.image_search_time + self.html_generation_time
+        # Only top-level stages are summed; cover search is part of the scan stage
+        stages = [
+            ('Scan Time', self.scan_time),
+            ('Reader Generation', self.reader_generation_time),
+            ('HTML Generation', self.html_generation_time),
+        ]
+        accounted_time = sum(duration for _, duration in stages)
         other_time = total - accounted_time
         
         print(f"\n{'='*50}")
         print(f"PERFORMANCE METRICS")
         print(f"{'='*50}")
         print(f"Total Time: {total:.3f}s")
-        print(f"Scan Time: {self.scan_time:.3f}s ({self.scan_time/total*100:.1f}%)")
-        print(f"Image Search: {self.image_search_time:.3f}s ({self.image_search_time/total*100:.1f}%)")
-        print(f"HTML Generation: {self.html_generation_time:.3f}s ({self.html_generation_time/total*100:.1f}%)")
+        for label, duration in stages:
+            print(f"{label}: {duration:.3f}s ({duration/total*100:.1f}%)")
+            if label == 'Scan Time':
+                print(f"  Image Search (in scan): {self.image_search_time:.3f}s "
+                      f"({self.image_search_time/total*100:.1f}%)")
         if other_time > 0.001:  # Show other time if significant
             print(f"Other Operations: {other_time:.3f}s ({other_time/total*100:.1f}%)")
         print(f"Total Books: {self.total_books}")
         print(f"Books with Images: {self.books_with_images}")
         print(f"Books without Images: {self.books_without_images}")
         print(f"Total Images Found: {self.total_images_found}")
+        if self.books_resumed:
+            print(f"Books Resumed from Journal: {self.books_resumed}")
+        print(f"Files Written: {self.writes.written} ({self.writes.unchanged} unchanged, not rewritten)")
         if self.total_books > 0:
             print(f"Success Rate: {self.books_with_images/self.total_books*100:.1f}%")
             print(f"Books/Second: {self.total_books/total:.1f}")
         print(f"{'='*50}")
 
 
+def _span(metrics: Optional[PerformanceMetrics], name: str, category: str = 'stage', **args):
+    """Open a timing span, or a no-op context when metrics are disabled."""
+    return metrics.span(name, category, **args) if metrics else nullcontext()
+
+
+def _manifest_pages(manifest: Optional[Dict]) -> Optional[int]:
+    """Pages of a book's reader as recorded in its manifest (None without one)."""
+    pages = (manifest or {}).get('pages')
+    return pages if isinstance(pages, int) else None
+
+
+def _folder_mtime(folder: Path) -> float:
+    """
+    Latest mtime of a book folder and its chapter folders.
+
+    A page added, removed or renamed inside a chapter only changes that
+    chapter folder's mtime. Hidden folders (generated files) and symlinked
+    folders are not looked at.
+    """
+    try:
+        latest = folder.stat().st_mtime
+    except OSError:
+        return 0.0
+    pending = [folder]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as it:
+                for entry in it:
+                    if entry.name.startswith('.') or not entry.is_dir(follow_symlinks=False):
+                        continue
+                    latest = max(latest, entry.stat(follow_symlinks=False).st_mtime)
+                    pending.append(entry.path)
+        except OSError:
+            continue
+    return latest
+
+
+def _profile(profiler: Optional[StageProfiler], name: str, book: Optional[Path] = None):
+    """Profile a bookshelf stage as ``shelf.<name>``, or no-op without a profiler."""
+    if profiler is None:
+        return nullcontext()
+    return profiler.stage(f"shelf.{name}", book=str(book) if book else None)
+
+
+class PrometheusTextfileExporter:
+    """
+    Writes run metrics for node_exporter's textfile collector.
+    
+    Every value describes the last run only, so all series are gauges except
+    the per-book latency histogram. The file is written to a temporary name
+    and renamed so node_exporter never scrapes a partial file.
+    """
+    
+    PREFIX = 'manga_generation'
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    
+    def __init__(self, output_path: Path):
+        self.output_path = Path(output_path)
+    
+    def write(self, metrics: PerformanceMetrics, base_path: Path, success: bool) -> Path:
+        """Render ``metrics`` and atomically replace the textfile."""
+        content = self.render(metrics, base_path, success)
+        
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.output_path.with_name(f".{self.output_path.name}.{os.getpid()}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temp_path, self.output_path)
+        
+        logger.info(f"Wrote Prometheus metrics: {self.output_path}")
+        return self.output_path
+    
+    def render(self, metrics: PerformanceMetrics, base_path: Path, success: bool) -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+        library = self._escape(str(base_path))
+        lines: List[str] = []
+        
+        def gauge(name: str, help_text: str, samples: List[Tuple[Dict[str, str], float]]):
+            metric = f"{self.PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} gauge")
+            for labels, value in samples:
+                lines.append(f"{metric}{self._labels(library, labels)} {self._format(value)}")
+        
+        gauge('last_run_timestamp_seconds', 'Unix time the last generation run finished.',
+              [({}, time.time())])
+        gauge('last_run_success', 'Whether the last generation run completed (1) or failed (0).',
+              [({}, 1 if success else 0)])
+        gauge('run_duration_seconds', 'Wall-clock duration of the last generation run.',
+              [({}, metrics.get_total_time())])
+        gauge('stage_duration_seconds', 'Time spent in each top-level stage of the last run.',
+              [({'stage': 'scan'}, metrics.scan_time),
+               ({'stage': 'cover_search'}, metrics.image_search_time),
+               ({'stage': 'readers'}, metrics.reader_generation_time),
+               ({'stage': 'bookshelf'}, metrics.html_generation_time)])
+        gauge('books', 'Books seen by the last run, by outcome.',
+              [({'state': 'scanned'}, metrics.total_books),
+               ({'state': 'skipped'}, metrics.books_skipped),
+               ({'state': 'resumed'}, metrics.books_resumed),
+               ({'state': 'regenerated'}, metrics.readers_regenerated)])
+        gauge('pages', 'Pages found across all books in the last run.',
+              [({}, metrics.total_images_found)])
+        gauge('bytes_written', 'Bytes of generated files written by the last run.',
+              [({}, metrics.writes.bytes_written)])
+        gauge('files', 'Generated files of the last run, by whether they changed on disk.',
+              [({'state': 'written'}, metrics.writes.written),
+               ({'state': 'unchanged'}, metrics.writes.unchanged)])
+        
+        error_stages = sorted(set(metrics.errors) | {'scan', 'reader', 'bookshelf', 'run'})
+        gauge('errors', 'Errors raised during the last run, by stage.',
+              [({'stage': stage}, metrics.errors.get(stage, 0)) for stage in error_stages])
+        
+        metric = f"{self.PREFIX}_book_duration_seconds"
+        lines.append(f"# HELP {metric} Per-book processing time in the last run, by stage.")
+        lines.append(f"# TYPE {metric} histogram")
+        for stage in ('scan', 'readers'):
+            latencies = metrics.book_latencies(stage)
+            for bound in self.LATENCY_BUCKETS:
+                count = sum(1 for latency in latencies if latency <= bound)
+                labels = self._labels(library, {'stage': stage, 'le': self._format(bound)})
+                lines.append(f"{metric}_bucket{labels} {count}")
+            labels = self._labels(library, {'stage': stage, 'le': '+Inf'})
+            lines.append(f"{metric}_bucket{labels} {len(latencies)}")
+            labels = self._labels(library, {'stage': stage})
+            lines.append(f"{metric}_sum{labels} {self._format(sum(latencies))}")
+            lines.append(f"{metric}_count{labels} {len(latencies)}")
+        
+        return '\n'.join(lines) + '\n'
+    
+    def _labels(self, library: str, labels: Dict[str, str]) -> str:
+        pairs = [f'library="{library}"'] + [f'{key}="{self._escape(str(value))}"' for key, value in labels.items()]
+        return '{' + ','.join(pairs) + '}'
+    
+    @staticmethod
+    def _escape(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    
+    @staticmethod
+    def _format(value: float) -> str:
+        if not isinstance(value, float):
+            return str(value)
+        return f"{value:.6f}".rstrip('0').rstrip('.') or '0'
+
+
 class ImageSearchEngine:
     """High-performance recursive image finder (based on original logic)."""
     
@@ -139,8 +477,9 @@ class ImageSearchEngine:
                 if file.is_file() and cls._is_image(file):
                     return str(file.relative_to(base_path)).replace('\\', '/')
             
-            # Step 2: Recursively check all subfolders (original behavior)
-            subfolders = [f for f in files if f.is_dir()]
+            # Step 2: Recursively check all subfolders (original behavior);
+            # hidden ones hold generated files (.manga-gen), never pages
+            subfolders = [f for f in files if f.is_dir() and not f.name.startswith('.')]
             for subfolder in sorted(subfolders):
                 image = cls.find_first_image(subfolder, base_path)
                 if image:
@@ -161,23 +500,31 @@ class ImageSearchEngine:
 class ReaderFileFinder:
     """Finds reader HTML files with priority ordering."""
     
-    READER_PRIORITIES = ['index-mb-virtualscroll.html', 'index-mb.html', 'index.html', 'index-mobile.html']
+    READER_PRIORITIES = ['index-mb-split.html', 'index-mb-virtualscroll.html', 'index-mb.html', 'index.html',
+                         'index-mobile.html']
     
     @classmethod
     def find_reader_file(cls, folder: Path, base_path: Path) -> Optional[str]:
         """
         Find the main reader HTML file with priority ordering.
-        Based on original get_dedecated_file() logic with index-mb.html priority.
+        The reader recorded in the book manifest wins; otherwise based on
+        original get_dedecated_file() logic with index-mb.html priority.
+        Links to the content-hashed copy when the folder's asset map has a current one.
         """
+        # Reader chosen by the mode policy at generation time
+        manifest_reader = manifest_reader_file(folder)
+        if manifest_reader:
+            return str(resolve_asset(manifest_reader).relative_to(base_path)).replace('\\', '/')
+        
         # Priority order for reader files
         for priority_file in cls.READER_PRIORITIES:
             file_path = folder / priority_file
             if file_path.exists():
-                return str(file_path.relative_to(base_path)).replace('\\', '/')
+                return str(resolve_asset(file_path).relative_to(base_path)).replace('\\', '/')
         
         # Fallback: any HTML file
         try:
-            for file in folder.iterdir():
+            for file in sorted(folder.iterdir()):
                 if file.suffix.lower() == '.html':
                     return str(file.relative_to(base_path)).replace('\\', '/')
         except (PermissionError, OSError):
@@ -189,9 +536,17 @@ class ReaderFileFinder:
 class BookshelfScanner:
     """High-performance manga collection scanner."""
     
-    def __init__(self, config: GenerationConfig):
+    def __init__(self, config: GenerationConfig, metrics: Optional[PerformanceMetrics] = None,
+                 profiler: Optional[StageProfiler] = None,
+                 recorder: Optional[DirectoryLatencyRecorder] = None,
+                 journal: Optional[ProgressJournal] = None):
         self.config = config
-        self.metrics = PerformanceMetrics() if config.enable_metrics else None
+        if metrics is None and config.enable_metrics:
+            metrics = PerformanceMetrics()
+        self.metrics = metrics
+        self.profiler = profiler
+        self.recorder = recorder
+        self.journal = journal
     
     def scan_books(self) -> List[BookItem]:
         """
@@ -202,30 +557,34 @@ class BookshelfScanner:
         """
         books = []
         
-        try:
-            # Get all subdirectories (use original os.listdir() order)
-            import os
-            folder_names = os.listdir(str(self.config.base_path))
-            subdirs = []
-            for name in folder_names:
-                path = self.config.base_path / name
-                if path.is_dir():
-                    subdirs.append(path)
-            
-            if self.metrics:
-                self.metrics.total_books = len(subdirs)
-            
-            logger.info(f"Scanning {len(subdirs)} manga directories...")
-            
-            # Always use sequential processing to maintain original order
-            # (Parallel processing would break the filesystem ordering)
-            books = self._scan_sequential(subdirs)
+        with _span(self.metrics, 'scan'):
+            try:
+                # Get all subdirectories, sorted so that the bookshelf is the
+                # same on every filesystem (os.listdir() order is arbitrary)
+                if self.recorder:
+                    folder_names, _ = self.recorder.listdir(self.config.base_path, component='shelf')
+                else:
+                    folder_names = os.listdir(str(self.config.base_path))
+                subdirs = []
+                for name in sorted(folder_names):
+                    path = self.config.base_path / name
+                    if name != STATE_DIR_NAME and path.is_dir():
+                        subdirs.append(path)
                 
-        except Exception as e:
-            logger.error(f"Error scanning books: {e}")
-            
-        if self.metrics:
-            self.metrics.mark_scan_complete()
+                if self.config.shard:
+                    subdirs = [path for path in subdirs if self.config.shard.owns(path.name)]
+                    logger.info(f"Shard {self.config.shard}: {len(subdirs)} of {len(folder_names)} entries")
+                
+                if self.metrics:
+                    self.metrics.total_books = len(subdirs)
+                
+                logger.info(f"Scanning {len(subdirs)} manga directories...")
+                
+                # Always use sequential processing to maintain the sorted order
+                books = self._scan_sequential(subdirs)
+                    
+            except Exception as e:
+                logger.error(f"Error scanning books: {e}")
             
         logger.info(f"Found {len(books)} books with valid covers")
         return books
@@ -247,6 +606,8 @@ class BookshelfScanner:
                         self.metrics.books_without_images += 1
                     # Add all page images to total count
                     self.metrics.total_images_found += book.page_count
+            elif self.metrics:
+                self.metrics.books_skipped += 1
         return books
     
     def _scan_parallel(self, subdirs: List[Path]) -> List[BookItem]:
@@ -276,6 +637,8 @@ class BookshelfScanner:
                                 self.metrics.books_without_images += 1
                             # Add all page images to total count
                             self.metrics.total_images_found += book.page_count
+                    elif self.metrics:
+                        self.metrics.books_skipped += 1
                 except Exception as e:
                     folder = future_to_folder[future]
                     logger.warning(f"Error processing {folder}: {e}")
@@ -285,77 +648,54 @@ class BookshelfScanner:
     def _analyze_book_folder(self, folder: Path) -> Optional[BookItem]:
         """Analyze a single book folder and create BookItem."""
         try:
-            # Count pages and subfolders first
-            page_count, subfolder_count = self._count_content(folder)
+            mtime = _folder_mtime(folder)
+            if self.journal:
+                entry = self.journal.lookup('scan', folder.name, mtime)
+                if entry is not None:
+                    if self.metrics:
+                        self.metrics.books_resumed += 1
+                    item = entry['item']
+                    return BookItem.from_dict(self.config.base_path, item) if item else None
             
-            # Auto-generate virtual scroll reader for large collections
-            reader_link = self._ensure_optimal_reader(folder, page_count)
-            if not reader_link:
-                return None
-            
-            # Find cover image using original recursive logic
-            img_start = time.perf_counter()
-            cover_image = ImageSearchEngine.find_first_image(folder, self.config.base_path)
-            if self.metrics:
-                self.metrics.image_search_time += time.perf_counter() - img_start
-            
-            # Extract title from folder name (original logic)
-            title = self._extract_title(folder.name)
-            
-            return BookItem(
-                title=title,
-                folder_path=folder,
-                cover_image=cover_image,
-                reader_link=reader_link,
-                page_count=page_count,
-                subfolders=subfolder_count
-            )
+            with _span(self.metrics, folder.name, 'book'), _profile(self.profiler, 'scan', folder):
+                book = self._build_book_item(folder)
             
+            if self.journal:
+                self.journal.record('scan', folder.name, mtime, item=book.to_dict() if book else None)
+            return book
         except Exception as e:
             logger.warning(f"Error analyzing folder {folder}: {e}")
+            if self.metrics:
+                self.metrics.record_error('scan')
             return None
     
-    def _ensure_optimal_reader(self, folder: Path, page_count: int) -> Optional[str]:
-        """Ensure optimal reader exists (virtual scroll for large collections)."""
-        # Check for existing readers
-        existing_reader = ReaderFileFinder.find_reader_file(folder, self.config.base_path)
+    def _build_book_item(self, folder: Path) -> Optional[BookItem]:
+        """Collect the BookItem fields of a folder, one sub-stage span per step."""
+        # Count pages and subfolders first
+        with _span(self.metrics, 'count_content', 'substage'):
+            page_count, subfolder_count = self._count_content(folder)
         
-        # Determine if virtual scroll is needed
-        needs_virtual_scroll = page_count > 5000
-        virtual_scroll_exists = (folder / "index-mb-virtualscroll.html").exists()
+        # Reader picked by the mode policy (see reader_policy.py)
+        with _span(self.metrics, 'ensure_reader', 'substage'):
+            reader_link = ReaderFileFinder.find_reader_file(folder, self.config.base_path)
+        if not reader_link:
+            return None
         
-        if needs_virtual_scroll and not virtual_scroll_exists:
-            # Generate virtual scroll reader for large collection
-            logger.info(f"Generating virtual scroll reader for {folder.name} ({page_count} pages)")
-            try:
-                # Import with absolute path
-                import sys
-                import importlib.util
-                
-                script_dir = Path(__file__).parent
-                virtualscroll_path = script_dir / "htmlcmb_v3_virtualscroll.py"
-                
-                if virtualscroll_path.exists():
-                    spec = importlib.util.spec_from_file_location("htmlcmb_v3_virtualscroll", virtualscroll_path)
-                    htmlcmb_v3_virtualscroll = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(htmlcmb_v3_virtualscroll)
-                    
-                    htmlcmb_v3_virtualscroll.create_virtual_scroll_reader(str(folder))
-                    # Return full relative path
-                    virtual_file = folder / "index-mb-virtualscroll.html"
-                    return str(virtual_file.relative_to(self.config.base_path)).replace('\\', '/')
-                else:
-                    logger.warning(f"Virtual scroll script not found: {virtualscroll_path}")
-            except Exception as e:
-                logger.warning(f"Failed to generate virtual scroll reader for {folder}: {e}")
+        # Find cover image using original recursive logic
+        with _span(self.metrics, 'cover_search', 'substage'):
+            cover_image = ImageSearchEngine.find_first_image(folder, self.config.base_path)
         
-        # Use virtual scroll if available for large collections
-        if needs_virtual_scroll and virtual_scroll_exists:
-            virtual_file = folder / "index-mb-virtualscroll.html"
-            return str(virtual_file.relative_to(self.config.base_path)).replace('\\', '/')
+        # Extract title from folder name (original logic)
+        title = self._extract_title(folder.name)
         
-        # Fall back to existing reader
-        return existing_reader
+        return BookItem(
+            title=title,
+            folder_path=folder,
+            cover_image=cover_image,
+            reader_link=reader_link,
+            page_count=page_count,
+            subfolders=subfolder_count
+        )
     
     def _extract_title(self, folder_name: str) -> str:
         """Extract title using original htmlcs.py logic: take LAST part after splitting by dots."""
@@ -373,48 +713,68 @@ class BookshelfScanner:
         return title
     
     def _count_content(self, folder: Path) -> Tuple[int, int]:
-        """Count pages and subfolders."""
+        """
+        Count pages (each physical file once) and subfolders.
+        
+        The reader's page count in ``book-manifest.json`` wins over the walk's,
+        which cannot tell the images ``page_check`` leaves out.
+        """
         page_count = 0
         subfolder_count = 0
         
-        try:
-            for item in folder.rglob('*'):
-                if item.is_file() and ImageSearchEngine._is_image(item):
-                    page_count += 1
-                elif item.is_dir() and item.parent == folder:
-                    subfolder_count += 1
-        except:
-            pass
-            
-        return page_count, subfolder_count
+        walker = SafeWalker(self.config.follow_symlinks, self.recorder, book=str(folder), component='shelf')
+        for root, dirs, files in walker.walk(folder):
+            dirs[:] = [name for name in dirs if not name.startswith('.')]  # Generated files (.manga-gen)
+            if root == str(folder):
+                subfolder_count = len(dirs)
+            page_count += sum(1 for name in files if ImageSearchEngine._is_image(Path(name)))
+        
+        manifest = read_manifest(folder)
+        # The reader stage walks the book with the same rules and reports the same entries,
+        # either in this run or in the one that wrote the manifest
+        if (walker.report and not self.config.generate_readers
+                and walker.report.to_dict(folder) != (manifest or {}).get('scan_skipped', {})):
+            walker.report.log(walker.book)
+        manifest_pages = _manifest_pages(manifest)
+        return (page_count if manifest_pages is None else manifest_pages), subfolder_count
 
 
 class ModernBookshelfHTMLGenerator:
     """Generates modern, responsive HTML bookshelf."""
     
-    def __init__(self, books: List[BookItem], config: GenerationConfig, metrics: Optional[PerformanceMetrics] = None):
+    def __init__(self, books: List[BookItem], config: GenerationConfig, metrics: Optional[PerformanceMetrics] = None,
+                 profiler: Optional[StageProfiler] = None, writer: Optional[OutputWriter] = None):
         self.books = books
         self.config = config
         self.metrics = metrics
+        self.profiler = profiler
+        self.writer = writer or OutputWriter()
+        self.written = False
     
     def generate(self) -> Path:
         """Generate the bookshelf HTML file."""
         output_path = self.config.base_path / self.config.output_filename
         
         try:
-            html_content = self._build_html()
-            
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
+            with _span(self.metrics, 'bookshelf'):
+                with _span(self.metrics, 'render', 'substage'), _profile(self.profiler, 'render'):
+                    html_content = self._build_html()
                 
-            if self.metrics:
-                self.metrics.mark_html_complete()
+                with _span(self.metrics, 'write', 'substage'), _profile(self.profiler, 'write'):
+                    # The bookshelf is the entry page; its URL must not change
+                    written = self.writer.write_text(output_path, html_content, hashed=False)
+                    self.written = written
                 
-            logger.info(f"Generated bookshelf: {output_path}")
+            if written:
+                logger.info(f"Generated bookshelf: {output_path}")
+            else:
+                logger.info(f"Bookshelf unchanged, kept existing file: {output_path}")
             return output_path
             
         except Exception as e:
             logger.error(f"Error generating HTML: {e}")
+            if self.metrics:
+                self.metrics.record_error('bookshelf')
             raise
     
     def _build_html(self) -> str:
@@ -917,8 +1277,57 @@ class BookshelfGenerator:
             generate_readers=kwargs.get('generate_readers', True),
             output_filename=kwargs.get('output_filename', 'index.html'),
             max_workers=kwargs.get('max_workers', 4),
-            enable_metrics=kwargs.get('enable_metrics', True)
+            reader_jobs=kwargs.get('reader_jobs', 1),
+            enable_metrics=kwargs.get('enable_metrics', True),
+            trace_output=kwargs.get('trace_output'),
+            metrics_textfile=kwargs.get('metrics_textfile'),
+            profile_dir=kwargs.get('profile_dir'),
+            profile_stages=kwargs.get('profile_stages'),
+            profile_top_n=kwargs.get('profile_top_n', 25),
+            profile_slowest=kwargs.get('profile_slowest'),
+            scan_latency_file=kwargs.get('scan_latency_file'),
+            scan_report_top=kwargs.get('scan_report_top', 10),
+            shard=kwargs.get('shard'),
+            catalog_output=kwargs.get('catalog_output'),
+            coordinate=kwargs.get('coordinate', True),
+            resume=kwargs.get('resume', True),
+            lease_seconds=kwargs.get('lease_seconds', 600.0),
+            notify_server=kwargs.get('notify_server'),
+            hashed_names=kwargs.get('hashed_names', False),
+            image_variants=kwargs.get('image_variants', False),
+            tile_strips=kwargs.get('tile_strips', False),
+            page_placeholders=kwargs.get('page_placeholders', False),
+            scrubber_thumbs=kwargs.get('scrubber_thumbs', False),
+            damaged_pages=kwargs.get('damaged_pages', EXCLUDE),
+            follow_symlinks=kwargs.get('follow_symlinks', NEVER)
         )
+        collect_metrics = self.config.enable_metrics or self.config.metrics_textfile
+        self.metrics = PerformanceMetrics() if collect_metrics else None
+        self.books: List[BookItem] = []
+        self.readers_generated = 0
+        self.readers_skipped = 0
+        self.readers_resumed = 0
+        self.reader_failures = 0
+        self.coordinator: Optional[RunCoordinator] = None
+        self.journal: Optional[ProgressJournal] = None
+        self.writer = OutputWriter(hashed_names=self.config.hashed_names)
+        if self.metrics:
+            # One count of the files for the summary, the metrics and the batch results
+            self.metrics.writes = self.writer.stats
+        self.notifier = None
+        if self.config.notify_server:
+            self.notifier = ServerNotifier(self.config.notify_server, self.config.base_path)
+        self.scan_latency = None
+        if self.config.enable_metrics or self.config.scan_latency_file:
+            self.scan_latency = DirectoryLatencyRecorder()
+        self.profiler = None
+        if self.config.profile_dir:
+            self.profiler = StageProfiler(
+                Path(self.config.profile_dir),
+                stages=self.config.profile_stages,
+                top_n=self.config.profile_top_n,
+                slowest_k=self.config.profile_slowest
+            )
         
         # Validation
         if not self.config.base_path.exists():
@@ -930,32 +1339,197 @@ class BookshelfGenerator:
         """Generate the complete bookshelf."""
         logger.info(f"Starting bookshelf generation for: {self.config.base_path}")
         
+        success = False
         try:
-            # Scan for books (NO LIMITS)
-            scanner = BookshelfScanner(self.config)
-            books = scanner.scan_books()
-            
-            if not books:
-                logger.warning("No books found!")
-                return None
+            if self.config.coordinate:
+                self.coordinator = RunCoordinator(self.config.base_path, self.config.lease_seconds)
+                self.coordinator.start()
+            if self.config.resume:
+                self.journal = self._open_journal()
+            with _span(self.metrics, 'run', 'run', base_path=self.config.base_path):
+                output_path = self._run()
+            success = True
             
-            # Generate index-mb.html files if requested
-            if self.config.generate_readers:
-                self._generate_readers()
-            
-            # Generate HTML bookshelf
-            generator = ModernBookshelfHTMLGenerator(books, self.config, scanner.metrics)
-            output_path = generator.generate()
+            if self.profiler:
+                self._finish_profiling()
             
             # Print performance metrics
-            if self.config.enable_metrics and scanner.metrics:
-                scanner.metrics.print_summary()
+            if self.metrics:
+                if self.config.enable_metrics:
+                    self.metrics.print_summary()
+                if self.config.trace_output:
+                    self.metrics.export_chrome_trace(Path(self.config.trace_output))
+            
+            if self.scan_latency:
+                if self.config.enable_metrics:
+                    self.scan_latency.print_report(self.config.scan_report_top)
+                if self.config.scan_latency_file:
+                    self.scan_latency.dump_jsonl(Path(self.config.scan_latency_file))
             
             return output_path
             
         except Exception as e:
             logger.error(f"Error generating bookshelf: {e}")
+            if self.metrics:
+                self.metrics.record_error('run')
             raise
+        finally:
+            # Books regenerated before a failure are stale in the server's cache too
+            if self.notifier:
+                self.notifier.flush()
+            # Kept after failures and Ctrl-C so that the next run resumes
+            if self.journal:
+                self.journal.close(completed=success,
+                                   live_owners=self.coordinator.live_owners() if self.coordinator else ())
+                self.journal = None
+            if self.coordinator:
+                self.coordinator.stop()
+                self.coordinator = None
+            # Written on failure too, so alerts can fire on failing runs
+            if self.metrics and self.config.metrics_textfile:
+                try:
+                    exporter = PrometheusTextfileExporter(Path(self.config.metrics_textfile))
+                    exporter.write(self.metrics, self.config.base_path, success)
+                except OSError as e:
+                    logger.warning(f"Failed to write Prometheus metrics: {e}")
+    
+    def _run(self) -> Optional[Path]:
+        """Scan, generate readers and write the bookshelf."""
+        # Scan for books (NO LIMITS)
+        scanner = BookshelfScanner(self.config, self.metrics, self.profiler, self.scan_latency, self.journal)
+        books = scanner.scan_books()
+        self.books = books
+        
+        # An empty shard still writes its (empty) catalog so the merge sees it
+        if not books and self.config.shard:
+            return self._write_partial_catalog(books)
+        
+        if not books:
+            logger.warning("No books found!")
+            return None
+        
+        # Generate index-mb.html files if requested
+        if self.config.generate_readers:
+            with _span(self.metrics, 'readers'):
+                self._generate_readers()
+            # Books were scanned before their readers got a (new) mode, content-hashed name or page count
+            for book in books:
+                link = ReaderFileFinder.find_reader_file(book.folder_path, self.config.base_path)
+                book.reader_link = link or book.reader_link
+                pages = _manifest_pages(read_manifest(book.folder_path))
+                book.page_count = book.page_count if pages is None else pages
+        
+        # A shard only knows its own books; the bookshelf is built by merge_catalogs()
+        if self.config.shard:
+            return self._write_partial_catalog(books)
+        
+        # Generate HTML bookshelf (one concurrent run at a time)
+        generator = ModernBookshelfHTMLGenerator(books, self.config, self.metrics, self.profiler, self.writer)
+        with self.coordinator.exclusive('bookshelf') if self.coordinator else nullcontext():
+            output_path = generator.generate()
+        if self.notifier and generator.written:
+            self.notifier.path_changed(output_path)
+        return output_path
+    
+    def _open_journal(self) -> ProgressJournal:
+        """Open the progress journal of this library (one per shard)."""
+        shard = self.config.shard
+        name = f"journal-shard-{shard.index}-of-{shard.count}.jsonl" if shard else "journal.jsonl"
+        # One file per run, so concurrent runs do not append to or delete each other's journal
+        owner = self.coordinator.owner if self.coordinator else uuid.uuid4().hex[:12]
+        journal = ProgressJournal(
+            self.config.base_path / STATE_DIR_NAME / name,
+            owner=owner,
+            fingerprint={
+                'output_filename': self.config.output_filename,
+                'generate_readers': self.config.generate_readers,
+                'hashed_names': self.config.hashed_names,
+                'image_variants': self.config.image_variants,
+                'tile_strips': self.config.tile_strips,
+                'page_placeholders': self.config.page_placeholders,
+                'scrubber_thumbs': self.config.scrubber_thumbs,
+                'damaged_pages': self.config.damaged_pages,
+                'follow_symlinks': self.config.follow_symlinks,
+                'shard': str(shard) if shard else None,
+            }
+        )
+        journal.open()
+        return journal
+    
+    def _reader_done(self, folder: Path) -> bool:
+        """Whether an interrupted earlier run already generated this reader."""
+        if not self.journal or not self.journal.lookup('reader', folder.name, _folder_mtime(folder)):
+            return False
+        self.readers_resumed += 1
+        return True
+    
+    def _journal_reader(self, folder: Path, mtime_before: float, output_path: Path):
+        """Journal a generated reader; writing it changed the folder mtime."""
+        if not self.journal:
+            return
+        mtime_after = _folder_mtime(folder)
+        self.journal.record('reader', folder.name, mtime_before, output=str(output_path),
+                            mtime_after=mtime_after)
+        self.journal.extend_mtime('scan', folder.name, mtime_after)
+    
+    def _write_partial_catalog(self, books: List[BookItem]) -> Path:
+        """Write the catalog of this shard's books."""
+        output_path = self.config.catalog_output or self.config.base_path / self.config.shard.catalog_name
+        entries = [
+            {**book.to_dict(), 'last_modified': _folder_mtime(book.folder_path)}
+            for book in books
+        ]
+        return write_partial_catalog(Path(output_path), self.config.base_path, self.config.shard, entries)
+    
+    def merge_catalogs(self, catalog_paths: List[Path], server_index: Optional[Path] = None) -> Optional[Path]:
+        """
+        Build the bookshelf and the server index from the partial catalogs of all shards.
+        
+        Args:
+            catalog_paths: Partial catalogs; empty to use every
+                ``catalog.shard-*.json`` in the library root
+            server_index: Server index to write (default: data/manga-index.json)
+            
+        Returns:
+            Path to the bookshelf, or None if the catalogs hold no books
+        """
+        if not catalog_paths:
+            catalog_paths = sorted(self.config.base_path.glob('catalog.shard-*.json'))
+        if not catalog_paths:
+            raise FileNotFoundError(f"No partial catalogs found in {self.config.base_path}")
+        
+        entries, warnings = load_partial_catalogs(catalog_paths)
+        for warning in warnings:
+            logger.warning(warning)
+        logger.info(f"Merging {len(catalog_paths)} catalogs with {len(entries)} books")
+        
+        if not entries:
+            logger.warning("No books found!")
+            return None
+        
+        self.books = [BookItem.from_dict(self.config.base_path, entry) for entry in entries]
+        generator = ModernBookshelfHTMLGenerator(self.books, self.config, self.metrics, writer=self.writer)
+        output_path = generator.generate()
+        write_server_index(entries, server_index)
+        if self.notifier:
+            if generator.written:
+                self.notifier.path_changed(output_path)
+            self.notifier.flush()
+        return output_path
+    
+    def _finish_profiling(self):
+        """Profile the sampled slowest books (if sampling) and dump all profiles."""
+        if self.profiler.sampling:
+            self.profiler.replay_slowest(self._replay_book)
+        self.profiler.dump()
+    
+    def _replay_book(self, book: str):
+        """Re-run the per-book stages of one book under the profiler."""
+        folder = Path(book)
+        BookshelfScanner(self.config, profiler=self.profiler)._analyze_book_folder(folder)
+        if self.config.generate_readers:
+            from htmlcmb_v3 import MangaReaderGenerator
+            MangaReaderGenerator(folder, profiler=self.profiler).generate()
     
     def _generate_readers(self):
         """Generate index-mb.html files for all manga."""
@@ -963,25 +1537,297 @@ class BookshelfGenerator:
         try:            
             from htmlcmb_v3 import MangaReaderGenerator
             
-            subdirs = [d for d in self.config.base_path.iterdir() if d.is_dir()]
+            subdirs = sorted(d for d in self.config.base_path.iterdir() if d.is_dir() and d.name != STATE_DIR_NAME)
+            if self.config.shard:
+                subdirs = [d for d in subdirs if self.config.shard.owns(d.name)]
             logger.info(f"Generating readers for {len(subdirs)} manga...")
             
+            subdirs = [d for d in subdirs if not self._reader_done(d)]
+            
+            # Profiling needs the stages to run in this process
+            if self.config.reader_jobs > 1 and not self.profiler:
+                self._generate_readers_parallel(subdirs)
+                return
+            
             for i, folder in enumerate(subdirs, 1):
+                if not self._claim_book(str(folder)):
+                    continue
+                mtime_before = _folder_mtime(folder)
                 try:
                     if i % 50 == 0:  # Progress indicator
                         logger.info(f"Generated readers for {i}/{len(subdirs)} manga...")
-                    generator = MangaReaderGenerator(folder)
-                    generator.generate()
+                    with _span(self.metrics, folder.name, 'book'):
+                        generator = MangaReaderGenerator(folder, tracer=self.metrics, profiler=self.profiler,
+                                                         scan_recorder=self.scan_latency, writer=self.writer,
+                                                         variants=self.config.image_variants,
+                                                         tiles=self.config.tile_strips,
+                                                         placeholders=self.config.page_placeholders,
+                                                         scrubber=self.config.scrubber_thumbs,
+                                                         page_check=self.config.damaged_pages,
+                                                         symlinks=self.config.follow_symlinks)
+                        output_path = generator.generate()
+                    self.readers_generated += 1
+                    self._journal_reader(folder, mtime_before, output_path)
+                    if self.notifier and generator.written:
+                        self.notifier.book_changed(folder, output_path)
+                    if self.coordinator:
+                        self.coordinator.complete(folder.name)
+                    if self.metrics and generator.written:
+                        self.metrics.readers_regenerated += 1
                 except Exception as e:
                     logger.warning(f"Failed to generate reader for {folder}: {e}")
+                    self.reader_failures += 1
+                    if self.coordinator:
+                        self.coordinator.release(folder.name)
+                    if self.metrics:
+                        self.metrics.record_error('reader')
                     
-            logger.info(f"Completed reader generation for {len(subdirs)} manga")
+            self._log_readers_done(len(subdirs))
         except ImportError as e:
             logger.warning(f"htmlcmb_v3.py not found - skipping reader generation: {e}")
+    
+    def _generate_readers_parallel(self, subdirs: List[Path]):
+        """
+        Generate readers in worker processes.
+        
+        Workers cannot share the metrics object, so their totals, errors and
+        directory listings are merged back, and each book's duration becomes a
+        span (on the worker's own row of the trace) without sub-stages.
+        """
+        from htmlcmb_v3 import run_batch
+        
+        mtimes = {str(folder): _folder_mtime(folder) for folder in subdirs}
+        
+        def on_result(result):
+            if result.status == 'skipped':
+                return
+            name = Path(result.path).name
+            if self.scan_latency:
+                self.scan_latency.extend(result.listings)
+            if self.metrics:
+                self.metrics.record_span(Path(result.path).name, 'book', result.seconds, thread_id=result.worker)
+            if result.status == 'ok':
+                self.readers_generated += 1
+                self.writer.merge(WriteStats(result.files_written, result.files_unchanged, result.bytes_written))
+                self._journal_reader(Path(result.path), mtimes[result.path], Path(result.output))
+                if self.notifier and result.written:
+                    self.notifier.book_changed(Path(result.path), Path(result.output))
+                if self.coordinator:
+                    self.coordinator.complete(name)
+                if self.metrics and result.written:
+                    self.metrics.readers_regenerated += 1
+            else:
+                logger.warning(f"Failed to generate reader for {result.path}: {result.error}")
+                self.reader_failures += 1
+                if self.coordinator:
+                    self.coordinator.release(name)
+                if self.metrics:
+                    self.metrics.record_error('reader')
+        
+        run_batch(subdirs, self.config.reader_jobs, record_scan=self.scan_latency is not None,
+                  claim=self._claim_book, on_result=on_result, hashed_names=self.config.hashed_names,
+                  variants=self.config.image_variants, tiles=self.config.tile_strips,
+                  placeholders=self.config.page_placeholders, scrubber=self.config.scrubber_thumbs,
+                  page_check=self.config.damaged_pages, symlinks=self.config.follow_symlinks)
+        self._log_readers_done(len(subdirs))
+    
+    def _claim_book(self, path: str) -> bool:
+        """Claim a book for reader generation when coordinating with other runs."""
+        if self.coordinator is None or self.coordinator.claim(Path(path).name):
+            return True
+        self.readers_skipped += 1
+        return False
+    
+    def _log_readers_done(self, total: int):
+        message = f"Completed reader generation for {total} manga"
+        if self.readers_skipped:
+            message += f" ({self.readers_skipped} handled by a concurrent run)"
+        if self.readers_resumed:
+            message += f" ({self.readers_resumed} already done before the interruption)"
+        logger.info(message)
+
 
+def _env_flag(name: str) -> bool:
+    """Whether a boolean environment option is set (1/true/yes)."""
+    return os.environ.get(name, '').strip().lower() in ('1', 'true', 'yes')
 
-def main():
-    """Command-line interface."""
+
+def _library_path(template: Optional[str], library: Path, multiple: bool) -> Optional[str]:
+    """Expand ``{name}`` in a per-run output path; required with several roots."""
+    if not template:
+        return None
+    if multiple and '{name}' not in template:
+        raise ValueError(f"Output path needs a {{name}} placeholder with several libraries: {template}")
+    return template.replace('{name}', library.name)
+
+
+def batch_main(argv: List[str]) -> int:
+    """Non-interactive entry point; returns the process exit status."""
+    parser = argparse.ArgumentParser(
+        prog='htmlcs_v4.py',
+        description="Generate bookshelves (and readers) for one or more manga libraries. "
+                    "Run without arguments for the interactive prompt."
+    )
+    parser.add_argument('libraries', nargs='+', help="Manga collection roots")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="Worker processes for reader generation (default: number of CPUs)")
+    parser.add_argument('--no-readers', action='store_true', help="Only write the bookshelf")
+    parser.add_argument('-o', '--output-name', default='index.html',
+                        help="Bookshelf file name (default: index.html)")
+    parser.add_argument('--json', metavar='FILE',
+                        help="Write machine-readable results to FILE ('-' for stdout)")
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="Only log warnings and errors; no summary reports")
+    parser.add_argument('--trace', metavar='FILE', help="Chrome trace output (like MANGA_TRACE_FILE)")
+    parser.add_argument('--prom-textfile', metavar='FILE',
+                        help="Prometheus textfile output (like MANGA_PROM_TEXTFILE)")
+    parser.add_argument('--profile-dir', metavar='DIR', help="Per-stage profiles (like MANGA_PROFILE_DIR)")
+    parser.add_argument('--profile-stages', metavar='STAGES', help="Comma-separated stages to profile")
+    parser.add_argument('--profile-slowest', type=int, metavar='K', help="Only profile the K slowest books")
+    parser.add_argument('--scan-latency-file', metavar='FILE',
+                        help="Directory latency JSONL (like MANGA_SCAN_LATENCY_FILE)")
+    parser.add_argument('--shard', metavar='I/N',
+                        help="Only process shard I of N (0-based); writes a partial catalog instead "
+                             "of the bookshelf")
+    parser.add_argument('--catalog', metavar='FILE',
+                        help="Partial catalog path in shard mode (default: catalog.shard-I-of-N.json "
+                             "in the library)")
+    parser.add_argument('--merge', nargs='*', metavar='CATALOG',
+                        help="Build the bookshelf and server index from partial catalogs "
+                             "(default: all catalog.shard-*.json in the library)")
+    parser.add_argument('--no-coordinate', action='store_true',
+                        help="Do not split books with concurrent runs on the same library")
+    parser.add_argument('--no-resume', action='store_true',
+                        help="Ignore and do not write the progress journal of interrupted runs")
+    parser.add_argument('--server-index', metavar='FILE',
+                        help="Server index written by --merge (default: manga-server/data/manga-index.json)")
+    parser.add_argument('--notify-server', metavar='ADDRESS',
+                        help="Tell the running server which books changed: port, http://127.0.0.1:PORT "
+                             "or unix:SOCKET (like MANGA_NOTIFY_SERVER)")
+    parser.add_argument('--hashed-names', action='store_true',
+                        help="Write content-hashed reader copies and link them from the bookshelf, "
+                             "for immutable HTTP caching (like MANGA_HASHED_NAMES=1)")
+    parser.add_argument('--variants', action='store_true',
+                        help="Make responsive width variants of the pages for the readers' srcset; "
+                             "needs Pillow (like MANGA_IMAGE_VARIANTS=1)")
+    parser.add_argument('--tiles', action='store_true',
+                        help="Cut tall strips (webtoon pages) into tiles that phones decode quickly; "
+                             "needs Pillow (like MANGA_TILE_STRIPS=1)")
+    parser.add_argument('--placeholders', action='store_true',
+                        help="Show each page's average colors while it loads, stored in the readers and "
+                             "the manifest; needs Pillow (like MANGA_PAGE_PLACEHOLDERS=1)")
+    parser.add_argument('--scrubber', action='store_true',
+                        help="Pack page thumbnails into sprite strips that the progress slider previews "
+                             "while dragging; needs Pillow (like MANGA_SCRUBBER_THUMBS=1)")
+    parser.add_argument('--damaged-pages', choices=CHECK_MODES,
+                        default=env_check_mode(),
+                        help="Truncated or misnamed images: leave them out of the readers, flag them, or "
+                             "skip the check (default: exclude, or MANGA_DAMAGED_PAGES)")
+    parser.add_argument('--follow-symlinks', choices=SYMLINK_MODES,
+                        default=env_symlink_mode(),
+                        help="Symlinked folders to scan: none, those pointing inside the book, or all; "
+                             "loops and duplicate files are skipped either way "
+                             "(default: never, or MANGA_FOLLOW_SYMLINKS)")
+    args = parser.parse_args(argv)
+    
+    try:
+        shard = ShardSpec.parse(args.shard) if args.shard else None
+    except ValueError as e:
+        parser.error(str(e))
+    if shard and args.merge is not None:
+        parser.error("--shard and --merge cannot be combined")
+    
+    if args.quiet:
+        logging.getLogger().setLevel(logging.WARNING)
+    # Reports go to stdout, which is reserved for the JSON results here
+    show_reports = not args.quiet and args.json != '-'
+    
+    libraries = [Path(library.strip('\'"')) for library in args.libraries]
+    multiple = len(libraries) > 1
+    results = []
+    start = time.perf_counter()
+    
+    for library in libraries:
+        library_start = time.perf_counter()
+        result = {'library': str(library), 'status': 'error', 'output': None, 'books': 0,
+                  'readers_generated': 0, 'readers_skipped': 0, 'readers_resumed': 0, 'reader_failures': 0,
+                  'files_written': 0, 'files_unchanged': 0, 'seconds': 0.0, 'error': None}
+        try:
+            generator = BookshelfGenerator(
+                library,
+                generate_readers=not args.no_readers,
+                output_filename=args.output_name,
+                reader_jobs=args.jobs,
+                enable_metrics=show_reports,
+                trace_output=_library_path(args.trace, library, multiple),
+                metrics_textfile=_library_path(args.prom_textfile, library, multiple),
+                profile_dir=_library_path(args.profile_dir, library, multiple),
+                profile_stages=set(args.profile_stages.split(',')) if args.profile_stages else None,
+                profile_slowest=args.profile_slowest,
+                scan_latency_file=_library_path(args.scan_latency_file, library, multiple),
+                shard=shard,
+                catalog_output=_library_path(args.catalog, library, multiple),
+                coordinate=not args.no_coordinate,
+                resume=not args.no_resume,
+                notify_server=args.notify_server or os.environ.get('MANGA_NOTIFY_SERVER') or None,
+                hashed_names=args.hashed_names or _env_flag('MANGA_HASHED_NAMES'),
+                image_variants=args.variants or _env_flag('MANGA_IMAGE_VARIANTS'),
+                tile_strips=args.tiles or _env_flag('MANGA_TILE_STRIPS'),
+                page_placeholders=args.placeholders or _env_flag('MANGA_PAGE_PLACEHOLDERS'),
+                scrubber_thumbs=args.scrubber or _env_flag('MANGA_SCRUBBER_THUMBS'),
+                damaged_pages=args.damaged_pages,
+                follow_symlinks=args.follow_symlinks
+            )
+            if args.merge is not None:
+                output_path = generator.merge_catalogs(
+                    [Path(p) for p in args.merge],
+                    _library_path(args.server_index, library, multiple)
+                )
+            else:
+                output_path = generator.generate()
+            result.update(
+                status='ok' if output_path else 'empty',
+                output=str(output_path) if output_path else None,
+                books=len(generator.books),
+                readers_generated=generator.readers_generated,
+                readers_skipped=generator.readers_skipped,
+                readers_resumed=generator.readers_resumed,
+                files_written=generator.writer.stats.written,
+                files_unchanged=generator.writer.stats.unchanged,
+                reader_failures=generator.reader_failures
+            )
+        except Exception as e:
+            logger.error(f"Failed to generate bookshelf for {library}: {e}")
+            result['error'] = f"{type(e).__name__}: {e}"
+        result['seconds'] = time.perf_counter() - library_start
+        results.append(result)
+    
+    failed = [r for r in results if r['status'] == 'error']
+    summary = {
+        'libraries': len(results),
+        'succeeded': len(results) - len(failed),
+        'failed': len(failed),
+        'jobs': args.jobs,
+        'seconds': time.perf_counter() - start,
+        'results': results,
+    }
+    
+    if args.json == '-':
+        json.dump(summary, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    
+    return 1 if failed else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line interface: batch mode with arguments, interactive prompt without."""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        return batch_main(argv)
+    
     print("Enhanced Manga Bookshelf Generator V4")
     print("=" * 50)
     
@@ -1011,12 +1857,30 @@ def main():
                 output_name = "index.html"
                 print("Using default: index.html")
             
+            # Profiling is configured from the environment to keep the prompts short
+            profile_stages = os.environ.get('MANGA_PROFILE_STAGES')
+            profile_slowest = os.environ.get('MANGA_PROFILE_SLOWEST')
+            
             # Generate bookshelf
             generator = BookshelfGenerator(
                 path_input,
                 generate_readers=generate_readers,
                 output_filename=output_name,
-                enable_metrics=True
+                enable_metrics=True,
+                trace_output=os.environ.get('MANGA_TRACE_FILE') or None,
+                metrics_textfile=os.environ.get('MANGA_PROM_TEXTFILE') or None,
+                profile_dir=os.environ.get('MANGA_PROFILE_DIR') or None,
+                profile_stages=set(profile_stages.split(',')) if profile_stages else None,
+                profile_slowest=int(profile_slowest) if profile_slowest else None,
+                scan_latency_file=os.environ.get('MANGA_SCAN_LATENCY_FILE') or None,
+                notify_server=os.environ.get('MANGA_NOTIFY_SERVER') or None,
+                hashed_names=_env_flag('MANGA_HASHED_NAMES'),
+                image_variants=_env_flag('MANGA_IMAGE_VARIANTS'),
+                tile_strips=_env_flag('MANGA_TILE_STRIPS'),
+                page_placeholders=_env_flag('MANGA_PAGE_PLACEHOLDERS'),
+                scrubber_thumbs=_env_flag('MANGA_SCRUBBER_THUMBS'),
+                damaged_pages=env_check_mode(),
+                follow_symlinks=env_symlink_mode()
             )
             
             output_path = generator.generate()
@@ -1036,7 +1900,9 @@ def main():
         except Exception as e:
             logger.error(f"Unexpected error: {e}")
             print(f"\nUnexpected error occurred: {e}")
+    
+    return 0
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Tall Strip Tiling
+
+Optional stage that cuts webtoon strips (pages many times taller than wide,
+e.g. 800x30000px) into fixed-height tiles, because phones decode such
+images slowly or not at all:
+- Strips are found from header dimensions (``image_probe``), no decoding
+- Needs Pillow; without it the stage is skipped and readers use the strips
+- Tiles of ``TILE_HEIGHT`` source pixels, in the page's own format; a short
+  remainder is merged into the last tile
+- Cut in a process pool; tiles are named by the source's content hash and
+  the tile height, so unchanged strips are never cut twice
+- Stored in the book's ``.manga-gen/tiles`` folder and pruned when no page
+  references them any more; the readers stack the tiles without gaps
+
+Author: mastersamasama
+Version: 1.0
+"""
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from image_variants import DERIVED_DIR, FORMATS, Image, open_page, save_image
+
+
+logger = logging.getLogger(__name__)
+
+
+TILES_DIR = 'tiles'
+
+# Pages at least this many times taller than wide are strips
+MIN_ASPECT = 4.0
+# Source pixels per tile: well within what phones decode quickly
+TILE_HEIGHT = 2048
+# A remainder shorter than this share of a tile is added to the last tile
+MIN_LAST_TILE = 0.25
+# Tiles replace the page at full size, so lossy formats keep more detail than variants
+TILE_QUALITY = 90
+
+# url -> (width of the page, [(tile url, tile height, bytes), ...] top to bottom)
+Tiles = Dict[str, Tuple[int, List[Tuple[str, int, int]]]]
+
+
+def available() -> bool:
+    """Whether Pillow is installed."""
+    return Image is not None
+
+
+def tiles_dir(book_path: Path) -> Path:
+    return Path(book_path) / DERIVED_DIR / TILES_DIR
+
+
+def is_strip(width: int, height: int) -> bool:
+    """Whether a page is tall enough to be tiled."""
+    return width > 0 and height >= width * MIN_ASPECT and height > TILE_HEIGHT
+
+
+def tile_heights(height: int) -> List[int]:
+    """Heights of the tiles of a page, top to bottom."""
+    heights = [TILE_HEIGHT] * (height // TILE_HEIGHT)
+    remainder = height - sum(heights)
+    if remainder and heights and remainder < TILE_HEIGHT * MIN_LAST_TILE:
+        heights[-1] += remainder
+    elif remainder:
+        heights.append(remainder)
+    return heights
+
+
+def tile_name(digest: str, index: int, suffix: str) -> str:
+    """``<source hash>-<tile height>h-<index><suffix>``, e.g. ``3f2a...-2048h-0.png``."""
+    return f"{digest}-{TILE_HEIGHT}h-{index}{suffix.lower()}"
+
+
+def _cut(source: str, targets: List[Tuple[int, int, str]]) -> List[str]:
+    """Write the tiles of one page (runs in a worker process)."""
+    image_format = FORMATS[Path(source).suffix.lower()]
+    written = []
+    with open_page(source) as image:
+        for top, height, path in targets:
+            save_image(image.crop((0, top, image.width, top + height)), path, image_format, TILE_QUALITY)
+            written.append(path)
+    return written
+
+
+def build_tiles(book_path: Path, pages: Dict[str, Tuple[str, Tuple[int, int]]],
+                workers: Optional[int] = None) -> Tiles:
+    """
+    Make the missing tiles of a book's strips and drop unreferenced ones.
+
+    Args:
+        book_path: Book folder
+        pages: url (relative to the book) -> (content hash, (width, height))
+            of every page; only strips are tiled
+        workers: Worker processes (default: number of CPUs)
+
+    Returns:
+        The tiles of every strip (see ``Tiles``)
+    """
+    if Image is None:
+        logger.info("Pillow is not installed; skipping strip tiling")
+        return {}
+
+    book_path = Path(book_path)
+    out_dir = tiles_dir(book_path)
+    prefix = out_dir.relative_to(book_path).as_posix()
+    planned: Dict[str, Tuple[int, List[Tuple[str, int, Path]]]] = {}
+    missing: Dict[str, List[Tuple[int, int, str]]] = {}
+    for url, (digest, (width, height)) in pages.items():
+        suffix = Path(url).suffix.lower()
+        if not digest or suffix not in FORMATS or not is_strip(width, height):
+            continue
+        tiles = []
+        top = 0
+        for index, tile_height in enumerate(tile_heights(height)):
+            path = out_dir / tile_name(digest, index, suffix)
+            tiles.append((f"{prefix}/{path.name}", tile_height, path))
+            if not path.exists():
+                missing.setdefault(url, []).append((top, tile_height, str(path)))
+            top += tile_height
+        planned[url] = (width, tiles)
+
+    failed = set()
+    if missing:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            futures = {executor.submit(_cut, str(book_path / url), targets): url
+                       for url, targets in missing.items()}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.warning(f"Cannot tile {book_path / url}: {e}")
+                    failed.add(url)
+        logger.info(f"Tiled {len(missing) - len(failed)} strips ({len(failed)} failed)")
+
+    result: Tiles = {}
+    for url, (width, tiles) in planned.items():
+        if url in failed:
+            continue
+        try:
+            result[url] = (width, [(tile_url, height, os.path.getsize(path)) for tile_url, height, path in tiles])
+        except OSError as e:
+            logger.warning(f"Missing tile of {book_path / url}: {e}")
+    _prune(out_dir, {tile_url.rsplit('/', 1)[-1] for _, tiles in result.values() for tile_url, _, _ in tiles})
+    return result
+
+
+def _prune(out_dir: Path, keep: set):
+    """Remove tiles (and temp files of interrupted runs) no page references."""
+    try:
+        entries = list(os.scandir(out_dir))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.is_file() and entry.name not in keep:
+            try:
+                os.unlink(entry.path)
+            except OSError as e:
+                logger.warning(f"Cannot remove stale tile {entry.path}: {e}")
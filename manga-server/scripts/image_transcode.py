@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""
+Library Image Transcoder
+
+Command that converts the lossless page scans of a library to WebP (and AVIF
+when Pillow can write it), which are often several times smaller:
+- Pages are listed by the reader generator's scan and hashed with the
+  offline cache's content hashes (only changed pages are read again)
+- Encoded in a process pool; copies are named by the source's content hash,
+  so an unchanged page is never encoded twice
+- The originals are kept; the WebP copy replaces a page only if it saves at
+  least ``MIN_SAVING`` of the page's bytes
+- Not every browser decodes AVIF, so an AVIF copy is never a page's only
+  source: it is offered next to the WebP copy (or the original) through
+  ``<picture>``, if it saves ``MIN_SAVING`` of what that fallback weighs
+- Each book records its copies in ``.manga-gen/transcoded.json``, which the
+  readers use to load the copy instead of the original
+- Safe to interrupt: copies are renamed into place once complete and a
+  resumed run picks up every finished one without encoding it again
+- Reports bytes saved and throughput, and regenerates the changed readers
+
+Usage:
+    python image_transcode.py ./本
+    python image_transcode.py ./本 --jpeg --no-readers
+
+Author: mastersamasama
+Version: 1.0
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # Optional dependency
+    Image = None
+
+from image_variants import DERIVED_DIR
+from offline_cache import hash_pages
+from output_writer import write_atomic
+from page_check import env_mode as env_check_mode
+from safe_walk import env_mode as env_symlink_mode
+
+
+logger = logging.getLogger(__name__)
+
+
+TRANSCODE_DIR = 'transcoded'
+MAP_NAME = 'transcoded.json'
+MAP_VERSION = 2
+
+# Lossless scans gain the most; JPEG pages only with --jpeg (lossy to lossy)
+SOURCE_SUFFIXES = ('.png', '.bmp')
+JPEG_SUFFIXES = ('.jpg', '.jpeg')
+WEBP_QUALITY = 85
+AVIF_QUALITY = 60
+# A copy must be at least this much smaller than the original to be used
+MIN_SAVING = 0.1
+
+_SUFFIXES = {'WEBP': '.webp', 'AVIF': '.avif'}
+
+
+def available_formats() -> List[str]:
+    """Formats this Pillow can write, smallest output first ([] without Pillow)."""
+    if Image is None:
+        return []
+    try:
+        import pillow_avif  # noqa: F401 (registers AVIF on Pillow < 11.2)
+    except ImportError:
+        pass
+    Image.init()
+    return [image_format for image_format in ('AVIF', 'WEBP') if image_format in Image.SAVE]
+
+
+def map_path(book_path: Path) -> Path:
+    return Path(book_path) / DERIVED_DIR / MAP_NAME
+
+
+def read_transcode_map(book_path: Path) -> Dict[str, Dict]:
+    """
+    The transcoded copies of a book's pages ({} if it has none).
+
+    Every src (relative to the book) maps to ``hash``, ``size`` and ``mtime``
+    of the source, the WebP copy's ``file`` (relative to ``.manga-gen``, None
+    if it was not smaller) and ``bytes``, the AVIF copy offered next to it as
+    ``avif`` and ``avif_bytes`` (if any), and the ``formats`` tried.
+    """
+    try:
+        with open(map_path(book_path), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable transcode map in {book_path}: {e}")
+        return {}
+    if not isinstance(data, dict) or data.get('version') != MAP_VERSION:
+        return {}
+    return data.get('pages', {})
+
+
+def transcoded_pages(book_path: Path, pages: Dict[str, int],
+                     records: Optional[Dict[str, Dict]] = None) -> Dict[str, Tuple[str, int]]:
+    """
+    URL and bytes of the copy the readers load instead of each page.
+
+    A copy is only used while its source has the size and mtime it was
+    transcoded from, so a replaced page shows up until the next run.
+
+    Args:
+        book_path: Book folder
+        pages: src (relative to the book) -> bytes of every page
+        records: ``read_transcode_map()`` result, if already read
+    """
+    return _current_copies(book_path, pages, 'file', 'bytes', records)
+
+
+def avif_pages(book_path: Path, pages: Dict[str, int],
+               records: Optional[Dict[str, Dict]] = None) -> Dict[str, Tuple[str, int]]:
+    """
+    URL and bytes of the AVIF copy offered next to each page (as ``transcoded_pages``).
+
+    Readers must keep the page's transcoded copy or original as the fallback.
+    """
+    return _current_copies(book_path, pages, 'avif', 'avif_bytes', records)
+
+
+def _current_copies(book_path: Path, pages: Dict[str, int], file_key: str, bytes_key: str,
+                    records: Optional[Dict[str, Dict]]) -> Dict[str, Tuple[str, int]]:
+    records = read_transcode_map(book_path) if records is None else records
+    result = {}
+    for src, size in pages.items():
+        record = records.get(src)
+        if not record or not record.get(file_key) or record.get('size') != size:
+            continue
+        try:
+            if os.stat(Path(book_path) / src).st_mtime_ns != record.get('mtime'):
+                continue
+        except OSError:
+            continue
+        url = f"{DERIVED_DIR}/{record[file_key]}"
+        if (Path(book_path) / url).is_file():
+            result[src] = (url, record[bytes_key])
+    return result
+
+
+def _encode(source: str, targets: List[Tuple[str, str]]) -> List[Tuple[str, int]]:
+    """
+    Write the copies of one page (runs in a worker process).
+
+    Each copy is written to a temp name and renamed, so an interrupted run
+    never leaves a truncated copy under its final name.
+    """
+    written = []
+    with Image.open(source) as image:
+        image.load()
+        if image.mode not in ('RGB', 'RGBA'):
+            transparent = image.mode in ('LA', 'PA', 'RGBa') or 'transparency' in image.info
+            image = image.convert('RGBA' if transparent else 'RGB')
+        for image_format, path in targets:
+            temp = f"{path}.tmp{os.getpid()}"
+            if image_format == 'AVIF':
+                image.save(temp, 'AVIF', quality=AVIF_QUALITY)
+            else:
+                image.save(temp, 'WEBP', quality=WEBP_QUALITY, method=6)
+            os.replace(temp, path)
+            written.append((image_format, os.path.getsize(path)))
+    return written
+
+
+@dataclass
+class TranscodeStats:
+    """What a run did, for the report and ``--json``."""
+    books: int = 0
+    books_changed: int = 0
+    pages: int = 0  # Candidate pages (lossless sources)
+    encoded: int = 0  # Pages encoded in this run
+    cached: int = 0  # Pages whose copies were already recorded or on disk
+    failed: int = 0
+    source_bytes: int = 0  # Of every candidate page
+    used_bytes: int = 0  # What the readers now load for them (WebP copy or original)
+    avif: int = 0  # Pages with an AVIF copy for the browsers that decode it
+    avif_bytes: int = 0  # What those browsers load (AVIF copy where there is one)
+    encoded_source_bytes: int = 0  # Source bytes of the pages encoded in this run
+    seconds: float = 0.0
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.source_bytes - self.used_bytes
+
+    def to_dict(self) -> Dict:
+        return {**asdict(self), 'saved_bytes': self.saved_bytes}
+
+
+class LibraryTranscoder:
+    """Transcodes the pages of many books with one worker pool."""
+
+    def __init__(self, formats: Optional[List[str]] = None, jobs: Optional[int] = None,
+                 include_jpeg: bool = False):
+        """
+        Args:
+            formats: Output formats (default: every format Pillow can write)
+            jobs: Worker processes (default: number of CPUs)
+            include_jpeg: Also transcode JPEG pages
+        """
+        self.formats = formats if formats is not None else available_formats()
+        self.jobs = jobs or os.cpu_count() or 1
+        self.suffixes = SOURCE_SUFFIXES + (JPEG_SUFFIXES if include_jpeg else ())
+        self.stats = TranscodeStats()
+        self.changed: List[Path] = []  # Books whose readers should load different files
+
+    def run(self, books: List[Path]) -> TranscodeStats:
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            for i, book in enumerate(books, 1):
+                try:
+                    if self.transcode_book(book, executor):
+                        self.changed.append(book)
+                except OSError as e:
+                    logger.error(f"Cannot transcode {book}: {e}")
+                self.stats.books += 1
+                if i % 10 == 0:
+                    self._log_progress(i, len(books), time.perf_counter() - start)
+        self.stats.books_changed = len(self.changed)
+        self.stats.seconds = time.perf_counter() - start
+        return self.stats
+
+    def transcode_book(self, book_path: Path, executor: ProcessPoolExecutor) -> bool:
+        """
+        Make the missing copies of a book and record them.
+
+        Returns:
+            True if the readers of the book should use different files
+        """
+        from htmlcmb_v3 import FileSystemScanner
+
+        book_path = Path(book_path)
+        scanner = FileSystemScanner(book_path, symlinks=env_symlink_mode())
+        _, image_files = scanner.scan_directory()
+        pages = [(path.relative_to(book_path).as_posix(), scanner.sizes[path]) for path in image_files
+                 if path.suffix.lower() in self.suffixes]
+        previous = read_transcode_map(book_path)
+        if not pages and not previous:
+            return False
+
+        hashes = hash_pages(book_path, pages, known=previous)
+        out_dir = book_path / DERIVED_DIR / TRANSCODE_DIR
+        tried = ','.join(sorted(self.formats))
+        records: Dict[str, Dict] = {}
+        missing: Dict[str, List[Tuple[str, str]]] = {}
+        for src, size in pages:
+            digest, mtime = hashes[src]
+            if not digest:
+                continue
+            record = previous.get(src)
+            if record and record.get('hash') == digest and record.get('formats') == tried:
+                records[src] = {**record, 'size': size, 'mtime': mtime}
+                continue
+            records[src] = {'hash': digest, 'size': size, 'mtime': mtime, 'formats': tried}
+            targets = [(image_format, str(out_dir / f"{digest}{_SUFFIXES[image_format]}"))
+                       for image_format in self.formats]
+            missing[src] = [(image_format, path) for image_format, path in targets if not os.path.exists(path)]
+
+        encoded = set()
+        work = {src: targets for src, targets in missing.items() if targets}
+        if work:
+            out_dir.mkdir(parents=True, exist_ok=True)
+            futures = {executor.submit(_encode, str(book_path / src), targets): src for src, targets in work.items()}
+            for future in as_completed(futures):
+                src = futures[future]
+                try:
+                    future.result()
+                    encoded.add(src)
+                except Exception as e:
+                    logger.warning(f"Cannot transcode {book_path / src}: {e}")
+                    del records[src]
+                    self.stats.failed += 1
+
+        for src in missing:
+            if src in records:
+                self._choose(records[src], out_dir)
+
+        for src, size in pages:
+            record = records.get(src)
+            if record is None:
+                continue
+            self.stats.pages += 1
+            self.stats.source_bytes += size
+            self.stats.used_bytes += record['bytes'] if record.get('file') else size
+            if record.get('avif'):
+                self.stats.avif += 1
+            self.stats.avif_bytes += record.get('avif_bytes') or (record['bytes'] if record.get('file') else size)
+            if src in encoded:
+                self.stats.encoded += 1
+                self.stats.encoded_source_bytes += size
+            else:
+                self.stats.cached += 1
+
+        # The map goes first: a copy is only removed once no record uses it
+        self._write_map(book_path, records)
+        _prune(out_dir, {record[key].rsplit('/', 1)[-1] for record in records.values()
+                         for key in ('file', 'avif') if record.get(key)})
+        return ({src: (r.get('file'), r.get('avif')) for src, r in records.items()}
+                != {src: (r.get('file'), r.get('avif')) for src, r in previous.items()})
+
+    def _choose(self, record: Dict, out_dir: Path):
+        """Record the copies of a page that are worth using: WebP as its source, AVIF next to it."""
+        def copy(image_format: str) -> Optional[Tuple[str, int]]:
+            if image_format not in self.formats:
+                return None
+            name = f"{record['hash']}{_SUFFIXES[image_format]}"
+            try:
+                return f"{TRANSCODE_DIR}/{name}", os.path.getsize(out_dir / name)
+            except OSError:
+                return None
+
+        webp = copy('WEBP')
+        if webp and webp[1] <= record['size'] * (1 - MIN_SAVING):
+            record['file'], record['bytes'] = webp
+        else:
+            record['file'], record['bytes'] = None, record['size']
+        avif = copy('AVIF')
+        record.pop('avif', None)
+        record.pop('avif_bytes', None)
+        if avif and avif[1] <= record['bytes'] * (1 - MIN_SAVING):
+            record['avif'], record['avif_bytes'] = avif
+
+    @staticmethod
+    def _write_map(book_path: Path, records: Dict[str, Dict]):
+        path = map_path(book_path)
+        if not records and not path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        content = json.dumps({'version': MAP_VERSION, 'pages': records}, ensure_ascii=False,
+                             sort_keys=True, separators=(',', ':')) + '\n'
+        write_atomic(path, content.encode('utf-8'))
+
+    def _log_progress(self, done: int, total: int, elapsed: float):
+        stats = self.stats
+        rate = stats.encoded_source_bytes / elapsed / 1024 ** 2 if elapsed > 0 else 0.0
+        logger.info(f"Transcoded {done}/{total} books: {stats.encoded} pages encoded, "
+                    f"{stats.saved_bytes / 1024 ** 2:.1f} MiB saved, {rate:.1f} MiB/s")
+
+
+def _prune(out_dir: Path, keep: set):
+    """Remove copies (and temp files of interrupted runs) no page uses."""
+    try:
+        entries = list(os.scandir(out_dir))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.is_file() and entry.name not in keep:
+            try:
+                os.unlink(entry.path)
+            except OSError as e:
+                logger.warning(f"Cannot remove stale copy {entry.path}: {e}")
+
+
+def _env_flag(name: str) -> bool:
+    """Whether a boolean environment option is set (1/true/yes)."""
+    return os.environ.get(name, '').strip().lower() in ('1', 'true', 'yes')
+
+
+def print_report(stats: TranscodeStats):
+    mib = 1024 ** 2
+    print(f"\n{'='*60}")
+    print("📦 TRANSCODE REPORT")
+    print(f"{'='*60}")
+    print(f"Books:            {stats.books} ({stats.books_changed} with new copies)")
+    print(f"Pages:            {stats.pages} ({stats.encoded} encoded, {stats.cached} cached, "
+          f"{stats.failed} failed)")
+    print(f"Original size:    {stats.source_bytes / mib:.1f} MiB")
+    print(f"Size in readers:  {stats.used_bytes / mib:.1f} MiB")
+    if stats.avif:
+        print(f"With AVIF:        {stats.avif_bytes / mib:.1f} MiB ({stats.avif} pages have an AVIF copy)")
+    if stats.source_bytes:
+        print(f"Saved:            {stats.saved_bytes / mib:.1f} MiB "
+              f"({stats.saved_bytes / stats.source_bytes * 100:.1f}%)")
+    if stats.seconds > 0:
+        print(f"Throughput:       {stats.encoded / stats.seconds:.1f} pages/s, "
+              f"{stats.encoded_source_bytes / mib / stats.seconds:.1f} MiB/s of source "
+              f"({stats.seconds:.2f}s)")
+    print(f"{'='*60}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Transcode the lossless pages of manga libraries to WebP/AVIF and point the "
+                    "readers at the smaller copies. Needs Pillow."
+    )
+    parser.add_argument('libraries', nargs='+', help="Manga collection roots (every subfolder is a book)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (default: number of CPUs)")
+    parser.add_argument('--formats', metavar='FORMATS',
+                        help="Comma-separated output formats (default: avif,webp as far as available)")
+    parser.add_argument('--jpeg', action='store_true', help="Also transcode JPEG pages (lossy again)")
+    parser.add_argument('--no-readers', action='store_true',
+                        help="Do not regenerate the readers of changed books (the next generation run "
+                             "picks the copies up)")
+    parser.add_argument('--json', metavar='FILE',
+                        help="Write machine-readable results to FILE ('-' for stdout)")
+    parser.add_argument('-q', '--quiet', action='store_true', help="Only log warnings and errors")
+    args = parser.parse_args(argv)
+
+    # Imported first: it configures logging, which --quiet then overrides
+    from htmlcmb_v3 import expand_books, run_batch
+
+    if args.quiet:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    writable = available_formats()
+    if not writable:
+        print("Pillow with WebP support is required: pip install Pillow", file=sys.stderr)
+        return 1
+    formats = writable
+    if args.formats:
+        formats = [name.strip().upper() for name in args.formats.split(',') if name.strip()]
+        unknown = [name for name in formats if name not in _SUFFIXES]
+        if unknown:
+            parser.error(f"Unknown formats: {', '.join(unknown)}")
+        unavailable = [name for name in formats if name not in writable]
+        if unavailable:
+            parser.error(f"Pillow cannot write {', '.join(unavailable)} here")
+
+    try:
+        books = expand_books([], args.libraries)
+    except NotADirectoryError as e:
+        parser.error(str(e))
+
+    logger.info(f"Transcoding {len(books)} books to {', '.join(formats)} with {args.jobs} jobs...")
+    transcoder = LibraryTranscoder(formats, args.jobs, include_jpeg=args.jpeg)
+    stats = transcoder.run(books)
+
+    failed_readers = []
+    if transcoder.changed and not args.no_readers:
+        logger.info(f"Regenerating readers of {len(transcoder.changed)} books...")
+        results = run_batch(transcoder.changed, args.jobs,
+                            hashed_names=_env_flag('MANGA_HASHED_NAMES'),
+                            variants=_env_flag('MANGA_IMAGE_VARIANTS'),
+                            tiles=_env_flag('MANGA_TILE_STRIPS'),
+                            placeholders=_env_flag('MANGA_PAGE_PLACEHOLDERS'),
+                            scrubber=_env_flag('MANGA_SCRUBBER_THUMBS'),
+                            page_check=env_check_mode(), symlinks=env_symlink_mode())
+        failed_readers = [r for r in results if r.status == 'error']
+        for result in failed_readers:
+            logger.error(f"Failed: {result.path}: {result.error}")
+
+    summary = {**stats.to_dict(), 'formats': formats, 'jobs': args.jobs,
+               'reader_failures': len(failed_readers)}
+    if args.json == '-':
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+    else:
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2)
+        if not args.quiet:
+            print_report(stats)
+
+    return 1 if stats.failed or failed_readers else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main())
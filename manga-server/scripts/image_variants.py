@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Responsive Image Variants
+
+Optional stage that makes narrower copies of every page, so a phone does not
+download and decode a 2500px scan to show it 720px wide:
+- Needs Pillow; without it the stage is skipped and readers use the originals
+- Widths from ``VARIANT_WIDTHS`` that are clearly narrower than the page, in
+  the page's own format (JPEG, PNG, WebP or AVIF)
+- Resized in a process pool; variants are named by the source's content
+  hash, so unchanged pages are never resized twice
+- Stored in the book's ``.manga-gen/variants`` folder (hidden folders are
+  never part of a book) and pruned when no page references them any more
+- ``srcset_attributes()`` gives the ``srcset``/``sizes`` the readers emit
+
+Author: mastersamasama
+Version: 1.0
+"""
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+try:
+    from PIL import Image
+except ImportError:  # Optional dependency
+    Image = None
+
+
+logger = logging.getLogger(__name__)
+
+
+# Per-book folder of generated images (same name as the library's run state folder)
+DERIVED_DIR = '.manga-gen'
+VARIANTS_DIR = 'variants'
+
+# Phone, tablet and small-laptop widths (px)
+VARIANT_WIDTHS = (720, 1080, 1440)
+# A variant must save at least this share of the width to be worth a file
+MIN_SHRINK = 0.85
+JPEG_QUALITY = 82
+WEBP_QUALITY = 82
+AVIF_QUALITY = 60
+
+# Pillow format of each page suffix; AVIF pages are copies made by
+# image_transcode.py, which needs the same Pillow support
+FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP', '.avif': 'AVIF'}
+
+# src -> (width of the original, [(variant url, width), ...] narrowest first)
+Variants = Dict[str, Tuple[int, List[Tuple[str, int]]]]
+
+
+def available() -> bool:
+    """Whether Pillow is installed."""
+    return Image is not None
+
+
+def variants_dir(book_path: Path) -> Path:
+    return Path(book_path) / DERIVED_DIR / VARIANTS_DIR
+
+
+def variant_name(digest: str, width: int, suffix: str) -> str:
+    """``<source hash>-<width>w<suffix>``, e.g. ``3f2a...-720w.jpg``."""
+    return f"{digest}-{width}w{suffix.lower()}"
+
+
+def srcset_attributes(src: str, entry: Tuple[int, List[Tuple[str, int]]]) -> Tuple[str, str]:
+    """
+    ``srcset`` and ``sizes`` of a page with variants.
+
+    Pages are shown at their natural width, at most the viewport's, which
+    is what ``sizes`` tells the browser before layout.
+    """
+    width, variants = entry
+    # Spaces and commas separate candidates, so the URLs are percent-encoded
+    candidates = [f"{quote(url)} {w}w" for url, w in variants] + [f"{quote(src)} {width}w"]
+    return ', '.join(candidates), f"(max-width: {width}px) 100vw, {width}px"
+
+
+def open_page(source: str):
+    """Decode a page with Pillow, in a mode its own format can be saved in."""
+    image = Image.open(source)
+    image.load()
+    if FORMATS[Path(source).suffix.lower()] == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    return image
+
+
+def save_image(image, path: str, image_format: str, quality: Optional[int] = None):
+    """
+    Save a derived image in a page format.
+
+    The file is written to a temp name and renamed, so an interrupted run
+    never leaves a truncated image under its final name.
+
+    Args:
+        quality: Lossy quality (default: this module's per-format setting)
+    """
+    temp = f"{path}.tmp{os.getpid()}"
+    if image_format == 'JPEG':
+        image.save(temp, 'JPEG', quality=quality or JPEG_QUALITY, optimize=True, progressive=True)
+    elif image_format == 'WEBP':
+        image.save(temp, 'WEBP', quality=quality or WEBP_QUALITY, method=4)
+    elif image_format == 'AVIF':
+        image.save(temp, 'AVIF', quality=quality or AVIF_QUALITY)
+    else:
+        image.save(temp, 'PNG', optimize=True)
+    os.replace(temp, path)
+
+
+def _resize(source: str, targets: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+    """Write the variants of one page (runs in a worker process)."""
+    image_format = FORMATS[Path(source).suffix.lower()]
+    written = []
+    with open_page(source) as image:
+        for width, path in targets:
+            height = max(1, round(image.height * width / image.width))
+            save_image(image.resize((width, height), Image.LANCZOS), path, image_format)
+            written.append((width, path))
+    return written
+
+
+def build_variants(book_path: Path, pages: Dict[str, Tuple[str, Tuple[int, int]]],
+                   workers: Optional[int] = None) -> Variants:
+    """
+    Make the missing variants of a book's pages and drop unreferenced ones.
+
+    Args:
+        book_path: Book folder
+        pages: src (relative to the book) -> (content hash, (width, height))
+        workers: Worker processes (default: number of CPUs)
+
+    Returns:
+        The variants of every page that has any (see ``Variants``)
+    """
+    if Image is None:
+        logger.info("Pillow is not installed; skipping responsive image variants")
+        return {}
+
+    book_path = Path(book_path)
+    out_dir = variants_dir(book_path)
+    prefix = out_dir.relative_to(book_path).as_posix()
+    planned: Dict[str, Tuple[int, List[Tuple[str, int]]]] = {}
+    missing: Dict[str, List[Tuple[int, str]]] = {}
+    for src, (digest, (width, _height)) in pages.items():
+        suffix = Path(src).suffix.lower()
+        if not digest or suffix not in FORMATS:
+            continue
+        widths = [w for w in VARIANT_WIDTHS if w <= width * MIN_SHRINK]
+        if not widths:
+            continue
+        planned[src] = (width, [(f"{prefix}/{variant_name(digest, w, suffix)}", w) for w in widths])
+        for w in widths:
+            path = out_dir / variant_name(digest, w, suffix)
+            if not path.exists():
+                missing.setdefault(src, []).append((w, str(path)))
+
+    failed = set()
+    if missing:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            futures = {executor.submit(_resize, str(book_path / src), targets): src
+                       for src, targets in missing.items()}
+            for future in as_completed(futures):
+                src = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.warning(f"Cannot make variants of {book_path / src}: {e}")
+                    failed.add(src)
+        logger.info(f"Made variants of {len(missing) - len(failed)} pages ({len(failed)} failed)")
+
+    result = {src: entry for src, entry in planned.items() if src not in failed}
+    _prune(out_dir, {url.rsplit('/', 1)[-1] for _, variants in result.values() for url, _ in variants})
+    return result
+
+
+def _prune(out_dir: Path, keep: set):
+    """Remove variants (and temp files of interrupted runs) no page references."""
+    try:
+        entries = list(os.scandir(out_dir))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.is_file() and entry.name not in keep:
+            try:
+                os.unlink(entry.path)
+            except OSError as e:
+                logger.warning(f"Cannot remove stale variant {entry.path}: {e}")
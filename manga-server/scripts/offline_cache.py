@@ -0,0 +1,576 @@
+#!/usr/bin/env python3
+"""
+Offline Page Cache
+
+Per-book files that let the readers keep pages on the device:
+- ``book-assets.json``: every chapter's pages in reading order with their
+  URL, size and content hash, so a chapter can be fetched as one exact list;
+  pages with responsive variants also list them, and "download chapter"
+  fetches the one the device's ``srcset`` picks; an AVIF copy offered next
+  to a page is fetched instead of it where the browser decodes AVIF
+- ``reader-sw.js``: a service worker scoped to the book folder that serves
+  pages cache-first and evicts the least recently used ones once the book's
+  cache is over its quota; it also downloads whole chapters on request, and
+  keeps the reader files so that a downloaded book opens offline
+- ``offline_script()``: the readers' side, registering the worker and
+  running the "download chapter" action
+- Content hashes are only recomputed for pages whose size or mtime changed
+  (in parallel); the mtimes are kept in ``.manga-gen/page-hashes.json``, so
+  the served files only change with the pages' content
+- Both served files go through ``OutputWriter``
+
+Author: mastersamasama
+Version: 1.0
+"""
+
+import hashlib
+import json
+import logging
+import os
+import textwrap
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from image_variants import DERIVED_DIR
+from output_writer import write_atomic
+
+
+logger = logging.getLogger(__name__)
+
+
+ASSETS_NAME = 'book-assets.json'
+ASSETS_VERSION = 1
+SERVICE_WORKER_NAME = 'reader-sw.js'
+HASH_CACHE_NAME = 'page-hashes.json'
+HASH_CACHE_VERSION = 1
+
+# Hex digits of a page's content hash
+PAGE_HASH_LENGTH = 16
+# Largest page cache of one book, and its share of the browser's storage quota
+BOOK_CACHE_BYTES = 512 * 1024 * 1024
+QUOTA_SHARE = 0.5
+# Parallel page downloads of "download chapter"
+DOWNLOAD_CONCURRENCY = 4
+
+_CHUNK_SIZE = 1024 * 1024
+_HASH_WORKERS = min(8, (os.cpu_count() or 1) + 4)
+
+
+def page_hash(path: Path) -> str:
+    """Content hash of a page ('' if unreadable)."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+                digest.update(chunk)
+    except OSError as e:
+        logger.warning(f"Cannot hash page {path}: {e}")
+        return ''
+    return digest.hexdigest()[:PAGE_HASH_LENGTH]
+
+
+def read_assets(book_path: Path) -> Optional[Dict]:
+    """The asset list of a book, or None if it has none (or an unusable one)."""
+    try:
+        with open(Path(book_path) / ASSETS_NAME, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable asset list in {book_path}: {e}")
+        return None
+    if not isinstance(data, dict) or data.get('version') != ASSETS_VERSION:
+        return None
+    return data
+
+
+def hash_cache_path(book_path: Path) -> Path:
+    return Path(book_path) / DERIVED_DIR / HASH_CACHE_NAME
+
+
+def _read_hash_cache(book_path: Path) -> Dict[str, list]:
+    try:
+        with open(hash_cache_path(book_path), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable page hash cache in {book_path}: {e}")
+        return {}
+    if not isinstance(data, dict) or data.get('version') != HASH_CACHE_VERSION:
+        return {}
+    return data.get('pages', {})
+
+
+def _page_mtime(path: Path) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def hash_pages(book_path: Path, pages: List[Tuple[str, int]],
+                known: Optional[Dict[str, Dict]] = None) -> Dict[str, Tuple[str, int]]:
+    """
+    Content hash and mtime (ns) of the pages of a book.
+
+    A page keeps its cached hash while its size and mtime are unchanged;
+    the others are hashed in parallel.
+
+    Args:
+        book_path: Book folder
+        pages: (url relative to the book, bytes) in reading order
+        known: More url -> {hash, size, mtime} records to reuse, e.g. of
+            pages the readers no longer load directly
+    """
+    known = dict(known or {})
+    cached = _read_hash_cache(book_path)
+    if not cached:
+        # Asset lists written before the hash cache still carry the mtimes
+        for chapter in (read_assets(book_path) or {}).get('chapters', []):
+            for asset in chapter.get('assets', []):
+                known[asset.get('url')] = asset
+    known.update((url, {'size': size, 'mtime': mtime, 'hash': digest})
+                 for url, (size, mtime, digest) in cached.items())
+
+    result = {}
+    stale = []
+    for url, size in pages:
+        mtime = _page_mtime(Path(book_path) / url)
+        previous = known.get(url)
+        if previous and previous.get('hash') and previous.get('size') == size and previous.get('mtime') == mtime:
+            result[url] = (previous['hash'], mtime)
+        else:
+            stale.append((url, mtime))
+
+    if stale:
+        with ThreadPoolExecutor(max_workers=_HASH_WORKERS) as executor:
+            digests = executor.map(lambda url: page_hash(Path(book_path) / url), [url for url, _ in stale])
+            for (url, mtime), digest in zip(stale, digests):
+                result[url] = (digest, mtime)
+        logger.info(f"Hashed {len(stale)} of {len(pages)} pages for the offline cache")
+
+    entries = dict(cached)
+    entries.update((url, [size, result[url][1], result[url][0]]) for url, size in pages if result[url][0])
+    if entries != cached:
+        # Other callers hash other files of the book; only vanished ones are dropped
+        current = {url for url, _ in pages}
+        entries = {url: entry for url, entry in entries.items()
+                   if url in current or os.path.exists(Path(book_path) / url)}
+        path = hash_cache_path(book_path)
+        content = json.dumps({'version': HASH_CACHE_VERSION, 'pages': entries}, sort_keys=True,
+                             separators=(',', ':')) + '\n'
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            write_atomic(path, content.encode('utf-8'))
+        except OSError as e:
+            logger.warning(f"Cannot save the page hash cache of {book_path}: {e}")
+    return result
+
+
+def _file_size(path: Path) -> int:
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
+
+def build_assets(book_path: Path, chapters, reading_order: List[Tuple[str, int]],
+                 hashes: Optional[Dict[str, Tuple[str, int]]] = None,
+                 tiles: Optional[Dict] = None, variants: Optional[Dict] = None,
+                 readers: Optional[List[str]] = None, avif: Optional[Dict] = None) -> Dict:
+    """
+    Asset list content: the reader's pages split at the chapters' page ranges.
+
+    Args:
+        book_path: Book folder
+        chapters: ``Chapter`` objects of the book (page numbers as in the readers)
+        reading_order: (src, bytes) of every page as rendered
+        hashes: ``hash_pages()`` result of this run, if it was already computed
+        tiles: ``image_tiles.Tiles`` of the book; a tiled page is listed as
+            its tiles, which is what the readers fetch
+        variants: ``image_variants.Variants`` of the book; a page with
+            variants gets its original ``width`` and its ``variants``
+            (narrowest first), the candidates of its ``srcset``
+        readers: Reader files of the book (relative to it), which the
+            service worker keeps for offline navigation
+        avif: AVIF copies by page URL (``MangaMetadata.avif``), listed as
+            the page's ``avif``
+    """
+    tiles = tiles or {}
+    variants = variants or {}
+    avif = {url: copy for url, copy in (avif or {}).items() if url not in tiles and url not in variants}
+    page_assets = [[(tile_url, tile_bytes) for tile_url, _, tile_bytes in tiles[url][1]] if url in tiles
+                   else [(url, size)] for url, size in reading_order]
+    candidates = {url: [(variant_url, width, _file_size(Path(book_path) / variant_url))
+                        for variant_url, width in variants[url][1]]
+                  for url, _ in reading_order if url in variants and url not in tiles}
+    assets = [asset for page in page_assets for asset in page]
+    assets += [(url, size) for page in candidates.values() for url, _, size in page]
+    assets += [avif[url] for url, _ in reading_order if url in avif]
+    hashes = dict(hashes or {})
+    missing = [(url, size) for url, size in assets if url not in hashes]
+    if missing:
+        hashes.update(hash_pages(book_path, missing))
+
+    def record(url: str, size: int) -> Dict:
+        entry = {'url': url, 'size': size, 'hash': hashes[url][0]}
+        if url in candidates:
+            entry['width'] = variants[url][0]
+            entry['variants'] = [{**record(variant_url, variant_size), 'width': width}
+                                 for variant_url, width, variant_size in candidates[url]]
+        if url in avif:
+            entry['avif'] = record(*avif[url])
+        return entry
+
+    result = []
+    for chapter in chapters:
+        pages = [asset for page in page_assets[chapter.start_page - 1:chapter.end_page] for asset in page]
+        if not pages:
+            continue
+        result.append({
+            'number': chapter.number,
+            'name': chapter.name,
+            'bytes': sum(size for _, size in pages),
+            'assets': [record(url, size) for url, size in pages],
+        })
+    return {'version': ASSETS_VERSION, 'readers': list(readers or []), 'chapters': result}
+
+
+def write_offline_files(book_path: Path, chapters, reading_order: List[Tuple[str, int]], writer,
+                        hashes: Optional[Dict[str, Tuple[str, int]]] = None,
+                        tiles: Optional[Dict] = None, variants: Optional[Dict] = None,
+                        readers: Optional[List[str]] = None, avif: Optional[Dict] = None) -> bool:
+    """
+    Write a book's asset list and service worker (the other arguments as for ``build_assets``).
+
+    Returns:
+        True if either file changed on disk
+    """
+    assets = json.dumps(build_assets(book_path, chapters, reading_order, hashes, tiles, variants, readers, avif),
+                        ensure_ascii=False, sort_keys=True, separators=(',', ':')) + '\n'
+    version = hashlib.sha256(assets.encode('utf-8')).hexdigest()[:PAGE_HASH_LENGTH]
+    # Fetched by name by the service worker, so neither gets a content-hashed copy
+    changed = writer.write_text(Path(book_path) / ASSETS_NAME, assets, hashed=False)
+    if writer.write_text(Path(book_path) / SERVICE_WORKER_NAME, service_worker_script(version), hashed=False):
+        changed = True
+    return changed
+
+
+def service_worker_script(assets_version: str) -> str:
+    """
+    The book's service worker.
+
+    ``assets_version`` changes with the asset list, so browsers install the
+    new worker, which drops cached pages that changed or left the book.
+    """
+    return f"""// Page cache of one book (generated, assets {assets_version})
+// Pages are served cache-first; the least recently used ones are evicted
+// once the cache is over its quota. "download chapter" caches a chapter's
+// exact page list from {ASSETS_NAME}, taking for each page the srcset
+// candidate the reader would load on this screen. The reader files are kept
+// too (network-first), so that a downloaded book also opens offline.
+const CACHE = 'manga-pages:' + self.registration.scope;
+const INDEX_KEY = new URL('__page-index__', self.registration.scope).href;
+const ASSETS_URL = new URL('{ASSETS_NAME}', self.registration.scope).href;
+const MAX_BYTES = {BOOK_CACHE_BYTES};
+const QUOTA_SHARE = {QUOTA_SHARE};
+const CONCURRENCY = {DOWNLOAD_CONCURRENCY};
+const IMAGE = /\\.(png|jpe?g|gif|bmp|webp|avif|svg)$/i;
+
+let assetsPromise = null;
+let knownPages = null; // url -> {{ size, hash }} once the asset list is loaded
+let indexPromise = null;
+let saveTimer = null;
+
+function loadAssets(refresh) {{
+    if (!assetsPromise || refresh) {{
+        assetsPromise = fetch(ASSETS_URL, {{ cache: 'no-cache' }})
+            .then(response => response.ok ? response.json() : Promise.reject(new Error(response.status)))
+            .then(data => {{
+                const pages = new Map();
+                for (const chapter of data.chapters || []) {{
+                    for (const asset of chapter.assets) {{
+                        for (const known of [asset, ...(asset.variants || []), ...(asset.avif ? [asset.avif] : [])]) {{
+                            pages.set(new URL(known.url, self.registration.scope).href, known);
+                        }}
+                    }}
+                }}
+                knownPages = pages;
+                return data;
+            }})
+            .catch(error => {{
+                assetsPromise = null; // Offline: try again later
+                throw error;
+            }});
+    }}
+    return assetsPromise;
+}}
+
+// Size, last use and hash of every cached page, kept in the cache itself
+function loadIndex() {{
+    if (!indexPromise) {{
+        indexPromise = caches.open(CACHE)
+            .then(cache => cache.match(INDEX_KEY))
+            .then(response => response ? response.json() : {{}})
+            .catch(() => ({{}}))
+            .then(entries => new Map(Object.entries(entries)));
+    }}
+    return indexPromise;
+}}
+
+function saveIndex() {{
+    clearTimeout(saveTimer);
+    saveTimer = setTimeout(async () => {{
+        const [cache, index] = await Promise.all([caches.open(CACHE), loadIndex()]);
+        await cache.put(INDEX_KEY, new Response(JSON.stringify(Object.fromEntries(index)),
+            {{ headers: {{ 'Content-Type': 'application/json' }} }}));
+    }}, 1000);
+}}
+
+async function quota() {{
+    let limit = MAX_BYTES;
+    if (self.navigator.storage && self.navigator.storage.estimate) {{
+        try {{
+            const {{ quota }} = await self.navigator.storage.estimate();
+            if (quota) limit = Math.min(limit, quota * QUOTA_SHARE);
+        }} catch (e) {{}}
+    }}
+    return limit;
+}}
+
+async function evict(cache, index, keep) {{
+    let total = 0;
+    index.forEach(entry => {{ total += entry.size; }});
+    const limit = await quota();
+    if (total <= limit) return;
+    const oldest = [...index.entries()].sort((a, b) => a[1].used - b[1].used);
+    for (const [url, entry] of oldest) {{
+        if (total <= limit) break;
+        if (url === keep) continue;
+        await cache.delete(url);
+        index.delete(url);
+        total -= entry.size;
+    }}
+}}
+
+async function store(cache, index, url, response, hash, size) {{
+    size = size || Number(response.headers.get('content-length')) || (await response.clone().blob()).size;
+    await cache.put(url, response);
+    index.set(url, {{ size, used: Date.now(), hash }});
+    await evict(cache, index, url);
+    saveIndex();
+}}
+
+async function cacheFirst(url, request) {{
+    if (!knownPages) loadAssets().catch(() => {{}});
+    const [cache, index] = await Promise.all([caches.open(CACHE), loadIndex()]);
+    const known = knownPages && knownPages.get(url);
+    const entry = index.get(url);
+    const cached = await cache.match(url);
+    if (cached && (!known || !entry || entry.hash === known.hash)) {{
+        if (entry) {{
+            entry.used = Date.now();
+            saveIndex();
+        }}
+        return cached;
+    }}
+    try {{
+        const response = await fetch(request);
+        if (response.status === 200) {{
+            await store(cache, index, url, response.clone(), known ? known.hash : '', known ? known.size : 0);
+        }}
+        return response;
+    }} catch (error) {{
+        if (cached) return cached; // An outdated page beats none while offline
+        throw error;
+    }}
+}}
+
+// What the reader's srcset loads for a page: the narrowest candidate at least as
+// wide as the page's slot (its natural width, at most the viewport) in device pixels
+function candidate(asset, screen) {{
+    if (!asset.variants || !screen) return asset;
+    const needed = Math.min(screen.viewport, asset.width) * screen.dpr;
+    return asset.variants.find(variant => variant.width >= needed) || asset;
+}}
+
+// What the reader's <picture> loads for a page with an AVIF copy: the copy if the
+// browser decodes AVIF, the fallback if not, and both if the reader could not tell
+function sources(asset, screen) {{
+    const page = candidate(asset, screen);
+    if (!asset.avif || !screen || screen.avif === false) return [page];
+    return screen.avif ? [asset.avif] : [page, asset.avif];
+}}
+
+async function downloadChapter(number, report, screen) {{
+    let data;
+    try {{
+        data = await loadAssets(true);
+    }} catch (e) {{
+        report({{ error: 'Page list unavailable (offline?)' }});
+        return;
+    }}
+    await cacheReaders(data);
+    const chapter = (data.chapters || []).find(c => c.number === number);
+    if (!chapter) {{
+        report({{ error: 'Chapter not found' }});
+        return;
+    }}
+    const assets = chapter.assets.flatMap(asset => sources(asset, screen));
+    if (assets.reduce((bytes, asset) => bytes + asset.size, 0) > await quota()) {{
+        report({{ error: 'Chapter is larger than the offline storage' }});
+        return;
+    }}
+    const [cache, index] = await Promise.all([caches.open(CACHE), loadIndex()]);
+    const queue = assets.slice();
+    const total = queue.length;
+    let done = 0;
+    let failed = 0;
+    report({{ done, total }});
+    const worker = async () => {{
+        while (queue.length) {{
+            const asset = queue.shift();
+            const url = new URL(asset.url, self.registration.scope).href;
+            const entry = index.get(url);
+            if (entry && entry.hash === asset.hash && await cache.match(url)) {{
+                entry.used = Date.now();
+            }} else {{
+                try {{
+                    const response = await fetch(url, {{ cache: 'no-cache' }});
+                    if (response.status !== 200) throw new Error(response.status);
+                    await store(cache, index, url, response, asset.hash, asset.size);
+                }} catch (e) {{
+                    failed++;
+                }}
+            }}
+            done++;
+            report({{ done, total }});
+        }}
+    }};
+    await Promise.all(Array.from({{ length: CONCURRENCY }}, worker));
+    saveIndex();
+    report({{ done, total, failed, complete: true }});
+}}
+
+// Reader files are kept outside the page index, so they are never evicted
+async function cacheReaders(data) {{
+    const cache = await caches.open(CACHE);
+    await Promise.all((data.readers || []).map(async file => {{
+        const url = new URL(file, self.registration.scope).href;
+        try {{
+            const response = await fetch(url, {{ cache: 'no-cache' }});
+            if (response.status === 200) await cache.put(url, response);
+        }} catch (e) {{}} // Offline: keep the copy we have
+    }}));
+}}
+
+async function networkFirst(url, request) {{
+    const cache = await caches.open(CACHE);
+    try {{
+        const response = await fetch(request);
+        if (response.status === 200) await cache.put(url, response.clone());
+        return response;
+    }} catch (error) {{
+        const cached = await cache.match(url);
+        if (cached) return cached;
+        throw error;
+    }}
+}}
+
+// Drop pages that changed or left the book since they were cached
+async function prune() {{
+    let data;
+    try {{
+        data = await loadAssets(true);
+    }} catch (e) {{
+        return;
+    }}
+    const [cache, index] = await Promise.all([caches.open(CACHE), loadIndex()]);
+    for (const [url, entry] of [...index.entries()]) {{
+        const known = knownPages.get(url);
+        if (!known || (entry.hash && entry.hash !== known.hash)) {{
+            await cache.delete(url);
+            index.delete(url);
+        }}
+    }}
+    // Readers that are no longer generated (e.g. parts of an earlier split)
+    const readers = new Set((data.readers || []).map(file => new URL(file, self.registration.scope).href));
+    for (const request of await cache.keys()) {{
+        if (request.url.endsWith('.html') && !readers.has(request.url)) await cache.delete(request);
+    }}
+    saveIndex();
+}}
+
+self.addEventListener('install', event => {{
+    self.skipWaiting();
+    event.waitUntil(loadAssets(true).then(cacheReaders).catch(() => {{}}));
+}});
+
+self.addEventListener('activate', event => {{
+    event.waitUntil(prune().then(() => self.clients.claim()));
+}});
+
+self.addEventListener('fetch', event => {{
+    const request = event.request;
+    if (request.method !== 'GET') return;
+    const url = new URL(request.url);
+    if (!url.href.startsWith(self.registration.scope)) return;
+    if (request.mode === 'navigate') {{
+        event.respondWith(networkFirst(url.origin + url.pathname, request));
+    }} else if (IMAGE.test(url.pathname)) {{
+        event.respondWith(cacheFirst(url.origin + url.pathname, request));
+    }}
+}});
+
+self.addEventListener('message', event => {{
+    const data = event.data || {{}};
+    const port = event.ports[0];
+    if (data.type === 'download-chapter' && port) {{
+        event.waitUntil(downloadChapter(data.chapter, progress => port.postMessage(progress), data.screen));
+    }}
+}});
+"""
+
+
+def offline_script(indent: str = '') -> str:
+    """
+    ``OfflineCache`` JS class used by the readers.
+
+    Registers the book's service worker; ``downloadChapter(number, onProgress)``
+    caches a chapter, reporting ``{done, total, failed, error, complete}``.
+
+    Args:
+        indent: Prefix of every line, to match the surrounding script
+    """
+    script = f"""
+// Offline reading: the book's service worker caches pages and downloads chapters
+class OfflineCache {{
+    constructor() {{
+        this.supported = 'serviceWorker' in navigator && window.isSecureContext && location.protocol.startsWith('http');
+        this.ready = this.supported
+            ? navigator.serviceWorker.register('{SERVICE_WORKER_NAME}', {{ scope: './' }})
+                .then(() => navigator.serviceWorker.ready)
+                .catch(() => null)
+            : Promise.resolve(null);
+    }}
+
+    async downloadChapter(chapter, onProgress) {{
+        const registration = await this.ready;
+        if (!registration || !registration.active) {{
+            onProgress({{ error: 'Offline storage unavailable' }});
+            return;
+        }}
+        const channel = new MessageChannel();
+        channel.port1.onmessage = event => onProgress(event.data);
+        // The worker picks the page variants this screen's srcset loads, and the
+        // AVIF copies if a shown page loaded one (null: not known yet)
+        const shown = [...document.querySelectorAll('picture img')].find(img => img.currentSrc);
+        const avif = shown ? /\\.avif$/i.test(new URL(shown.currentSrc).pathname) : null;
+        const screen = {{ viewport: window.innerWidth, dpr: window.devicePixelRatio || 1, avif }};
+        registration.active.postMessage({{ type: 'download-chapter', chapter, screen }}, [channel.port2]);
+    }}
+}}
+"""
+    return textwrap.indent(script, indent)
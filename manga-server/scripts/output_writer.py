@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Atomic, Write-Avoiding Output Writer
+
+Shared by all generators for the files the server serves:
+- Unchanged output is detected by hashing and left untouched, so mtimes
+  (and the server's file-watch caches) only move when content changes
+- Changed output goes to a temp file in the same directory, is fsynced and
+  renamed over the destination, so readers never see truncated HTML
+- Written vs unchanged counts for the end-of-run summary
+- Optional content-hashed copies (``index-mb.<hash>.html``) listed in a
+  per-folder ``asset-map.json``, so the server can mark them immutable and
+  clients never revalidate unchanged books
+
+Author: mastersamasama
+Version: 1.0
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+_CHUNK_SIZE = 1024 * 1024
+
+# Exclusive create, so a temp name is never shared; binary on Windows
+_TEMP_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+
+# Canonical file name -> content-hashed copy, one map per output folder
+ASSET_MAP_NAME = 'asset-map.json'
+# Hex digits of the content hash in file names (same pattern as the server's immutable check)
+HASH_LENGTH = 10
+
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _fsync_directory(directory: Path):
+    """Persist a rename; not supported (nor needed) on Windows."""
+    if os.name == 'nt':
+        return
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _create_temp(path: Path):
+    """
+    Open a new temp file next to ``path``; returns (fd, name).
+
+    Created with mode 0o666 like ``open()`` would, so the process umask
+    applies (``tempfile.mkstemp`` creates 0o600 files).
+    """
+    while True:
+        name = str(path.parent / f".{path.name}.{os.urandom(6).hex()}.tmp")
+        try:
+            return os.open(name, _TEMP_FLAGS, 0o666), name
+        except FileExistsError:
+            continue
+
+
+def write_atomic(path: Path, data: bytes) -> bool:
+    """
+    Write ``data`` to ``path`` unless the file already holds exactly that.
+
+    Args:
+        path: Destination file
+        data: Complete new content
+
+    Returns:
+        True if the file was written, False if it was already up to date
+    """
+    path = Path(path)
+    try:
+        existing_size = path.stat().st_size
+    except FileNotFoundError:
+        existing_size = None
+
+    # Sizes differ for almost every real change, which avoids hashing the old file
+    if existing_size == len(data) and _file_digest(path) == hashlib.sha256(data).hexdigest():
+        return False
+
+    fd, temp_name = _create_temp(path)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if existing_size is not None:
+            # A replaced file keeps its permissions
+            os.chmod(temp_name, path.stat().st_mode & 0o7777)
+        os.replace(temp_name, path)
+    except BaseException:
+        try:
+            os.unlink(temp_name)
+        except FileNotFoundError:
+            pass
+        raise
+
+    _fsync_directory(path.parent)
+    return True
+
+
+def hashed_name(name: str, data: bytes) -> str:
+    """``index-mb.html`` -> ``index-mb.<content hash>.html``."""
+    stem, dot, suffix = name.rpartition('.')
+    if not dot:
+        stem, suffix = name, ''
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    return f"{stem}.{digest}.{suffix}" if suffix else f"{stem}.{digest}"
+
+
+def read_asset_map(directory: Path) -> Dict[str, str]:
+    """The asset map of an output folder; empty if there is none."""
+    try:
+        with open(Path(directory) / ASSET_MAP_NAME, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def resolve_asset(path: Path) -> Path:
+    """
+    The content-hashed copy of a generated file, if it is current.
+    
+    A copy older than the canonical file means the canonical file was
+    rewritten without updating the map; the canonical path is returned then.
+    """
+    path = Path(path)
+    name = read_asset_map(path.parent).get(path.name)
+    if not name:
+        return path
+    try:
+        if (path.parent / name).stat().st_mtime >= path.stat().st_mtime:
+            return path.parent / name
+    except OSError:
+        pass
+    return path
+
+
+def _write_asset_map(directory: Path, asset_map: Dict[str, str]):
+    map_path = Path(directory) / ASSET_MAP_NAME
+    if not asset_map:
+        try:
+            os.unlink(map_path)
+        except FileNotFoundError:
+            pass
+        return
+    # Sorted and without timestamps, like everything else that is generated
+    write_atomic(map_path, (json.dumps(asset_map, ensure_ascii=False, sort_keys=True, indent=1) + '\n').encode('utf-8'))
+
+
+def _prune_hashed_copies(path: Path, keep: set):
+    """Delete outdated hashed copies of ``path`` except the names in ``keep``."""
+    stem, dot, suffix = path.name.rpartition('.')
+    if not dot:
+        stem, suffix = path.name, ''
+    pattern = re.compile(re.escape(stem) + r'\.[0-9a-f]{%d}' % HASH_LENGTH
+                         + (r'\.' + re.escape(suffix) if suffix else '') + '$')
+    try:
+        with os.scandir(path.parent) as it:
+            stale = [entry.path for entry in it if pattern.match(entry.name) and entry.name not in keep]
+    except OSError:
+        return
+    for stale_path in stale:
+        try:
+            os.unlink(stale_path)
+        except OSError:
+            pass
+
+
+@dataclass
+class WriteStats:
+    """Files handled by an OutputWriter."""
+    written: int = 0
+    unchanged: int = 0
+    bytes_written: int = 0
+
+
+class OutputWriter:
+    """Writes generated files with ``write_atomic`` and counts the outcomes."""
+
+    def __init__(self, hashed_names: bool = False):
+        """
+        Args:
+            hashed_names: Also write a content-hashed copy of every file and
+                list it in the folder's asset map. Hashed copies and maps are
+                not counted in ``stats``.
+        """
+        self.hashed_names = hashed_names
+        self.stats = WriteStats()
+        self._lock = threading.Lock()
+
+    def write_text(self, path: Path, content: str, encoding: str = 'utf-8',
+                   hashed: Optional[bool] = None) -> bool:
+        """Write a text file; returns True if it changed on disk."""
+        return self.write_bytes(path, content.encode(encoding), hashed)
+
+    def write_bytes(self, path: Path, data: bytes, hashed: Optional[bool] = None) -> bool:
+        """
+        Write a binary file; returns True if it changed on disk.
+        
+        Args:
+            path: Destination file
+            data: Complete new content
+            hashed: Override ``hashed_names`` for this file (e.g. False for
+                entry pages whose URL must stay fixed)
+        """
+        path = Path(path)
+        written = write_atomic(path, data)
+        self.count(len(data), written)
+        if not written:
+            logger.debug(f"Unchanged, not rewritten: {path}")
+        self._update_asset_map(path, data, self.hashed_names if hashed is None else hashed, written)
+        return written
+
+    def _update_asset_map(self, path: Path, data: bytes, hashed: bool, written: bool):
+        """Write the hashed copy, or drop a map entry that would now be stale."""
+        asset_map = read_asset_map(path.parent)
+        previous = asset_map.get(path.name)
+        if not hashed:
+            if previous:
+                del asset_map[path.name]
+                _write_asset_map(path.parent, asset_map)
+            return
+
+        name = hashed_name(path.name, data)
+        if not write_atomic(path.parent / name, data) and written:
+            os.utime(path.parent / name)  # Must not look older than the canonical file (see resolve_asset)
+        if previous == name:
+            return
+        asset_map[path.name] = name
+        _write_asset_map(path.parent, asset_map)
+        # The previous copy stays for pages that still link to it
+        _prune_hashed_copies(path, {name, previous})
+
+    def remove(self, path: Path) -> bool:
+        """Delete a generated file that is no longer produced, with its hashed copies."""
+        path = Path(path)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return False
+        asset_map = read_asset_map(path.parent)
+        if asset_map.pop(path.name, None):
+            _write_asset_map(path.parent, asset_map)
+            _prune_hashed_copies(path, set())
+        logger.debug(f"Removed stale output: {path}")
+        return True
+
+    def merge(self, stats: WriteStats):
+        """Add the totals of a writer that ran elsewhere (e.g. in a worker process)."""
+        with self._lock:
+            self.stats.written += stats.written
+            self.stats.unchanged += stats.unchanged
+            self.stats.bytes_written += stats.bytes_written
+
+    def count(self, size: int, written: bool):
+        """Account for a file written elsewhere (e.g. in a worker process)."""
+        with self._lock:
+            if written:
+                self.stats.written += 1
+                self.stats.bytes_written += size
+            else:
+                self.stats.unchanged += 1
+
+    def summary(self) -> str:
+        return f"{self.stats.written} written, {self.stats.unchanged} unchanged"
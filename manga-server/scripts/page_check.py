@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Page Integrity Check
+
+Finds pages that would stall or break in a reader before they get into one:
+- Misnamed files: an image extension on something that is not an image
+  (HTML error pages saved as .jpg, empty files)
+- Truncated downloads: JPEG without its end-of-image marker, PNG without
+  its IEND chunk, GIF without its trailer, WebP/BMP shorter than their
+  header declares
+- Only the first ``HEAD_SIZE`` and last ``TAIL_SIZE`` bytes of a page are
+  read, in parallel; nothing is decoded and Pillow is not needed
+- The header dimensions (``image_probe``) are read in the same pass, so the
+  generators size, tile and thumbnail pages without opening them again
+- Results are cached per page by (size, mtime) in ``.manga-gen/page-check.json``,
+  so a rescan only reads new or changed pages
+- Files with extensions the check does not know are passed unchecked
+
+Author: mastersamasama
+Version: 1.0
+"""
+
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from image_probe import read_dimensions
+from image_variants import DERIVED_DIR
+from output_writer import write_atomic
+
+
+logger = logging.getLogger(__name__)
+
+
+CACHE_NAME = 'page-check.json'
+CACHE_VERSION = 2
+
+# What the generators do with damaged pages
+EXCLUDE = 'exclude'  # Leave them out of the readers
+FLAG = 'flag'  # Keep them, marked as damaged
+OFF = 'off'  # Do not check
+MODES = (EXCLUDE, FLAG, OFF)
+
+# Environment option holding the mode, for runs without a command line
+MODE_ENV = 'MANGA_DAMAGED_PAGES'
+
+HEAD_SIZE = 64
+# JPEG and PNG writers may append a few bytes after the end marker
+TAIL_SIZE = 1024
+
+_CHECK_WORKERS = min(8, (os.cpu_count() or 1) + 4)
+
+# Extensions the check knows, by the format they claim
+_CHECKED_SUFFIXES = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.avif', '.svg'}
+_AVIF_BRANDS = {b'avif', b'avis', b'mif1', b'msf1'}
+
+
+@dataclass
+class PageCheck:
+    """Outcome of checking the pages of a book."""
+    damaged: Dict[Path, str] = field(default_factory=dict)  # Page -> what is wrong with it
+    dimensions: Dict[Path, Optional[Tuple[int, int]]] = field(default_factory=dict)  # None if unreadable
+    read: int = 0  # Pages whose bytes were read (the others came from the cache)
+    cached: int = 0
+
+
+def env_mode() -> str:
+    """The mode set in ``MANGA_DAMAGED_PAGES`` (``exclude`` if unset or unknown)."""
+    value = os.environ.get(MODE_ENV, '').strip().lower()
+    if value and value not in MODES:
+        logger.warning(f"Ignoring {MODE_ENV}={value}, expected one of {', '.join(MODES)}")
+    return value if value in MODES else EXCLUDE
+
+
+def cache_path(book_path: Path) -> Path:
+    return Path(book_path) / DERIVED_DIR / CACHE_NAME
+
+
+def check_page(path: Path) -> str:
+    """
+    What is wrong with a page, from its first and last bytes.
+
+    Returns:
+        A short description of the problem, '' if the page looks complete
+    """
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            head = f.read(HEAD_SIZE)
+            f.seek(max(0, size - TAIL_SIZE))
+            tail = f.read(TAIL_SIZE)
+    except OSError as e:
+        return f"unreadable ({e.strerror or e})"
+    if not size:
+        return "empty file"
+
+    if head.startswith(b'\xff\xd8\xff'):
+        return '' if b'\xff\xd9' in tail else "truncated JPEG (no end-of-image marker)"
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return '' if b'IEND\xaeB`\x82' in tail else "truncated PNG (no IEND chunk)"
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return '' if tail.rstrip(b'\x00').endswith(b';') else "truncated GIF (no trailer)"
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        declared = int.from_bytes(head[4:8], 'little') + 8
+        return '' if size >= declared else f"truncated WebP ({size} of {declared} bytes)"
+    if head.startswith(b'BM') and len(head) >= 6:
+        declared = int.from_bytes(head[2:6], 'little')
+        return '' if size >= declared else f"truncated BMP ({size} of {declared} bytes)"
+    if head[4:8] == b'ftyp' and head[8:12] in _AVIF_BRANDS:
+        return ''  # ISO media boxes have no trailer to check
+    if path.suffix.lower() == '.svg' and head.lstrip(b'\xef\xbb\xbf \t\r\n').startswith(b'<'):
+        return ''
+    return "not an image (unrecognized header)"
+
+
+def _read_cache(book_path: Path) -> Dict[str, list]:
+    try:
+        with open(cache_path(book_path), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable page check cache in {book_path}: {e}")
+        return {}
+    if not isinstance(data, dict) or data.get('version') != CACHE_VERSION:
+        return {}
+    return data.get('pages', {})
+
+
+def _probe(path: Path, check: bool) -> Tuple[Optional[str], Optional[Tuple[int, int]]]:
+    """Problem (None if not checked) and header dimensions of a page."""
+    problem = None
+    if check:
+        problem = check_page(path) if path.suffix.lower() in _CHECKED_SUFFIXES else ''
+    return problem, read_dimensions(path)
+
+
+def _stat(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def check_pages(book_path: Path, pages: Dict[Path, int], check: bool = True) -> PageCheck:
+    """
+    Check the pages of a book and read their dimensions, reading only new or changed ones.
+
+    Args:
+        book_path: Book folder (pages are cached by their path relative to it)
+        pages: Page file -> size, as recorded by the scan
+        check: Also look for damaged pages (False: dimensions only)
+
+    Returns:
+        The damaged pages, every page's dimensions and how many pages were read
+    """
+    book_path = Path(book_path)
+    cached = _read_cache(book_path)
+    paths = list(pages)
+    result = PageCheck()
+    entries: Dict[str, list] = {}
+    stale = []
+
+    with ThreadPoolExecutor(max_workers=_CHECK_WORKERS) as executor:
+        for path, stat in zip(paths, executor.map(_stat, paths)):
+            if stat is None:
+                continue  # Vanished since the scan; the readers will not find it either
+            src = path.relative_to(book_path).as_posix()
+            previous = cached.get(src)
+            if previous and previous[:2] == list(stat) and (previous[2] is not None or not check):
+                entries[src] = previous
+                result.cached += 1
+            else:
+                stale.append((path, src, stat))
+        probes = executor.map(lambda path: _probe(path, check), [path for path, _, _ in stale])
+        for (path, src, stat), (problem, dimensions) in zip(stale, probes):
+            entries[src] = [*stat, problem, list(dimensions) if dimensions else None]
+        result.read = len(stale)
+
+    for path in paths:
+        entry = entries.get(path.relative_to(book_path).as_posix())
+        if not entry:
+            continue
+        result.dimensions[path] = tuple(entry[3]) if entry[3] else None
+        if check and entry[2]:
+            result.damaged[path] = entry[2]
+
+    if entries != cached:
+        path = cache_path(book_path)
+        content = json.dumps({'version': CACHE_VERSION, 'pages': entries}, sort_keys=True,
+                             separators=(',', ':')) + '\n'
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            write_atomic(path, content.encode('utf-8'))
+        except OSError as e:
+            logger.warning(f"Cannot save the page check cache of {book_path}: {e}")
+    return result
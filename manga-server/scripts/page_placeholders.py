@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Page Placeholders
+
+Optional stage that gives every page a tiny placeholder, shown while the
+page loads (and during fast scrolling) without any request:
+- Needs Pillow; without it the stage is skipped and pages load on a plain
+  background
+- A page's code is the average color of ``PLACEHOLDER_BANDS`` horizontal
+  bands as hex (9 bytes, 18 characters), drawn as a vertical gradient
+- Decoded at reduced size where the format allows it (JPEG draft mode), in
+  a process pool
+- Cached by the page's content hash in ``.manga-gen/placeholders.json``, so
+  unchanged pages are never decoded again
+- Stored in the book manifest as one comma-separated string in reading order
+
+Author: mastersamasama
+Version: 1.0
+"""
+
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from image_variants import DERIVED_DIR, Image
+from output_writer import write_atomic
+
+
+logger = logging.getLogger(__name__)
+
+
+CACHE_NAME = 'placeholders.json'
+CACHE_VERSION = 1
+
+# Horizontal bands averaged per page, top to bottom
+PLACEHOLDER_BANDS = 3
+# Smallest size JPEG pages are decoded at (draft mode picks a power-of-two scale)
+_DRAFT_SIZE = (64, 64)
+
+
+def available() -> bool:
+    """Whether Pillow is installed."""
+    return Image is not None
+
+
+def cache_path(book_path: Path) -> Path:
+    return Path(book_path) / DERIVED_DIR / CACHE_NAME
+
+
+def placeholder_css(code: str) -> str:
+    """CSS background of a placeholder code."""
+    return f"linear-gradient({', '.join('#' + code[i:i + 6] for i in range(0, len(code), 6))})"
+
+
+def encode_placeholders(codes: List[str]) -> str:
+    """Codes in reading order as one manifest string ('' for pages without one)."""
+    return ','.join(codes)
+
+
+def decode_placeholders(value: str) -> List[str]:
+    """Inverse of ``encode_placeholders``."""
+    return value.split(',') if value else []
+
+
+def _compute(source: str) -> str:
+    """Placeholder code of one page (runs in a worker process)."""
+    with Image.open(source) as image:
+        image.draft('RGB', _DRAFT_SIZE)
+        bands = image.convert('RGB').resize((1, PLACEHOLDER_BANDS), Image.BOX)
+        return ''.join(f"{r:02x}{g:02x}{b:02x}" for r, g, b in bands.getdata())
+
+
+def _read_cache(book_path: Path) -> Dict[str, str]:
+    try:
+        with open(cache_path(book_path), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable placeholder cache in {book_path}: {e}")
+        return {}
+    if not isinstance(data, dict) or data.get('version') != CACHE_VERSION:
+        return {}
+    return data.get('codes', {})
+
+
+def build_placeholders(book_path: Path, pages: Dict[str, Tuple[str, str]],
+                       workers: Optional[int] = None) -> Dict[str, str]:
+    """
+    Placeholder codes of a book's pages, computing only the uncached ones.
+
+    Args:
+        book_path: Book folder
+        pages: key (the page's URL in the readers) -> (content hash, file
+            relative to the book to decode)
+        workers: Worker processes (default: number of CPUs)
+
+    Returns:
+        key -> code of every page that has one
+    """
+    if Image is None:
+        logger.info("Pillow is not installed; skipping page placeholders")
+        return {}
+
+    book_path = Path(book_path)
+    cached = _read_cache(book_path)
+    missing: Dict[str, str] = {}
+    for digest, source in pages.values():
+        if digest and digest not in cached:
+            missing.setdefault(digest, source)
+
+    codes = {}
+    if missing:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            futures = {executor.submit(_compute, str(book_path / source)): digest
+                       for digest, source in missing.items()}
+            for future in as_completed(futures):
+                digest = futures[future]
+                try:
+                    codes[digest] = future.result()
+                except Exception as e:
+                    logger.warning(f"Cannot make a placeholder of {book_path / missing[digest]}: {e}")
+        logger.info(f"Made placeholders of {len(codes)} pages ({len(missing) - len(codes)} failed)")
+
+    # Only the current pages' codes are kept
+    current = {digest for digest, _ in pages.values() if digest}
+    codes.update((digest, code) for digest, code in cached.items() if digest in current)
+    if codes != cached:
+        path = cache_path(book_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        content = json.dumps({'version': CACHE_VERSION, 'codes': codes}, sort_keys=True,
+                             separators=(',', ':')) + '\n'
+        write_atomic(path, content.encode('utf-8'))
+    return {key: codes[digest] for key, (digest, _) in pages.items() if digest in codes}
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Generation Pipeline Benchmark
+
+Times the Python generation pipeline stage by stage and gates on regressions:
+- Reader stages (scan/analyze/render) of MangaReaderGenerator
+- Bookshelf stages (scan/render) of BookshelfGenerator
+- Warm-up runs followed by repeated measured runs
+- Baselines stored as JSON (median, MAD and raw samples per stage)
+- Noise-aware regression threshold (baseline median + k * MAD)
+- Per-stage delta table and non-zero exit status on regressions
+
+Usage:
+    python pipeline_benchmark.py ./本 --save-baseline bench/baseline.json
+    python pipeline_benchmark.py ./本 --compare bench/baseline.json
+
+Author: mastersamasama
+Version: 1.0
+"""
+
+import argparse
+import json
+import logging
+import platform
+import statistics
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from htmlcmb_v3 import MangaReaderGenerator
+from htmlcs_v4 import BookshelfScanner, GenerationConfig, ModernBookshelfHTMLGenerator
+
+
+BASELINE_VERSION = 1
+
+# Scale factor turning a MAD into a standard-deviation estimate for normal data
+MAD_TO_SIGMA = 1.4826
+
+ALL_STAGES = [
+    'reader.scan',
+    'reader.analyze',
+    'reader.render',
+    'shelf.scan',
+    'shelf.render',
+]
+
+
+@dataclass
+class StageResult:
+    """Timing samples of a single benchmark stage."""
+    name: str
+    samples: List[float] = field(default_factory=list)
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.samples) if self.samples else 0.0
+
+    @property
+    def mad(self) -> float:
+        """Median absolute deviation of the samples."""
+        if not self.samples:
+            return 0.0
+        median = self.median
+        return statistics.median(abs(sample - median) for sample in self.samples)
+
+    def to_dict(self) -> Dict:
+        return {
+            'median': self.median,
+            'mad': self.mad,
+            'samples': self.samples,
+        }
+
+
+@dataclass
+class StageComparison:
+    """Result of comparing one stage against its baseline."""
+    name: str
+    baseline_median: float
+    current_median: float
+    limit: float
+    status: str
+
+    @property
+    def delta_percent(self) -> float:
+        if self.baseline_median <= 0:
+            return 0.0
+        return (self.current_median - self.baseline_median) / self.baseline_median * 100
+
+
+class PipelineBenchmark:
+    """Runs the generation stages repeatedly against a library."""
+
+    def __init__(self, library: Path, max_books: Optional[int] = None,
+                 repeat: int = 5, warmup: int = 1, stages: Optional[List[str]] = None):
+        self.library = Path(library).resolve()
+        self.repeat = max(1, repeat)
+        self.warmup = max(0, warmup)
+        self.stages = stages or list(ALL_STAGES)
+
+        if not self.library.is_dir():
+            raise NotADirectoryError(f"Path is not a directory: {self.library}")
+
+        # Sorted so that every run (and the baseline) samples the same books
+        books = sorted(d for d in self.library.iterdir() if d.is_dir())
+        self.books = books[:max_books] if max_books else books
+
+    def run(self) -> Dict[str, StageResult]:
+        """Run all selected stages and return their timing samples."""
+        runners: Dict[str, Callable[[], float]] = {
+            'reader.scan': self._time_reader_scan,
+            'reader.analyze': self._time_reader_analyze,
+            'reader.render': self._time_reader_render,
+            'shelf.scan': self._time_shelf_scan,
+            'shelf.render': self._time_shelf_render,
+        }
+
+        results = {}
+        for name in self.stages:
+            runner = runners[name]
+            for _ in range(self.warmup):
+                runner()
+
+            result = StageResult(name)
+            for _ in range(self.repeat):
+                result.samples.append(runner())
+            results[name] = result
+            print(f"  {name:<16} median {result.median * 1000:9.2f}ms  "
+                  f"MAD {result.mad * 1000:7.2f}ms  ({self.repeat} runs)")
+
+        return results
+
+    # Reader stages: each sample is the total over all sampled books
+
+    def _generators(self) -> List[MangaReaderGenerator]:
+        return [MangaReaderGenerator(book) for book in self.books]
+
+    def _time_reader_scan(self) -> float:
+        elapsed = 0.0
+        for generator in self._generators():
+            start = time.perf_counter()
+            generator.scan()
+            elapsed += time.perf_counter() - start
+        return elapsed
+
+    def _time_reader_analyze(self) -> float:
+        elapsed = 0.0
+        for generator in self._generators():
+            folders, image_files = generator.scan()
+            start = time.perf_counter()
+            generator.analyze(folders, image_files)
+            elapsed += time.perf_counter() - start
+        return elapsed
+
+    def _time_reader_render(self) -> float:
+        elapsed = 0.0
+        for generator in self._generators():
+            metadata = generator.analyze(*generator.scan())
+            start = time.perf_counter()
+            generator.render(metadata)
+            elapsed += time.perf_counter() - start
+        return elapsed
+
+    # Bookshelf stages
+
+    def _shelf_config(self) -> GenerationConfig:
+        return GenerationConfig(base_path=self.library, generate_readers=False, enable_metrics=False)
+
+    def _time_shelf_scan(self) -> float:
+        scanner = BookshelfScanner(self._shelf_config())
+        start = time.perf_counter()
+        scanner.scan_books()
+        return time.perf_counter() - start
+
+    def _time_shelf_render(self) -> float:
+        config = self._shelf_config()
+        books = BookshelfScanner(config).scan_books()
+        start = time.perf_counter()
+        ModernBookshelfHTMLGenerator(books, config)._build_html()
+        return time.perf_counter() - start
+
+    def environment(self) -> Dict:
+        return {
+            'library': str(self.library),
+            'books': len(self.books),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        }
+
+
+def save_baseline(path: Path, benchmark: PipelineBenchmark, results: Dict[str, StageResult]):
+    """Store benchmark results as a baseline JSON file."""
+    data = {
+        'version': BASELINE_VERSION,
+        'environment': benchmark.environment(),
+        'repeat': benchmark.repeat,
+        'warmup': benchmark.warmup,
+        'stages': {name: result.to_dict() for name, result in results.items()},
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    print(f"\nBaseline saved: {path}")
+
+
+def load_baseline(path: Path) -> Dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != BASELINE_VERSION:
+        raise ValueError(f"Unsupported baseline version in {path}: {data.get('version')}")
+    return data
+
+
+def compare_results(baseline: Dict, results: Dict[str, StageResult],
+                    mad_k: float, min_delta: float) -> List[StageComparison]:
+    """
+    Compare current results with a baseline.
+
+    A stage regresses when its median exceeds the baseline median by more than
+    both ``mad_k`` robust standard deviations (MAD based) and ``min_delta``
+    (relative), so noisy stages need a proportionally larger slowdown to fail.
+    """
+    comparisons = []
+    for name, result in results.items():
+        base = baseline['stages'].get(name)
+        if base is None:
+            comparisons.append(StageComparison(name, 0.0, result.median, 0.0, 'new'))
+            continue
+
+        base_median = base['median']
+        margin = max(mad_k * MAD_TO_SIGMA * base['mad'], min_delta * base_median)
+        limit = base_median + margin
+
+        if result.median > limit:
+            status = 'REGRESSION'
+        elif result.median < base_median - margin:
+            status = 'improved'
+        else:
+            status = 'ok'
+
+        comparisons.append(StageComparison(name, base_median, result.median, limit, status))
+    return comparisons
+
+
+def print_comparison(comparisons: List[StageComparison]):
+    print(f"\n{'='*78}")
+    print("PIPELINE BENCHMARK COMPARISON")
+    print(f"{'='*78}")
+    print(f"{'Stage':<16} {'Baseline':>11} {'Current':>11} {'Delta':>9} {'Limit':>11}  Status")
+    print(f"{'-'*78}")
+    for c in comparisons:
+        if c.status == 'new':
+            print(f"{c.name:<16} {'-':>11} {c.current_median * 1000:9.2f}ms {'-':>9} {'-':>11}  new")
+            continue
+        print(f"{c.name:<16} {c.baseline_median * 1000:9.2f}ms {c.current_median * 1000:9.2f}ms "
+              f"{c.delta_percent:+8.1f}% {c.limit * 1000:9.2f}ms  {c.status}")
+    print(f"{'='*78}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the manga generation pipeline and gate on regressions."
+    )
+    parser.add_argument('library', help="Manga collection root (e.g. ./本)")
+    parser.add_argument('--compare', type=Path, metavar='BASELINE',
+                        help="Compare against a stored baseline JSON and fail on regressions")
+    parser.add_argument('--save-baseline', type=Path, metavar='BASELINE',
+                        help="Store the results as a new baseline JSON")
+    parser.add_argument('--repeat', type=int, default=5, help="Measured runs per stage (default: 5)")
+    parser.add_argument('--warmup', type=int, default=1, help="Warm-up runs per stage (default: 1)")
+    parser.add_argument('--books', type=int, default=None,
+                        help="Only benchmark the first N books (sorted by folder name)")
+    parser.add_argument('--stages', default=','.join(ALL_STAGES),
+                        help=f"Comma-separated stages (default: {','.join(ALL_STAGES)})")
+    parser.add_argument('--mad-k', type=float, default=3.0,
+                        help="Allowed slowdown in robust standard deviations (default: 3.0)")
+    parser.add_argument('--min-delta', type=float, default=0.05,
+                        help="Minimum relative slowdown treated as regression (default: 0.05)")
+    args = parser.parse_args(argv)
+
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+    unknown = [s for s in stages if s not in ALL_STAGES]
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(unknown)}")
+
+    # Generator progress logging would dominate the timings
+    logging.getLogger().setLevel(logging.WARNING)
+
+    benchmark = PipelineBenchmark(args.library, max_books=args.books, repeat=args.repeat,
+                                  warmup=args.warmup, stages=stages)
+    print(f"Benchmarking {len(benchmark.books)} books in {benchmark.library}")
+    results = benchmark.run()
+
+    if args.save_baseline:
+        save_baseline(args.save_baseline, benchmark, results)
+
+    if args.compare:
+        baseline = load_baseline(args.compare)
+        base_env = baseline.get('environment', {})
+        if base_env.get('books') != len(benchmark.books):
+            print(f"Warning: baseline covered {base_env.get('books')} books, "
+                  f"this run covers {len(benchmark.books)}")
+
+        comparisons = compare_results(baseline, results, args.mad_k, args.min_delta)
+        print_comparison(comparisons)
+
+        regressions = [c for c in comparisons if c.status == 'REGRESSION']
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) regressed: {', '.join(c.name for c in regressions)}")
+            return 1
+        print("\nNo regressions detected.")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Adaptive Prefetch Window
+
+How far the readers load ahead of the current page, in bytes rather than in
+pages, so a window of small pages and one of huge scans cost the same:
+- Page sizes come from the scan and are embedded in KiB, in reading order
+- The reader measures download throughput from the resource timing of the
+  pages it fetched (moving average over batches of finished downloads)
+- The window is throughput times ``PREFETCH_SECONDS`` within fixed bounds;
+  ``DEFAULT_WINDOW_BYTES`` until the first measurement
+- The same sizes are stored in the book manifest as one compact string
+
+Author: mastersamasama
+Version: 1.0
+"""
+
+import json
+import textwrap
+from typing import List
+
+
+# Seconds of reading the window should cover at the measured throughput
+PREFETCH_SECONDS = 8
+# Window before anything was measured (and without the Resource Timing API)
+DEFAULT_WINDOW_BYTES = 8 * 1024 * 1024
+# Bounds of the measured window: a slow link still loads the next page, a
+# fast one does not pull in half the book
+MIN_WINDOW_BYTES = 1 * 1024 * 1024
+MAX_WINDOW_BYTES = 64 * 1024 * 1024
+# Weight of the newest throughput sample in the moving average
+THROUGHPUT_SMOOTHING = 0.3
+
+
+def page_kib(sizes: List[int]) -> List[int]:
+    """Page sizes in KiB (rounded up, so no page is free)."""
+    return [-(-size // 1024) for size in sizes]
+
+
+def encode_page_kib(sizes: List[int]) -> str:
+    """Page sizes as comma-separated KiB, one line in the manifest instead of one per page."""
+    return ','.join(map(str, page_kib(sizes)))
+
+
+def decode_page_kib(value: str) -> List[int]:
+    """Inverse of ``encode_page_kib`` (sizes in KiB)."""
+    return [int(kib) for kib in value.split(',')] if value else []
+
+
+def page_kib_json(sizes: List[int]) -> str:
+    """Page sizes in KiB as a JS array literal."""
+    return json.dumps(page_kib(sizes), separators=(',', ':'))
+
+
+def prefetch_window_script(indent: str = '') -> str:
+    """
+    ``PrefetchWindow`` JS class shared by the readers.
+
+    ``new PrefetchWindow(pageKiB)`` starts measuring; ``pagesAhead(page)`` is
+    the number of pages after ``page`` that fit in the current window.
+
+    Args:
+        indent: Prefix of every line, to match the surrounding script
+    """
+    script = f"""
+// Read-ahead sized in bytes: measured throughput x {PREFETCH_SECONDS}s of reading
+class PrefetchWindow {{
+    constructor(pageKiB) {{
+        this.pageKiB = pageKiB;
+        this.bytesPerSecond = 0;
+        if (window.PerformanceObserver) {{
+            try {{
+                new PerformanceObserver(list => this.measure(list.getEntries()))
+                    .observe({{ type: 'resource', buffered: true }});
+            }} catch (e) {{
+                // No resource timing: keep the default window
+            }}
+        }}
+    }}
+
+    // One throughput sample per batch of finished page downloads; parallel
+    // downloads share the link, so bytes are divided by the batch's wall time
+    measure(entries) {{
+        let bytes = 0, start = Infinity, end = 0;
+        entries.forEach(entry => {{
+            // transferSize is 0 for cache hits and opaque cross-origin responses
+            if (entry.initiatorType !== 'img' || !entry.transferSize) return;
+            bytes += entry.transferSize;
+            start = Math.min(start, entry.startTime);
+            end = Math.max(end, entry.responseEnd);
+        }});
+        if (bytes < 16384 || end <= start) return;
+        const sample = bytes / ((end - start) / 1000);
+        this.bytesPerSecond = this.bytesPerSecond
+            ? this.bytesPerSecond + {THROUGHPUT_SMOOTHING} * (sample - this.bytesPerSecond)
+            : sample;
+    }}
+
+    budget() {{
+        if (!this.bytesPerSecond) return {DEFAULT_WINDOW_BYTES};
+        return Math.min({MAX_WINDOW_BYTES}, Math.max({MIN_WINDOW_BYTES}, this.bytesPerSecond * {PREFETCH_SECONDS}));
+    }}
+
+    // Pages after `page` within the window (the page that crosses it included)
+    pagesAhead(page) {{
+        let budget = this.budget();
+        let count = 0;
+        for (let next = page + 1; next <= this.pageKiB.length && budget > 0; next++) {{
+            budget -= (this.pageKiB[next - 1] || 0) * 1024;
+            count++;
+        }}
+        return count;
+    }}
+}}
+"""
+    return textwrap.indent(script, indent)
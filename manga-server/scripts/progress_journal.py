@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Progress Journal for Resumable Generation Runs
+
+Lets an interrupted full-library run (OOM, reboot, Ctrl-C) continue where
+it stopped instead of starting from zero:
+- Append-only JSONL journal of finished per-book steps (scan, reader)
+- Periodic fsync, so at most a few books are redone after a power loss
+- Torn last lines from a crash are ignored on load
+- Entries are only reused while the book folder is unchanged (mtime)
+- Every run appends to its own file; a run resumes from the journals of all
+  earlier runs with the same settings
+- A completed run discards its journal and those of runs that are gone;
+  journals of concurrent runs that are still live are kept
+
+Author: mastersamasama
+Version: 1.0
+"""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Collection, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+JOURNAL_VERSION = 1
+
+
+def _owner_key(owner: str) -> str:
+    """Owner as used in file names (``host:pid:id`` -> ``host_pid_id``)."""
+    return owner.replace(':', '_').replace('/', '_')
+
+
+class ProgressJournal:
+    """
+    Durable record of the books a run has already finished.
+
+    The first line is a header with a fingerprint of the run settings; a
+    journal written with other settings is not resumed. Every further line
+    is one finished step::
+
+        {"step": "scan", "book": "0001.Title", "mtime": 1700000000.0, ...}
+
+    With an ``owner``, the run writes ``<stem>.<owner><suffix>`` next to
+    ``path`` and loads every journal of that family, so concurrent runs on
+    one library never append to (or delete) each other's file.
+    """
+
+    def __init__(self, path: Path, fingerprint: Dict, sync_every: int = 32, owner: Optional[str] = None):
+        """
+        Args:
+            path: Journal path (the family's name when ``owner`` is given)
+            fingerprint: Run settings; journals of other settings are not resumed
+            sync_every: Entries appended between two fsyncs
+            owner: Id of this run (e.g. ``RunCoordinator.owner``)
+        """
+        self.base_path = Path(path)
+        self.owner = _owner_key(owner) if owner else None
+        self.path = (self.base_path.with_name(f"{self.base_path.stem}.{self.owner}{self.base_path.suffix}")
+                     if self.owner else self.base_path)
+        self.fingerprint = fingerprint
+        self.sync_every = sync_every
+        self.resumed = 0
+
+        self._entries: Dict[Tuple[str, str], Dict] = {}
+        self._file = None
+        self._unsynced = 0
+
+    def open(self) -> int:
+        """
+        Load the existing journals of the same settings and open this run's one for appending.
+
+        Returns:
+            Number of finished steps loaded from previous runs
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        loaded = [path for path in self._family() if self._load(path)]
+
+        if self.path in loaded:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        else:
+            self._file = open(self.path, 'w', encoding='utf-8')
+            self._append({'version': JOURNAL_VERSION, 'fingerprint': self.fingerprint,
+                          'started': time.time()})
+            self._sync()
+        if self._entries:
+            logger.info(f"Resuming from {len(loaded)} progress journal(s): {len(self._entries)} finished steps "
+                        f"({self.path.parent})")
+        return len(self._entries)
+
+    def extend_mtime(self, step: str, book: str, mtime_after: float):
+        """Keep a step valid after a later step of the same run changed the folder."""
+        entry = self._entries.get((step, book))
+        if entry is not None and entry.get('mtime_after') != mtime_after:
+            self.record(step, book, entry['mtime'], **{
+                key: value for key, value in entry.items()
+                if key not in ('step', 'book', 'mtime', 'mtime_after')
+            }, mtime_after=mtime_after)
+
+    def lookup(self, step: str, book: str, mtime: float) -> Optional[Dict]:
+        """The journaled result of a step, if the book is unchanged since."""
+        entry = self._entries.get((step, book))
+        if entry is None or mtime not in (entry.get('mtime'), entry.get('mtime_after')):
+            return None
+        self.resumed += 1
+        return entry
+
+    def record(self, step: str, book: str, mtime: float, **data):
+        """
+        Append a finished step.
+
+        Args:
+            step: Step name, e.g. ``scan`` or ``reader``
+            book: Book folder name
+            mtime: Folder mtime the step's result is based on
+            **data: Result of the step (must be JSON serializable); use
+                ``mtime_after`` when the step itself changed the folder
+        """
+        entry = {'step': step, 'book': book, 'mtime': mtime, **data}
+        self._entries[(step, book)] = entry
+        self._append(entry)
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self._sync()
+
+    def close(self, completed: bool, live_owners: Collection[str] = ()):
+        """
+        Close the journal.
+
+        Args:
+            completed: The run finished; its journal and those of runs that
+                are gone are deleted so the next run starts fresh. Otherwise
+                it is synced and kept for resuming.
+            live_owners: Owners of concurrent runs that are still live,
+                whose journals are kept
+        """
+        if self._file is None:
+            return
+        if completed:
+            self._file.close()
+            self._file = None
+            keep = {_owner_key(owner) for owner in live_owners} - {self.owner}
+            for path in self._family():
+                if self._owner_of(path) not in keep:
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+            return
+
+        self._sync()
+        self._file.close()
+        self._file = None
+        logger.info(f"Progress saved to {self.path}; the next run resumes from it")
+
+    def _family(self) -> List[Path]:
+        """Existing journals this run resumes from: its own one, and with an owner those of other runs."""
+        paths = [self.base_path] if self.base_path.exists() else []
+        if self.owner:
+            paths += sorted(self.base_path.parent.glob(f"{self.base_path.stem}.*{self.base_path.suffix}"))
+        return paths
+
+    def _owner_of(self, path: Path) -> Optional[str]:
+        if path == self.base_path:
+            return None
+        return path.name[len(self.base_path.stem) + 1:-len(self.base_path.suffix) or None]
+
+    def _load(self, path: Path) -> bool:
+        """Read a journal; False if it is unusable or from other settings."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                lines = f.read().split('\n')
+        except OSError as e:
+            logger.warning(f"Cannot read progress journal {path}: {e}")
+            return False
+
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            return False
+        if header.get('version') != JOURNAL_VERSION or header.get('fingerprint') != self.fingerprint:
+            logger.info(f"Progress journal {path.name} was written with other settings; not resuming from it")
+            return False
+
+        for line in lines[1:]:
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Torn write from a crash
+            self._entries[(entry['step'], entry['book'])] = entry
+
+        # A torn last line would corrupt the next appended entry
+        if lines[-1] and path == self.path:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write('\n')
+        return True
+
+    def _append(self, entry: Dict):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Reader Cost Benchmark
+
+Calibrates the cost model of reader_policy.py by measuring the readers the
+generators actually produce:
+- Synthetic books of increasing size (chapters of 50 pages, tiny PNG pages)
+- Plain (index-mb.html) and virtual-scroll (index-mb-virtualscroll.html)
+  readers rendered in memory
+- HTML bytes and static DOM nodes (start tags) per reader
+- Least-squares fit of base + per-page cost, stored as the cost model
+
+Usage:
+    python reader_benchmark.py
+    python reader_benchmark.py --pages 100,1000,5000 --save
+
+Author: mastersamasama
+Version: 1.0
+"""
+
+import argparse
+import logging
+import struct
+import sys
+import tempfile
+import zlib
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+from htmlcmb_v3 import MangaReaderGenerator
+from htmlcmb_v3_virtualscroll import VirtualScrollMangaGenerator
+from reader_policy import DEFAULT_COST_MODEL, ReaderCostModel
+
+
+DEFAULT_PAGES = [50, 200, 500, 1000, 2000, 5000]
+PAGES_PER_CHAPTER = 50
+
+
+class _NodeCounter(HTMLParser):
+    """Counts the elements of the static markup (script bodies are not parsed)."""
+
+    def __init__(self):
+        super().__init__()
+        self.nodes = 0
+
+    def handle_starttag(self, tag, attrs):
+        self.nodes += 1
+
+
+def count_nodes(html: str) -> int:
+    counter = _NodeCounter()
+    counter.feed(html)
+    counter.close()
+    return counter.nodes
+
+
+@dataclass
+class ReaderSample:
+    """Measured size of both readers for one book size."""
+    pages: int
+    plain_html_bytes: int
+    plain_dom_nodes: int
+    virtual_html_bytes: int
+    virtual_dom_nodes: int
+
+
+def _png(width: int, height: int) -> bytes:
+    """Smallest valid PNG header the image probe reads dimensions from."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IEND', b''))
+
+
+def build_book(root: Path, pages: int) -> Path:
+    """Create a synthetic book with ``pages`` pages in chapters of 50."""
+    book = root / f"bench.Book_{pages}"
+    page = _png(800, 1200)
+    for index in range(pages):
+        chapter = book / f"Chapter {index // PAGES_PER_CHAPTER + 1:03d}"
+        chapter.mkdir(parents=True, exist_ok=True)
+        (chapter / f"{index % PAGES_PER_CHAPTER + 1:03d}.png").write_bytes(page)
+    return book
+
+
+def measure(pages: int) -> ReaderSample:
+    """Render both readers of a synthetic book and measure them."""
+    with tempfile.TemporaryDirectory(prefix='reader-bench-') as temp:
+        generator = MangaReaderGenerator(build_book(Path(temp), pages))
+        metadata = generator.analyze(*generator.scan())
+        plain = generator.render(metadata)
+        virtual = VirtualScrollMangaGenerator(metadata, use_virtual_scroll=True)._build_html_content()
+    return ReaderSample(
+        pages=pages,
+        plain_html_bytes=len(plain.encode('utf-8')),
+        plain_dom_nodes=count_nodes(plain),
+        virtual_html_bytes=len(virtual.encode('utf-8')),
+        virtual_dom_nodes=count_nodes(virtual),
+    )
+
+
+def fit_line(xs: Sequence[float], ys: Sequence[float]) -> Tuple[float, float]:
+    """Least-squares (intercept, slope) of ys over xs."""
+    n = len(xs)
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    if variance == 0:
+        return mean_y, 0.0
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+    return mean_y - slope * mean_x, slope
+
+
+def fit_model(samples: List[ReaderSample], base: Optional[ReaderCostModel] = None) -> ReaderCostModel:
+    """Cost model with the measured coefficients; budgets are kept from ``base``."""
+    model = base or ReaderCostModel()
+    pages = [s.pages for s in samples]
+    model.plain_html_base, model.plain_html_per_page = fit_line(pages, [s.plain_html_bytes for s in samples])
+    model.plain_nodes_base, model.plain_nodes_per_page = fit_line(pages, [s.plain_dom_nodes for s in samples])
+    model.virtual_html_base, model.virtual_html_per_page = fit_line(pages, [s.virtual_html_bytes for s in samples])
+    model.virtual_nodes = float(max(s.virtual_dom_nodes for s in samples))
+    for name in ('plain_html_base', 'plain_html_per_page', 'plain_nodes_base', 'plain_nodes_per_page',
+                 'virtual_html_base', 'virtual_html_per_page'):
+        setattr(model, name, round(getattr(model, name), 2))
+    return model
+
+
+def print_samples(samples: List[ReaderSample], model: ReaderCostModel):
+    print(f"\n{'='*72}")
+    print("READER COST BENCHMARK")
+    print(f"{'='*72}")
+    print(f"{'Pages':>7} {'Plain HTML':>12} {'Plain nodes':>12} {'Virtual HTML':>13} {'Virtual nodes':>14}")
+    print(f"{'-'*72}")
+    for s in samples:
+        print(f"{s.pages:>7} {s.plain_html_bytes:>12} {s.plain_dom_nodes:>12} "
+              f"{s.virtual_html_bytes:>13} {s.virtual_dom_nodes:>14}")
+    print(f"{'-'*72}")
+    print(f"Plain:   {model.plain_html_base:.0f} + {model.plain_html_per_page:.1f}/page bytes, "
+          f"{model.plain_nodes_base:.0f} + {model.plain_nodes_per_page:.2f}/page nodes")
+    print(f"Virtual: {model.virtual_html_base:.0f} + {model.virtual_html_per_page:.1f}/page bytes, "
+          f"{model.virtual_nodes:.0f} nodes")
+    print(f"{'='*72}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Measure reader HTML size and DOM nodes and calibrate the reader mode policy."
+    )
+    parser.add_argument('--pages', default=','.join(map(str, DEFAULT_PAGES)),
+                        help=f"Comma-separated book sizes (default: {','.join(map(str, DEFAULT_PAGES))})")
+    parser.add_argument('--save', nargs='?', type=Path, const=DEFAULT_COST_MODEL, metavar='FILE',
+                        help=f"Store the fitted cost model (default: {DEFAULT_COST_MODEL})")
+    args = parser.parse_args(argv)
+
+    try:
+        sizes = sorted({int(p) for p in args.pages.split(',') if p.strip()})
+    except ValueError:
+        parser.error(f"Invalid --pages: {args.pages}")
+    if len(sizes) < 2 or sizes[0] < 1:
+        parser.error("--pages needs at least two positive book sizes")
+
+    # Generator progress logging would drown the table
+    logging.getLogger().setLevel(logging.WARNING)
+
+    samples = []
+    for pages in sizes:
+        print(f"Measuring {pages} pages...")
+        samples.append(measure(pages))
+
+    model = fit_model(samples, ReaderCostModel.load(args.save) if args.save else None)
+    print_samples(samples, model)
+
+    if args.save:
+        print(f"\nCost model saved: {model.save(args.save)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Reader Mode Selection Policy
+
+One policy for choosing how a book is read, instead of fixed page-count
+thresholds scattered over the generators:
+- ``plain``: one page with an ``<img>`` per page (index-mb.html)
+- ``virtual-scroll``: only the visible pages are in the DOM
+  (index-mb-virtualscroll.html)
+- ``split``: one small reader per chapter (long chapters in slices of
+  ``split_part_pages``) plus a book index (index-mb-split.html)
+
+The decision uses page count, total image bytes and average image
+dimensions, and a cost model (HTML bytes and DOM nodes per page) that is
+calibrated by ``reader_benchmark.py``.
+
+Author: mastersamasama
+Version: 1.0
+"""
+
+import json
+import logging
+import os
+from dataclasses import dataclass, asdict, fields
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from image_probe import read_dimensions
+
+
+logger = logging.getLogger(__name__)
+
+
+PLAIN = 'plain'
+VIRTUAL_SCROLL = 'virtual-scroll'
+SPLIT = 'split'
+MODES = (PLAIN, VIRTUAL_SCROLL, SPLIT)
+
+# Written by reader_benchmark.py --save; built-in defaults are used without it
+DEFAULT_COST_MODEL = Path(__file__).resolve().parent.parent / 'data' / 'reader-cost-model.json'
+
+
+@dataclass
+class ReaderCostModel:
+    """
+    Cost of each reader per page, plus the budgets a reader must stay within.
+
+    The per-page coefficients are least-squares fits measured by
+    ``reader_benchmark.py``; the defaults come from a run on this tree.
+    """
+    # Plain reader: static HTML and DOM grow with every page
+    plain_html_base: float = 51_165.0
+    plain_html_per_page: float = 166.1
+    plain_nodes_base: float = 59.0
+    plain_nodes_per_page: float = 1.1
+    # Virtual scroll: page metadata is embedded as JSON, the static DOM stays small
+    virtual_html_base: float = 20_440.0
+    virtual_html_per_page: float = 83.6
+    virtual_nodes: float = 25.0
+
+    # Budgets
+    max_html_bytes: int = 2_000_000  # Transfer and parse time of a single reader page
+    max_dom_nodes: int = 5_000  # Layout/style cost of the plain reader
+    max_eager_bytes: int = 512 * 1024 * 1024  # Images a plain reader may end up fetching
+    max_decoded_bytes: int = 4 * 1024 ** 3  # Decoded RGBA pixels held by a plain reader
+    max_scroll_height: int = 16_000_000  # Tallest scrollable element browsers handle (px)
+    split_part_pages: int = 500  # Longest single file of a split reader (pages)
+    reference_width: int = 800  # Page width the layout height is estimated at (px)
+    fallback_page_height: int = 1_200  # Used when no dimensions could be read (px)
+
+    @classmethod
+    def load(cls, path: Optional[Path] = None) -> 'ReaderCostModel':
+        """The calibrated model at ``path`` (default: data/reader-cost-model.json), else the defaults."""
+        path = Path(path or os.environ.get('MANGA_READER_COST_MODEL') or DEFAULT_COST_MODEL)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable reader cost model {path}: {e}")
+            return cls()
+        known = {f.name for f in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in known})
+
+    def save(self, path: Optional[Path] = None) -> Path:
+        path = Path(path or DEFAULT_COST_MODEL)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(asdict(self), f, indent=2, sort_keys=True)
+            f.write('\n')
+        return path
+
+
+@dataclass
+class BookStats:
+    """What the policy knows about a book."""
+    pages: int
+    total_bytes: int
+    avg_width: float = 0.0  # 0 when no dimensions could be read
+    avg_height: float = 0.0
+
+    @classmethod
+    def collect(cls, image_files: List[Path], sample: int = 16,
+                sizes: Optional[Dict[Path, int]] = None,
+                dimensions: Optional[Dict[Path, Optional[Tuple[int, int]]]] = None) -> 'BookStats':
+        """
+        Sizes of all pages and the dimensions of an evenly spaced sample.
+
+        Args:
+            image_files: Page images of the book
+            sample: Pages whose headers are read for the average dimensions
+            sizes: File sizes already recorded by the scan; others are stat'ed
+            dimensions: Header dimensions already read by the scan; others
+                are read here
+        """
+        sizes = sizes or {}
+        known = dimensions or {}
+        total_bytes = 0
+        for path in image_files:
+            if path in sizes:
+                total_bytes += sizes[path]
+                continue
+            try:
+                total_bytes += os.stat(path).st_size
+            except OSError:
+                pass
+
+        dimensions = []
+        if image_files and sample > 0:
+            step = max(1, len(image_files) // sample)
+            for path in image_files[::step][:sample]:
+                size = known[path] if path in known else read_dimensions(path)
+                if size and size[0] > 0 and size[1] > 0:
+                    dimensions.append(size)
+
+        avg_width = sum(w for w, _ in dimensions) / len(dimensions) if dimensions else 0.0
+        avg_height = sum(h for _, h in dimensions) / len(dimensions) if dimensions else 0.0
+        return cls(len(image_files), total_bytes, round(avg_width, 1), round(avg_height, 1))
+
+
+@dataclass
+class ReaderDecision:
+    """The chosen mode, why, and the estimates it was based on."""
+    mode: str
+    reason: str
+    estimates: Dict[str, float]
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def estimate(stats: BookStats, model: ReaderCostModel) -> Dict[str, float]:
+    """Estimated cost of the plain and virtual-scroll readers for a book."""
+    if stats.avg_width > 0 and stats.avg_height > 0:
+        page_height = model.reference_width * stats.avg_height / stats.avg_width
+        decoded_per_page = stats.avg_width * stats.avg_height * 4
+    else:
+        page_height = model.fallback_page_height
+        decoded_per_page = 0.0
+    return {
+        'plain_html_bytes': round(model.plain_html_base + model.plain_html_per_page * stats.pages),
+        'plain_dom_nodes': round(model.plain_nodes_base + model.plain_nodes_per_page * stats.pages),
+        'virtual_html_bytes': round(model.virtual_html_base + model.virtual_html_per_page * stats.pages),
+        'decoded_bytes': round(decoded_per_page * stats.pages),
+        'scroll_height': round(page_height * stats.pages),
+    }
+
+
+def choose_reader_mode(stats: BookStats, model: Optional[ReaderCostModel] = None) -> ReaderDecision:
+    """
+    Pick the cheapest reader that stays within every budget.
+
+    The plain reader is preferred while its HTML, DOM, eagerly fetched
+    bytes and decoded pixels fit; virtual scroll while its embedded page
+    list fits one HTML page and the book's scroll height stays below what
+    browsers can scroll; otherwise the book is split per chapter.
+    """
+    model = model or ReaderCostModel()
+    costs = estimate(stats, model)
+
+    if costs['virtual_html_bytes'] > model.max_html_bytes:
+        return ReaderDecision(SPLIT, f"page list of {costs['virtual_html_bytes']} bytes exceeds "
+                                     f"the {model.max_html_bytes} byte HTML budget", costs)
+    if costs['scroll_height'] > model.max_scroll_height:
+        return ReaderDecision(SPLIT, f"scroll height of {costs['scroll_height']}px exceeds "
+                                     f"the {model.max_scroll_height}px browser limit", costs)
+
+    over = []
+    if costs['plain_html_bytes'] > model.max_html_bytes:
+        over.append(f"{costs['plain_html_bytes']} HTML bytes")
+    if costs['plain_dom_nodes'] > model.max_dom_nodes:
+        over.append(f"{costs['plain_dom_nodes']} DOM nodes")
+    if stats.total_bytes > model.max_eager_bytes:
+        over.append(f"{stats.total_bytes} image bytes")
+    if costs['decoded_bytes'] > model.max_decoded_bytes:
+        over.append(f"{costs['decoded_bytes']} decoded bytes")
+    if over:
+        return ReaderDecision(VIRTUAL_SCROLL, f"plain reader over budget: {', '.join(over)}", costs)
+
+    return ReaderDecision(PLAIN, "plain reader within all budgets", costs)
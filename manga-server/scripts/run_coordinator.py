@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Lockfile-Based Run Coordinator
+
+Keeps concurrent generation runs on the same library (cron, ingest hook,
+manual runs) from doing the same work twice, using only local files:
+- Every run registers itself and keeps a heartbeat while it is alive
+- Runs that overlap join one session; a book is claimed by exactly one run
+  of the session through an O_EXCL lockfile with a lease
+- Finished books stay marked as done for the rest of the session, so a run
+  that starts late only picks up the remaining books; the marks of
+  finished sessions are pruned when the next run starts
+- Leases of crashed runs are recovered: when they expire, or immediately
+  when the owning process is gone
+- Exclusive sections (e.g. writing the bookshelf) wait for each other
+
+State lives in ``<library>/.manga-gen/``.
+
+Author: mastersamasama
+Version: 1.0
+"""
+
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+
+logger = logging.getLogger(__name__)
+
+
+# Per-library state directory; scanners skip it when listing books
+STATE_DIR_NAME = '.manga-gen'
+
+
+def _pid_alive(pid: int) -> bool:
+    """Whether a local process exists (conservatively True when unsure)."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class RunCoordinator:
+    """
+    Splits the books of a library between concurrent runs.
+
+    Usage::
+
+        with RunCoordinator(library) as coordinator:
+            for book in books:
+                if coordinator.claim(book.name):
+                    ...generate...
+                    coordinator.complete(book.name)
+    """
+
+    def __init__(self, library: Path, lease_seconds: float = 600.0):
+        self.library = Path(library)
+        self.lease_seconds = lease_seconds
+        self.state_dir = self.library / STATE_DIR_NAME
+        self.runs_dir = self.state_dir / 'runs'
+        self.claims_dir = self.state_dir / 'claims'
+
+        self.host = socket.gethostname()
+        self.pid = os.getpid()
+        self.owner = f"{self.host}:{self.pid}:{uuid.uuid4().hex[:8]}"
+        self.session: Optional[str] = None
+        self.started = 0.0
+
+        self._held: Dict[str, Path] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def __enter__(self) -> 'RunCoordinator':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    # Run registration
+
+    def start(self):
+        """Register this run and join the session of any live concurrent run."""
+        self.runs_dir.mkdir(parents=True, exist_ok=True)
+        self.claims_dir.mkdir(parents=True, exist_ok=True)
+        self.started = time.time()
+
+        live = []
+        for run_file in self.runs_dir.glob('*.json'):
+            record = self._read(run_file)
+            if record is None or self._is_stale(record):
+                self._remove(run_file)
+            else:
+                live.append(record)
+
+        if live:
+            self.session = min(live, key=lambda r: r['started'])['session']
+            logger.info(f"Joining {len(live)} running generation run(s) in session {self.session}")
+        else:
+            self.session = uuid.uuid4().hex
+
+        self._write_run_record()
+        self._prune_claims({record.get('session') for record in live} | {self.session})
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name='run-heartbeat', daemon=True)
+        self._heartbeat.start()
+
+    def stop(self):
+        """Release unfinished claims and unregister the run."""
+        self._stop.set()
+        if self._heartbeat:
+            self._heartbeat.join()
+        with self._lock:
+            held = list(self._held.values())
+            self._held.clear()
+        for claim_file in held:
+            self._remove(claim_file)
+        self._remove(self._run_file)
+
+    def live_owners(self) -> Set[str]:
+        """Owners of the registered runs that are still live, this one included."""
+        owners = {self.owner}
+        for run_file in self.runs_dir.glob('*.json'):
+            record = self._read(run_file)
+            if record is not None and record.get('owner') and not self._is_stale(record):
+                owners.add(record['owner'])
+        return owners
+
+    # Book claims
+
+    def claim(self, book: str) -> bool:
+        """
+        Try to claim a book for this run.
+
+        Returns:
+            False if another live run holds it or it was already finished
+            in this session; True if this run should process it
+        """
+        claim_file = self._claim_file(book)
+        for _ in range(2):
+            if self._create(claim_file, self._claim_record(book, 'running')):
+                with self._lock:
+                    self._held[book] = claim_file
+                return True
+
+            record = self._read(claim_file)
+            if record is None:
+                continue  # Released or being replaced; try again
+            if record.get('session') == self.session and record.get('state') == 'done':
+                return False
+            if record.get('state') == 'running' and not self._is_stale(record):
+                return False
+
+            # Done in an old session, or the lease of a crashed run
+            if record.get('state') == 'running':
+                logger.warning(f"Recovering stale claim on {book} from {record.get('owner')}")
+            if not self._steal(claim_file, record):
+                return False
+        return False
+
+    def complete(self, book: str):
+        """Mark a claimed book as finished for the rest of the session."""
+        # Under the lock so a concurrent lease renewal cannot undo the 'done' state
+        with self._lock:
+            claim_file = self._held.pop(book, None)
+            if claim_file and self._owns(claim_file):
+                self._replace(claim_file, self._claim_record(book, 'done'))
+
+    def release(self, book: str):
+        """Give up a claim (e.g. after a failure) so another run may retry it."""
+        with self._lock:
+            claim_file = self._held.pop(book, None)
+        if claim_file and self._owns(claim_file):
+            self._remove(claim_file)
+
+    @contextmanager
+    def exclusive(self, name: str, poll_interval: float = 0.5):
+        """Run a section in at most one run at a time; waits for the others."""
+        lock_file = self.state_dir / f"{name}.lock"
+        record = {'owner': self.owner, 'host': self.host, 'pid': self.pid}
+        while True:
+            record['expires'] = time.time() + self.lease_seconds
+            if self._create(lock_file, record):
+                break
+            current = self._read(lock_file)
+            if current is not None and self._is_stale(current):
+                self._steal(lock_file, current)
+                continue
+            time.sleep(poll_interval)
+        try:
+            yield
+        finally:
+            self._remove(lock_file)
+
+    # Internals
+
+    @property
+    def _run_file(self) -> Path:
+        return self.runs_dir / f"{self.owner.replace(':', '_')}.json"
+
+    def _claim_file(self, book: str) -> Path:
+        digest = hashlib.sha1(book.encode('utf-8')).hexdigest()[:20]
+        return self.claims_dir / f"{digest}.json"
+
+    def _claim_record(self, book: str, state: str) -> Dict:
+        return {
+            'book': book,
+            'state': state,
+            'session': self.session,
+            'owner': self.owner,
+            'host': self.host,
+            'pid': self.pid,
+            'expires': time.time() + self.lease_seconds,
+        }
+
+    def _write_run_record(self):
+        self._replace(self._run_file, {
+            'owner': self.owner,
+            'host': self.host,
+            'pid': self.pid,
+            'session': self.session,
+            'started': self.started,
+            'expires': time.time() + self.lease_seconds,
+        })
+
+    def _heartbeat_loop(self):
+        """Extend the run record and all held leases well before they expire."""
+        interval = max(1.0, self.lease_seconds / 3)
+        while not self._stop.wait(interval):
+            try:
+                self._write_run_record()
+                with self._lock:
+                    for book, claim_file in list(self._held.items()):
+                        if self._owns(claim_file):
+                            self._replace(claim_file, self._claim_record(book, 'running'))
+                            continue
+                        # Another run took over the lease (e.g. after this one stalled)
+                        del self._held[book]
+                        logger.warning(f"Lost the claim on {book} to another run; no longer renewing it")
+            except OSError as e:
+                logger.warning(f"Failed to renew leases: {e}")
+
+    def _owns(self, claim_file: Path) -> bool:
+        """Whether a claim file still holds this run's claim."""
+        record = self._read(claim_file)
+        return (record is not None and record.get('session') == self.session
+                and record.get('owner') == self.owner)
+
+    def _is_stale(self, record: Dict) -> bool:
+        if record.get('expires', 0) < time.time():
+            return True
+        # A crashed local run does not have to wait for its lease to expire
+        return record.get('host') == self.host and not _pid_alive(record.get('pid', -1))
+
+    def _prune_claims(self, sessions: set):
+        """Remove the 'done' claims of sessions no live run belongs to."""
+        for claim_file in self.claims_dir.glob('*.json'):
+            record = self._read(claim_file)
+            if record and record.get('state') == 'done' and record.get('session') not in sessions:
+                self._steal(claim_file, record)
+
+    def _steal(self, path: Path, expected: Dict) -> bool:
+        """
+        Move a stale lockfile aside; only one of several racing runs succeeds.
+
+        Runs that read the same stale record all try to rename it away, but
+        only the first one moves that record: a later rename may move the
+        fresh lockfile the winner created in its place. The moved file is
+        therefore checked against ``expected`` (the stale record that was
+        read) and put back if it is not the same.
+        """
+        tombstone = path.with_name(f"{path.name}.stale-{uuid.uuid4().hex[:8]}")
+        try:
+            os.rename(path, tombstone)
+        except FileNotFoundError:
+            return True  # Someone else removed it; creating may still work
+        except OSError:
+            return False
+        if self._read(tombstone) != expected:
+            self._restore(tombstone, path)
+            return False
+        self._remove(tombstone)
+        return True
+
+    def _restore(self, tombstone: Path, path: Path):
+        """Put back a lockfile moved aside by mistake, unless a newer one took its place."""
+        try:
+            os.link(tombstone, path)  # Fails instead of replacing a newer lockfile
+        except FileExistsError:
+            pass
+        except OSError:
+            # No hardlinks on this filesystem
+            if not path.exists():
+                os.replace(tombstone, path)
+                return
+        self._remove(tombstone)
+
+    @staticmethod
+    def _create(path: Path, record: Dict) -> bool:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        return True
+
+    @staticmethod
+    def _replace(path: Path, record: Dict):
+        temp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _read(path: Path) -> Optional[Dict]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            # Probably being written right now; left over from a crash if old
+            try:
+                age = time.time() - path.stat().st_mtime
+            except OSError:
+                return None
+            return {'state': 'running', 'expires': 0 if age > 10 else time.time() + 1}
+
+    @staticmethod
+    def _remove(path: Path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Loop-Safe Directory Walk
+
+``os.walk`` replacement for the scanners that visits every physical folder
+and file at most once:
+- Folders are tracked by ``(st_dev, st_ino)``, so a bind mount or symlink
+  leading back to an ancestor is skipped instead of walked forever
+- Files are tracked the same way, so hardlinks and symlinks to a page
+  already seen are not counted twice
+- Symlinked folders are followed by explicit rules: ``never`` (like
+  ``os.walk``), ``inside`` the walked folder only, or ``always``
+- Every skipped loop, duplicate and unfollowed link is listed in a
+  ``WalkReport``
+- Listings go through ``scan_latency.DirectoryLatencyRecorder`` when one is
+  given, so they are still timed
+
+Author: mastersamasama
+Version: 1.0
+"""
+
+import logging
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+# Which symlinked folders the walk enters (symlinked files are always pages)
+NEVER = 'never'
+INSIDE = 'inside'  # Only links whose target is inside the walked folder
+ALWAYS = 'always'
+SYMLINK_MODES = (NEVER, INSIDE, ALWAYS)
+
+# Environment option holding the mode, for runs without a command line
+MODE_ENV = 'MANGA_FOLLOW_SYMLINKS'
+
+# Entries of each kind named in log messages; the report has all of them
+_LOGGED_ENTRIES = 5
+
+
+@dataclass
+class WalkReport:
+    """What a walk skipped; paths are as walked, each with the path it repeats."""
+    loops: List[Tuple[str, str]] = field(default_factory=list)  # Folder leading back to an ancestor
+    duplicate_folders: List[Tuple[str, str]] = field(default_factory=list)  # Folder already walked elsewhere
+    duplicate_files: List[Tuple[str, str]] = field(default_factory=list)  # Hardlink/symlink to a file seen
+    unfollowed_links: List[str] = field(default_factory=list)  # Symlinked folders the rules did not enter
+
+    def __bool__(self) -> bool:
+        return bool(self.loops or self.duplicate_folders or self.duplicate_files or self.unfollowed_links)
+
+    def merge(self, other: 'WalkReport'):
+        self.loops.extend(other.loops)
+        self.duplicate_folders.extend(other.duplicate_folders)
+        self.duplicate_files.extend(other.duplicate_files)
+        self.unfollowed_links.extend(other.unfollowed_links)
+
+    def to_dict(self, base: Optional[Path] = None) -> Dict[str, list]:
+        """Non-empty lists, with paths relative to ``base`` if given."""
+        def rel(path: str) -> str:
+            return Path(path).relative_to(base).as_posix() if base else path
+
+        data = {
+            'loops': [[rel(path), rel(target)] for path, target in self.loops],
+            'duplicate_folders': [[rel(path), rel(target)] for path, target in self.duplicate_folders],
+            'duplicate_files': [[rel(path), rel(target)] for path, target in self.duplicate_files],
+            'unfollowed_links': [rel(path) for path in self.unfollowed_links],
+        }
+        return {key: value for key, value in data.items() if value}
+
+    def log(self, where: str):
+        """One warning per kind of skipped entry, naming the first few."""
+        for kind, entries in (('symlink loops', self.loops), ('repeated folders', self.duplicate_folders),
+                              ('duplicate files', self.duplicate_files)):
+            if entries:
+                shown = ', '.join(f"{path} (= {target})" for path, target in entries[:_LOGGED_ENTRIES])
+                more = f" and {len(entries) - _LOGGED_ENTRIES} more" if len(entries) > _LOGGED_ENTRIES else ''
+                logger.warning(f"Skipped {len(entries)} {kind} in {where}: {shown}{more}")
+        if self.unfollowed_links:
+            logger.info(f"Not following {len(self.unfollowed_links)} symlinked folders in {where} "
+                        f"(see --follow-symlinks)")
+
+
+def env_mode() -> str:
+    """The mode set in ``MANGA_FOLLOW_SYMLINKS`` (``never`` if unset or unknown)."""
+    value = os.environ.get(MODE_ENV, '').strip().lower()
+    if value and value not in SYMLINK_MODES:
+        logger.warning(f"Ignoring {MODE_ENV}={value}, expected one of {', '.join(SYMLINK_MODES)}")
+    return value if value in SYMLINK_MODES else NEVER
+
+
+def _is_link(entry: os.DirEntry) -> bool:
+    try:
+        return entry.is_symlink()
+    except OSError:
+        return False
+
+
+def _links_last(entries: List[os.DirEntry]) -> List[os.DirEntry]:
+    """Entries in the same order, with the symlinks moved after the real files and folders."""
+    return sorted(entries, key=_is_link)
+
+
+class SafeWalker:
+    """
+    Top-down walk yielding ``os.walk``'s ``(root, dirs, files)`` tuples.
+
+    Pruning ``dirs`` in place works as with ``os.walk``; repeated files are
+    already left out of ``files``. Entries come in name order, so the copy
+    kept of a repeated file or folder is the same on every run; within a
+    folder, real files and folders are kept over symlinks to them. Unreadable
+    folders are skipped. One walker can walk several trees: nothing is
+    visited twice across them.
+    """
+
+    def __init__(self, symlinks: str = NEVER, recorder=None, book: str = '', component: str = ''):
+        """
+        Args:
+            symlinks: Which symlinked folders to enter (see ``SYMLINK_MODES``)
+            recorder: Optional ``scan_latency.DirectoryLatencyRecorder`` timing
+                every listing
+            book, component: Passed on to the recorder
+        """
+        if symlinks not in SYMLINK_MODES:
+            raise ValueError(f"Unknown symlink mode '{symlinks}', expected one of {', '.join(SYMLINK_MODES)}")
+        self.symlinks = symlinks
+        self.recorder = recorder
+        self.book = book
+        self.component = component
+        self.report = WalkReport()
+        self._folders: Dict[Tuple[int, int], str] = {}
+        self._files: Dict[Tuple[int, int], str] = {}
+
+    def walk(self, top) -> Iterator[Tuple[str, List[str], List[str]]]:
+        top = os.fspath(top)
+        try:
+            stat = os.stat(top)
+        except OSError:
+            return
+        if not self._first_visit(top, stat):
+            return
+        inside = os.path.realpath(top)
+        stack = [(top, stat.st_dev)]
+        while stack:
+            root, device = stack.pop()
+            try:
+                entries = self._list(root)
+            except OSError:
+                continue
+            dirs: List[str] = []
+            folders: Dict[str, os.DirEntry] = {}
+            file_entries: List[os.DirEntry] = []
+            for entry in sorted(entries, key=lambda entry: entry.name):
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    dirs.append(entry.name)
+                    folders[entry.name] = entry
+                else:
+                    file_entries.append(entry)
+            # Real entries are marked before the links, so a link never hides its target
+            kept = {entry.name for entry in _links_last(file_entries) if self._new_file(entry, device)}
+            files = [entry.name for entry in file_entries if entry.name in kept]
+            yield root, dirs, files
+            subdirs = {}
+            for entry in _links_last([folders[name] for name in dirs if name in folders]):  # Others added by the caller
+                path = os.path.join(root, entry.name)
+                if _is_link(entry) and not self._follows(path, inside):
+                    self.report.unfollowed_links.append(path)
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if self._first_visit(path, stat):
+                    subdirs[entry.name] = (path, stat.st_dev)
+            stack.extend(reversed([subdirs[name] for name in dirs if name in subdirs]))
+
+    def _list(self, path: str) -> List[os.DirEntry]:
+        if self.recorder is not None:
+            return self.recorder.scandir(path, self.book, self.component)
+        with os.scandir(path) as it:
+            return list(it)
+
+    def _follows(self, path: str, inside: str) -> bool:
+        if self.symlinks == ALWAYS:
+            return True
+        if self.symlinks == INSIDE:
+            target = os.path.realpath(path)
+            return target == inside or target.startswith(inside.rstrip(os.sep) + os.sep)
+        return False
+
+    def _first_visit(self, path: str, stat: os.stat_result) -> bool:
+        key = (stat.st_dev, stat.st_ino)
+        seen = self._folders.get(key)
+        if seen is None:
+            self._folders[key] = path
+            return True
+        if path.startswith(seen.rstrip(os.sep) + os.sep):
+            self.report.loops.append((path, seen))
+        else:
+            self.report.duplicate_folders.append((path, seen))
+        return False
+
+    def _new_file(self, entry: os.DirEntry, device: int) -> bool:
+        """Whether a file was not seen yet (files that cannot be stat'ed are kept, as os.walk would)."""
+        try:
+            if _is_link(entry):
+                stat = entry.stat()
+                key = (stat.st_dev, stat.st_ino)
+            else:
+                # A plain file lives on its folder's device; the inode comes with the listing
+                key = (device, entry.inode())
+        except OSError:
+            return True
+        seen = self._files.get(key)
+        if seen is None:
+            self._files[key] = entry.path
+            return True
+        self.report.duplicate_files.append((entry.path, seen))
+        return False
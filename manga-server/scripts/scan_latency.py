@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Directory Listing Latency Recorder
+
+Finds the folders that dominate scan time on slow storage (SMB/NFS mounts,
+folders with thousands of tiny files, flaky disks):
+- Timed, os.walk-compatible directory walk built on os.scandir
+- Listing latency and entry count recorded per directory and per book
+- End-of-run report: top-N slowest books and directories plus a
+  per-directory latency histogram
+- Optional JSONL dump (one line per listed directory) for offline analysis
+
+Author: mastersamasama
+Version: 1.0
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+# Upper bounds (seconds) of the per-directory latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+@dataclass
+class DirectoryListing:
+    """One timed directory listing."""
+    path: str
+    book: str
+    component: str
+    seconds: float
+    entries: int
+    error: Optional[str] = None
+
+
+class DirectoryLatencyRecorder:
+    """
+    Records how long each directory listing takes.
+
+    Scanners call ``walk`` (a drop-in for ``os.walk``), ``listdir`` or ``scandir``
+    instead of listing directories themselves. The time covers the
+    ``scandir`` call plus telling files from directories, since on network
+    filesystems that classification may need one stat per entry.
+    Safe to share between threads.
+    """
+
+    def __init__(self):
+        self.listings: List[DirectoryListing] = []
+        self._lock = threading.Lock()
+
+    def listdir(self, path: Path, book: str = '', component: str = '') -> Tuple[List[str], List[str]]:
+        """
+        List one directory.
+
+        Args:
+            path: Directory to list
+            book: Book the directory belongs to (for per-book totals)
+            component: Which scanner listed it, e.g. ``reader`` or ``shelf``
+
+        Returns:
+            Tuple of (subdirectory names, file names)
+
+        Raises:
+            OSError: If the directory cannot be listed (the failure is recorded)
+        """
+        dirs: List[str] = []
+        files: List[str] = []
+        for entry in self.scandir(path, book, component):
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            (dirs if is_dir else files).append(entry.name)
+        return dirs, files
+
+    def scandir(self, path: Path, book: str = '', component: str = '') -> List[os.DirEntry]:
+        """
+        List one directory as ``os.DirEntry`` objects (same timing as ``listdir``).
+
+        Raises:
+            OSError: If the directory cannot be listed (the failure is recorded)
+        """
+        entries: List[os.DirEntry] = []
+        start = time.perf_counter()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        entry.is_dir()  # Cached on the entry, so callers pay nothing more
+                    except OSError:
+                        pass
+                    entries.append(entry)
+        except OSError as e:
+            self._record(path, book, component, time.perf_counter() - start, 0, str(e))
+            raise
+        self._record(path, book, component, time.perf_counter() - start, len(entries))
+        return entries
+
+    def walk(self, top: Path, book: str = '', component: str = '') -> Iterator[Tuple[str, List[str], List[str]]]:
+        """
+        Timed top-down ``os.walk`` replacement.
+
+        Yields the same ``(root, dirs, files)`` tuples; pruning ``dirs`` in
+        place works the same way. Like ``os.walk``, symlinked directories are
+        listed in ``dirs`` but not descended into, and unreadable directories
+        are skipped.
+        """
+        stack = [os.fspath(top)]
+        while stack:
+            root = stack.pop()
+            try:
+                dirs, files = self.listdir(root, book, component)
+            except OSError:
+                continue
+            yield root, dirs, files
+            # Reversed so that subdirectories are visited in listing order
+            for name in reversed(dirs):
+                path = os.path.join(root, name)
+                if not os.path.islink(path):
+                    stack.append(path)
+
+    def extend(self, listings: List[DirectoryListing]):
+        """Merge listings recorded elsewhere (e.g. in a worker process)."""
+        with self._lock:
+            self.listings.extend(listings)
+
+    def _record(self, path, book: str, component: str, seconds: float, entries: int,
+                error: Optional[str] = None):
+        listing = DirectoryListing(os.fspath(path), book, component, seconds, entries, error)
+        with self._lock:
+            self.listings.append(listing)
+
+    # Aggregation
+
+    def slowest_directories(self, top_n: int = 10) -> List[DirectoryListing]:
+        with self._lock:
+            listings = list(self.listings)
+        return sorted(listings, key=lambda l: l.seconds, reverse=True)[:top_n]
+
+    def book_totals(self) -> Dict[str, Tuple[float, int, int]]:
+        """Book -> (total listing seconds, directories listed, entries seen)."""
+        totals: Dict[str, Tuple[float, int, int]] = {}
+        with self._lock:
+            listings = list(self.listings)
+        for listing in listings:
+            if not listing.book:
+                continue
+            seconds, dirs, entries = totals.get(listing.book, (0.0, 0, 0))
+            totals[listing.book] = (seconds + listing.seconds, dirs + 1, entries + listing.entries)
+        return totals
+
+    def slowest_books(self, top_n: int = 10) -> List[Tuple[str, float, int, int]]:
+        ranked = sorted(self.book_totals().items(), key=lambda item: item[1][0], reverse=True)
+        return [(book, *totals) for book, totals in ranked[:top_n]]
+
+    def histogram(self) -> List[Tuple[float, int]]:
+        """Non-cumulative (upper bound, count) pairs; the last bound is infinity."""
+        bounds = list(LATENCY_BUCKETS) + [float('inf')]
+        counts = [0] * len(bounds)
+        with self._lock:
+            latencies = [l.seconds for l in self.listings]
+        for seconds in latencies:
+            for i, bound in enumerate(bounds):
+                if seconds <= bound:
+                    counts[i] += 1
+                    break
+        return list(zip(bounds, counts))
+
+    # Output
+
+    def print_report(self, top_n: int = 10):
+        """Print the slowest books/directories and the latency histogram."""
+        with self._lock:
+            listings = list(self.listings)
+        if not listings:
+            return
+
+        total = sum(l.seconds for l in listings)
+        errors = sum(1 for l in listings if l.error)
+
+        print(f"\n{'='*50}")
+        print("DIRECTORY LISTING LATENCY")
+        print(f"{'='*50}")
+        print(f"Directories listed: {len(listings)} ({errors} failed)")
+        print(f"Total listing time: {total:.3f}s")
+
+        books = self.slowest_books(top_n)
+        if len(books) > 1:
+            print(f"\nSlowest books (top {len(books)}):")
+            for book, seconds, dirs, entries in books:
+                print(f"  {seconds*1000:9.1f}ms  {dirs:5d} dirs {entries:7d} entries  {book}")
+
+        print(f"\nSlowest directories (top {min(top_n, len(listings))}):")
+        for listing in self.slowest_directories(top_n):
+            note = f"  [{listing.error}]" if listing.error else ''
+            print(f"  {listing.seconds*1000:9.1f}ms  {listing.entries:7d} entries  {listing.path}{note}")
+
+        histogram = self.histogram()
+        widest = max(count for _, count in histogram) or 1
+        print("\nLatency histogram (per directory):")
+        for bound, count in histogram:
+            label = f"<= {bound*1000:g}ms" if bound != float('inf') else f"> {LATENCY_BUCKETS[-1]*1000:g}ms"
+            bar = '#' * max(1 if count else 0, round(count / widest * 30))
+            print(f"  {label:>10} {count:7d}  {bar}")
+        print(f"{'='*50}")
+
+    def dump_jsonl(self, output_path: Path) -> Path:
+        """Write one JSON object per listed directory."""
+        with self._lock:
+            listings = list(self.listings)
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            for listing in listings:
+                f.write(json.dumps(asdict(listing), ensure_ascii=False) + '\n')
+        logger.info(f"Wrote {len(listings)} directory listings: {output_path}")
+        return output_path
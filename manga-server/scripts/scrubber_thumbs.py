@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Scrubber Thumbnails
+
+Optional stage that packs a tiny thumbnail of every page into sprite strips,
+so the reader's progress slider can preview the page under the thumb while
+it is dragged and only loads full pages where it is released:
+- Needs Pillow; without it the slider previews the page number only
+- Thumbnails are ``THUMB_HEIGHT`` px high; pages taller than
+  ``MAX_THUMB_ASPECT`` are cut to their top part
+- One JPEG strip per ``SPRITE_PAGES`` pages in reading order, plus an offset
+  table (strip, x, width) per page embedded in the reader
+- Strips are named by the content hashes of their pages, so unchanged strips
+  are never packed twice; they are made in a process pool
+- Stored in the book's ``.manga-gen/scrubber`` folder and pruned when no
+  reader references them any more
+
+Author: mastersamasama
+Version: 1.0
+"""
+
+import hashlib
+import json
+import logging
+import os
+import textwrap
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from image_variants import DERIVED_DIR, Image, save_image
+
+
+logger = logging.getLogger(__name__)
+
+
+SCRUBBER_DIR = 'scrubber'
+
+# Thumbnail height in the strips and in the preview (px)
+THUMB_HEIGHT = 96
+# Taller pages (height / width) show their top part, so strips stay readable
+MAX_THUMB_ASPECT = 2.0
+# Pages per strip: one download covers a good stretch of slider travel
+SPRITE_PAGES = 32
+SPRITE_QUALITY = 60
+# Shape of pages whose dimensions cannot be read
+_DEFAULT_SIZE = (700, 1000)
+# Cell of a page that cannot be decoded
+_BLANK = (64, 64, 64)
+
+# url -> (strip url, x offset, width) of every page with a thumbnail
+Thumbs = Dict[str, Tuple[str, int, int]]
+
+
+def available() -> bool:
+    """Whether Pillow is installed."""
+    return Image is not None
+
+
+def scrubber_dir(book_path: Path) -> Path:
+    return Path(book_path) / DERIVED_DIR / SCRUBBER_DIR
+
+
+def thumb_width(width: int, height: int) -> int:
+    """Width of a page's thumbnail."""
+    if width <= 0 or height <= 0:
+        width, height = _DEFAULT_SIZE
+    return max(1, round(THUMB_HEIGHT * width / min(height, width * MAX_THUMB_ASPECT)))
+
+
+def sprite_name(digests: List[str]) -> str:
+    """Strip named by its thumbnail settings and the content hashes of its pages."""
+    key = f"{THUMB_HEIGHT}:{MAX_THUMB_ASPECT}:{SPRITE_QUALITY}:" + ','.join(digests)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20] + '.jpg'
+
+
+def _pack(cells: List[Tuple[str, int]], path: str) -> str:
+    """Write one strip of thumbnails, left to right (runs in a worker process)."""
+    strip = Image.new('RGB', (sum(width for _, width in cells), THUMB_HEIGHT), _BLANK)
+    x = 0
+    for source, width in cells:
+        try:
+            with Image.open(source) as image:
+                image.draft('RGB', (width, THUMB_HEIGHT))
+                image = image.convert('RGB')
+                visible = min(image.height, round(image.width * MAX_THUMB_ASPECT))
+                thumb = image.crop((0, 0, image.width, visible)).resize((width, THUMB_HEIGHT), Image.LANCZOS)
+                strip.paste(thumb, (x, 0))
+        except Exception as e:
+            # One unreadable page leaves a blank cell, not a missing strip
+            logger.warning(f"Cannot make a thumbnail of {source}: {e}")
+        x += width
+    save_image(strip, path, 'JPEG', SPRITE_QUALITY)
+    return path
+
+
+def build_thumbs(book_path: Path, pages: List[Tuple[str, str, str, Optional[Tuple[int, int]]]],
+                 workers: Optional[int] = None) -> Thumbs:
+    """
+    Make the missing strips of a book and drop unreferenced ones.
+
+    Args:
+        book_path: Book folder
+        pages: (url in the readers, content hash, file relative to the book
+            to decode, (width, height) or None) in reading order
+        workers: Worker processes (default: number of CPUs)
+
+    Returns:
+        The thumbnail of every page (see ``Thumbs``)
+    """
+    if Image is None:
+        logger.info("Pillow is not installed; skipping scrubber thumbnails")
+        return {}
+
+    book_path = Path(book_path)
+    out_dir = scrubber_dir(book_path)
+    prefix = out_dir.relative_to(book_path).as_posix()
+    planned: Dict[str, List[Tuple[str, int, int]]] = {}
+    missing: Dict[str, List[Tuple[str, int]]] = {}
+    for start in range(0, len(pages), SPRITE_PAGES):
+        group = pages[start:start + SPRITE_PAGES]
+        name = sprite_name([digest for _, digest, _, _ in group])
+        cells = []
+        x = 0
+        for url, _, source, size in group:
+            width = thumb_width(*(size or _DEFAULT_SIZE))
+            cells.append((url, x, width))
+            x += width
+        planned[name] = cells
+        if not (out_dir / name).exists():
+            missing[name] = [(str(book_path / source), width)
+                             for (_, _, source, _), (_, _, width) in zip(group, cells)]
+
+    failed = set()
+    if missing:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            futures = {executor.submit(_pack, cells, str(out_dir / name)): name
+                       for name, cells in missing.items()}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.warning(f"Cannot make scrubber strip {name} of {book_path}: {e}")
+                    failed.add(name)
+        logger.info(f"Made {len(missing) - len(failed)} scrubber strips ({len(failed)} failed)")
+
+    result: Thumbs = {}
+    for name, cells in planned.items():
+        if name not in failed:
+            result.update((url, (f"{prefix}/{name}", x, width)) for url, x, width in cells)
+    _prune(out_dir, set(planned) - failed)
+    return result
+
+
+def _prune(out_dir: Path, keep: set):
+    """Remove strips (and temp files of interrupted runs) no reader references."""
+    try:
+        entries = list(os.scandir(out_dir))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.is_file() and entry.name not in keep:
+            try:
+                os.unlink(entry.path)
+            except OSError as e:
+                logger.warning(f"Cannot remove stale scrubber strip {entry.path}: {e}")
+
+
+def scrubber_json(thumbs: Thumbs, urls: List[str]) -> str:
+    """
+    Offset table of a reader's pages as a JS literal (``null`` without thumbnails).
+
+    ``{"height": px, "strips": [url, ...], "pages": [[strip, x, width], ...]}``
+    with one entry per page in reading order (0 for pages without one).
+    """
+    if not thumbs:
+        return 'null'
+    strips: Dict[str, int] = {}
+    entries = []
+    for url in urls:
+        thumb = thumbs.get(url)
+        if thumb:
+            strip, x, width = thumb
+            entries.append([strips.setdefault(strip, len(strips)), x, width])
+        else:
+            entries.append(0)
+    return json.dumps({'height': THUMB_HEIGHT, 'strips': list(strips), 'pages': entries}, separators=(',', ':'))
+
+
+def scrubber_script(indent: str = '') -> str:
+    """
+    ``ScrubberPreview`` JS class of the readers' progress slider.
+
+    ``new ScrubberPreview(container, table)`` adds the preview bubble to the
+    slider container; ``show(page, ratio, label)`` moves it over the thumb
+    and ``hide()`` removes it. ``table`` is ``scrubber_json()``'s output.
+
+    Args:
+        indent: Prefix of every line, to match the surrounding script
+    """
+    script = """
+// Slider preview: page thumbnails from sprite strips (only the strips
+// dragged over are downloaded), full pages load where the slider is released
+class ScrubberPreview {
+    constructor(container, table) {
+        this.table = table;
+        this.element = document.createElement('div');
+        this.element.className = 'scrubber-preview';
+        this.thumb = document.createElement('div');
+        this.thumb.className = 'scrubber-thumb';
+        this.label = document.createElement('div');
+        this.label.className = 'scrubber-label';
+        this.element.append(this.thumb, this.label);
+        container.appendChild(this.element);
+    }
+
+    show(page, ratio, label) {
+        const entry = this.table && this.table.pages[page - 1];
+        this.thumb.hidden = !entry;
+        if (entry) {
+            const [strip, x, width] = entry;
+            this.thumb.style.backgroundImage = `url("${this.table.strips[strip]}")`;
+            this.thumb.style.backgroundPosition = `-${x}px 0`;
+            this.thumb.style.width = `${width}px`;
+            this.thumb.style.height = `${this.table.height}px`;
+        }
+        this.label.textContent = label;
+        // Kept clear of the screen edges
+        this.element.style.left = `${Math.min(90, Math.max(10, ratio * 100))}%`;
+        this.element.classList.add('visible');
+    }
+
+    hide() {
+        this.element.classList.remove('visible');
+    }
+}
+"""
+    return textwrap.indent(script, indent)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Cache Invalidation Notifications for the Running Server
+
+Tells a local manga server which books a generation run changed, so it stops
+serving cached HTML and covers right away instead of waiting for its file
+watcher debounce or periodic rescan:
+- Changed book IDs (folder names) and files are collected during the run
+- Sent in batches as one JSON POST to ``/api/invalidate``
+- Loopback HTTP (``http://127.0.0.1:PORT``, or just the port) or the
+  server's Unix socket (``unix:/path/to/socket``)
+- Best effort: an unreachable server only logs a warning
+
+Author: mastersamasama
+Version: 1.0
+"""
+
+import http.client
+import json
+import logging
+import socket
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+logger = logging.getLogger(__name__)
+
+
+INVALIDATE_PATH = '/api/invalidate'
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP over a Unix domain socket."""
+
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def parse_target(target: str) -> Tuple[str, str, int]:
+    """
+    Parse a server address.
+
+    Accepts ``unix:/path/to/socket``, ``http://host:port``, ``host:port``
+    or a bare port (loopback is assumed).
+
+    Returns:
+        Tuple of (``unix`` or ``http``, socket path or host, port)
+
+    Raises:
+        ValueError: If the address cannot be parsed
+    """
+    target = target.strip()
+    if target.startswith('unix:'):
+        socket_path = target[len('unix:'):]
+        if not socket_path:
+            raise ValueError(f"Invalid server address '{target}': missing socket path")
+        if not hasattr(socket, 'AF_UNIX'):
+            raise ValueError("Unix sockets are not supported on this platform")
+        return 'unix', socket_path, 0
+    if target.isdigit():
+        return 'http', '127.0.0.1', int(target)
+
+    parts = urlsplit(target if '://' in target else f"http://{target}")
+    if parts.scheme != 'http' or not parts.hostname:
+        raise ValueError(f"Invalid server address '{target}', expected http://host:port or unix:PATH")
+    try:
+        port = parts.port or 80
+    except ValueError:
+        raise ValueError(f"Invalid port in server address '{target}'") from None
+    return 'http', parts.hostname, port
+
+
+class ServerNotifier:
+    """
+    Collects changed books and files and posts them to the server in batches.
+
+    Usage::
+
+        notifier = ServerNotifier('127.0.0.1:3000', library)
+        notifier.book_changed(book_folder, reader_path)
+        notifier.path_changed(library / 'index.html')
+        notifier.flush()
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, target: str, library: Path, batch_size: int = 500, timeout: float = 5.0):
+        self.kind, self.address, self.port = parse_target(target)
+        self.target = target
+        self.library = Path(library).resolve()
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.sent = 0
+        self.failed = 0
+        self.evicted = 0
+
+        self._books: Dict[str, None] = {}
+        self._paths: Dict[str, None] = {}
+        self._lock = threading.Lock()
+
+    def book_changed(self, book: Path, *paths: Path):
+        """Record that files of a book were rewritten (its cache entries are stale)."""
+        book = Path(book)
+        with self._lock:
+            self._books[book.name] = None
+            for path in paths:
+                relative = self._relative(path)
+                if relative:
+                    self._paths[relative] = None
+            full = len(self._books) + len(self._paths) >= self.batch_size
+        if full:
+            self.flush()
+
+    def path_changed(self, path: Path):
+        """Record a rewritten file outside of any book (e.g. the bookshelf)."""
+        relative = self._relative(path)
+        if not relative:
+            return
+        with self._lock:
+            self._paths[relative] = None
+            full = len(self._books) + len(self._paths) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self) -> bool:
+        """
+        Send everything collected so far.
+
+        Returns:
+            True if there was nothing to send or the server accepted it
+        """
+        with self._lock:
+            books, paths = list(self._books), list(self._paths)
+            self._books.clear()
+            self._paths.clear()
+        if not books and not paths:
+            return True
+
+        payload = {'library': self.library.name, 'books': books, 'paths': paths}
+        try:
+            response = self._post(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            self.failed += len(books) + len(paths)
+            logger.warning(f"Could not notify server at {self.target}: {e}")
+            return False
+
+        self.sent += len(books) + len(paths)
+        self.evicted += response.get('evicted', 0)
+        logger.info(f"Notified server of {len(books)} changed books and {len(paths)} files "
+                    f"({response.get('evicted', 0)} cache entries evicted)")
+        return True
+
+    def _relative(self, path: Path) -> Optional[str]:
+        """Library-relative URL path, or None for files outside the library."""
+        try:
+            return Path(path).resolve().relative_to(self.library).as_posix()
+        except ValueError:
+            logger.debug(f"Not notifying server of file outside the library: {path}")
+            return None
+
+    def _post(self, body: bytes) -> Dict:
+        if self.kind == 'unix':
+            connection = _UnixHTTPConnection(self.address, self.timeout)
+        else:
+            connection = http.client.HTTPConnection(self.address, self.port, timeout=self.timeout)
+        try:
+            connection.request('POST', INVALIDATE_PATH, body=body, headers={
+                'Content-Type': 'application/json',
+                'Content-Length': str(len(body)),
+            })
+            response = connection.getresponse()
+            data = response.read()
+            if response.status != 200:
+                raise http.client.HTTPException(f"HTTP {response.status}: {data[:200].decode('utf-8', 'replace')}")
+            return json.loads(data) if data else {}
+        finally:
+            connection.close()
+
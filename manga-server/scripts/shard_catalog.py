@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Shard Mode Support for Multi-Node Generation
+
+Lets several machines share one full-library generation without any
+coordination service:
+- ``--shard i/N`` assigns every book to exactly one node by a stable hash
+  of its folder name (the same on every machine and Python version)
+- Each node writes a partial catalog (JSON) for the books it owns
+- A merge step combines the partial catalogs into the final bookshelf and
+  the server's persistent index (data/manga-index.json)
+
+Author: mastersamasama
+Version: 1.0
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+CATALOG_VERSION = 1
+
+# Server index used by PersistentMangaIndex in src/optimized-server.ts
+DEFAULT_SERVER_INDEX = Path(__file__).resolve().parent.parent / 'data' / 'manga-index.json'
+
+
+def stable_hash(name: str) -> int:
+    """Hash that is identical across processes and machines (unlike ``hash()``)."""
+    return int.from_bytes(hashlib.sha1(name.encode('utf-8')).digest()[:8], 'big')
+
+
+@dataclass(frozen=True)
+class ShardSpec:
+    """Shard ``index`` (0-based) of ``count`` shards."""
+    index: int
+    count: int
+
+    @classmethod
+    def parse(cls, text: str) -> 'ShardSpec':
+        """
+        Parse ``i/N``, e.g. ``0/4`` for the first of four shards.
+
+        Raises:
+            ValueError: If the text is not a valid shard spec
+        """
+        try:
+            index, count = (int(part) for part in text.split('/'))
+        except ValueError:
+            raise ValueError(f"Invalid shard '{text}', expected i/N (e.g. 0/4)") from None
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"Invalid shard '{text}': need 0 <= i < N")
+        return cls(index, count)
+
+    def owns(self, folder_name: str) -> bool:
+        """Whether the book folder belongs to this shard."""
+        return stable_hash(folder_name) % self.count == self.index
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+    @property
+    def catalog_name(self) -> str:
+        """Default partial catalog file name for this shard."""
+        return f"catalog.shard-{self.index}-of-{self.count}.json"
+
+
+def write_partial_catalog(output_path: Path, library: Path, shard: ShardSpec,
+                          entries: List[Dict]) -> Path:
+    """
+    Write the catalog of one shard.
+
+    Args:
+        output_path: Catalog file to write
+        library: Library root the entries belong to
+        shard: Shard the entries were generated for
+        entries: One dict per book; ``folder`` is the folder name and all
+            links are relative to the library root, so nodes may mount the
+            library at different paths
+    """
+    data = {
+        'version': CATALOG_VERSION,
+        'library': library.name,
+        'shard': str(shard),
+        'generated_at': time.time(),
+        'books': entries,
+    }
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = output_path.with_name(output_path.name + '.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(temp_path, output_path)
+
+    logger.info(f"Wrote partial catalog for shard {shard} ({len(entries)} books): {output_path}")
+    return output_path
+
+
+def load_partial_catalogs(paths: List[Path]) -> Tuple[List[Dict], List[str]]:
+    """
+    Load and combine partial catalogs.
+
+    Books are deduplicated by folder name (the newest catalog wins) and
+    returned sorted by folder name.
+
+    Returns:
+        Tuple of (book entries, warnings about missing or inconsistent shards)
+
+    Raises:
+        ValueError: If a catalog has an unsupported version
+    """
+    catalogs = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != CATALOG_VERSION:
+            raise ValueError(f"Unsupported catalog version in {path}: {data.get('version')}")
+        catalogs.append(data)
+
+    warnings = []
+    counts = {ShardSpec.parse(c['shard']).count for c in catalogs}
+    if len(counts) > 1:
+        warnings.append(f"Catalogs were generated with different shard counts: {sorted(counts)}")
+    for count in counts:
+        present = {ShardSpec.parse(c['shard']).index for c in catalogs
+                   if ShardSpec.parse(c['shard']).count == count}
+        missing = sorted(set(range(count)) - present)
+        if missing:
+            warnings.append(f"Missing shards of {count}: {', '.join(str(i) for i in missing)}")
+
+    books: Dict[str, Dict] = {}
+    for catalog in sorted(catalogs, key=lambda c: c.get('generated_at', 0)):
+        for entry in catalog['books']:
+            books[entry['folder']] = entry
+
+    return [books[name] for name in sorted(books)], warnings
+
+
+def server_index_item(entry: Dict) -> Dict:
+    """Convert a catalog entry to a ``MangaItem`` of the server index."""
+    name = entry['folder']
+    modified = datetime.fromtimestamp(entry.get('last_modified', 0), timezone.utc)
+    return {
+        'id': name,
+        # Same rule as MangaScanner.extractTitle in the server
+        'title': name.split('.')[-1].strip(),
+        'path': name,
+        'readerUrl': f"/{entry['reader_link']}" if entry.get('reader_link') else None,
+        'coverUrl': f"/{entry['cover_image']}" if entry.get('cover_image') else None,
+        'chapters': entry.get('subfolders') or (1 if entry.get('page_count') else 0),
+        'totalPages': entry.get('page_count', 0),
+        # JavaScript Date.toISOString() format, compared against folder mtimes
+        'lastModified': modified.strftime('%Y-%m-%dT%H:%M:%S.') + f"{modified.microsecond // 1000:03d}Z",
+    }
+
+
+def write_server_index(entries: List[Dict], output_path: Optional[Path] = None) -> Path:
+    """Write the server's persistent index so it starts without a full scan."""
+    output_path = Path(output_path or DEFAULT_SERVER_INDEX)
+    items = sorted((server_index_item(entry) for entry in entries), key=lambda item: item['id'])
+    data = {
+        'items': items,
+        'timestamp': int(time.time() * 1000),
+    }
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = output_path.with_name(output_path.name + '.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(temp_path, output_path)
+
+    logger.info(f"Wrote server index ({len(items)} manga): {output_path}")
+    return output_path
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Per-Stage Profiler for the Generation Pipeline
+
+Collects cProfile and tracemalloc data separately for each named stage
+(scan, analyze, render, write) instead of one mixed whole-run profile:
+- One .pstats file per stage (open with pstats or snakeviz)
+- Top-N allocation sites per stage from tracemalloc snapshot diffs
+- Optional sampling mode: time every book cheaply, then replay and
+  profile only the K slowest books
+
+Author: mastersamasama
+Version: 1.0
+"""
+
+import cProfile
+import logging
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StageProfile:
+    """Profiling data accumulated for one stage."""
+    name: str
+    profile: cProfile.Profile = field(default_factory=cProfile.Profile)
+    calls: int = 0
+    total_time: float = 0.0
+    peak_memory: int = 0
+    # Allocation site -> (bytes, blocks) allocated and not yet freed by stage end
+    allocations: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+
+
+class StageProfiler:
+    """
+    Profiles named pipeline stages separately.
+
+    Stage names are ``component.stage`` (e.g. ``reader.render``,
+    ``shelf.scan``); the ``stages`` filter accepts either the full name or
+    the bare stage name, which then matches every component.
+
+    With ``slowest_k`` set, the profiler starts in sampling mode: per-book
+    stages are only timed. ``replay_slowest`` then re-runs the K slowest
+    books with cProfile/tracemalloc enabled, so profiling a huge library
+    costs little more than a normal run.
+    """
+
+    def __init__(self, output_dir: Path, stages: Optional[Set[str]] = None,
+                 top_n: int = 25, trace_memory: bool = True, slowest_k: Optional[int] = None):
+        self.output_dir = Path(output_dir)
+        self.stages = set(stages) if stages else None
+        self.top_n = top_n
+        self.trace_memory = trace_memory
+        self.slowest_k = slowest_k
+        self.sampling = slowest_k is not None
+
+        self._profiles: Dict[str, StageProfile] = {}
+        self._book_times: Dict[str, float] = {}
+        self._active: Optional[str] = None
+        self._started_tracemalloc = False
+
+        if not self.sampling:
+            self._start_memory_tracing()
+
+    def wants(self, name: str) -> bool:
+        """Whether the stage passes the stage filter."""
+        if self.stages is None:
+            return True
+        return name in self.stages or name.rsplit('.', 1)[-1] in self.stages
+
+    @contextmanager
+    def stage(self, name: str, book: Optional[str] = None):
+        """
+        Profile one invocation of a stage.
+
+        Args:
+            name: Stage name, e.g. ``reader.scan``
+            book: Book key (folder path) for per-book stages; in sampling
+                mode these are only timed and attributed to the book
+        """
+        # cProfile cannot nest; stages opened inside a profiled stage count toward it
+        if self._active is not None or not self.wants(name):
+            yield
+            return
+
+        if self.sampling and book is not None:
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                elapsed = time.perf_counter() - start
+                self._book_times[book] = self._book_times.get(book, 0.0) + elapsed
+            return
+
+        stats = self._profiles.setdefault(name, StageProfile(name))
+        before = self._snapshot()
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+
+        self._active = name
+        start = time.perf_counter()
+        stats.profile.enable()
+        try:
+            yield
+        finally:
+            stats.profile.disable()
+            stats.total_time += time.perf_counter() - start
+            stats.calls += 1
+            self._active = None
+
+            if before is not None:
+                _, peak = tracemalloc.get_traced_memory()
+                stats.peak_memory = max(stats.peak_memory, peak)
+                self._accumulate_allocations(stats, before, self._snapshot())
+
+    def slowest_books(self) -> List[Tuple[str, float]]:
+        """The K slowest books seen in sampling mode, slowest first."""
+        ranked = sorted(self._book_times.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:self.slowest_k or 0]
+
+    def replay_slowest(self, replay: Callable[[str], None]):
+        """
+        Profile the K slowest books by running ``replay(book)`` for each.
+
+        ``replay`` must re-run the per-book stages of that book; they are
+        profiled normally because sampling mode is switched off first.
+        """
+        if not self.sampling:
+            return
+
+        slowest = self.slowest_books()
+        self.sampling = False
+        self._start_memory_tracing()
+
+        logger.info(f"Profiling the {len(slowest)} slowest books...")
+        for book, elapsed in slowest:
+            logger.info(f"  {elapsed:.3f}s  {book}")
+            try:
+                replay(book)
+            except Exception as e:
+                logger.warning(f"Failed to profile {book}: {e}")
+
+    def dump(self) -> List[Path]:
+        """Write one .pstats and one allocation report per stage."""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        written = []
+
+        for name, stats in sorted(self._profiles.items()):
+            pstats_path = self.output_dir / f"{name}.pstats"
+            stats.profile.dump_stats(str(pstats_path))
+            written.append(pstats_path)
+
+            if stats.allocations:
+                memory_path = self.output_dir / f"{name}.tracemalloc.txt"
+                with open(memory_path, 'w', encoding='utf-8') as f:
+                    f.write(self._format_allocations(stats))
+                written.append(memory_path)
+
+            logger.info(f"Profiled {name}: {stats.calls} calls, {stats.total_time:.3f}s")
+
+        if self.slowest_k is not None:
+            books_path = self.output_dir / "slowest-books.txt"
+            with open(books_path, 'w', encoding='utf-8') as f:
+                for book, elapsed in self.slowest_books():
+                    f.write(f"{elapsed:.6f}\t{book}\n")
+            written.append(books_path)
+
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+        logger.info(f"Wrote {len(written)} profiling files to {self.output_dir}")
+        return written
+
+    def _start_memory_tracing(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def _snapshot(self) -> Optional[tracemalloc.Snapshot]:
+        if not (self.trace_memory and tracemalloc.is_tracing()):
+            return None
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    def _accumulate_allocations(self, stats: StageProfile,
+                                before: tracemalloc.Snapshot, after: tracemalloc.Snapshot):
+        for diff in after.compare_to(before, 'lineno'):
+            if diff.size_diff <= 0:
+                continue
+            frame = diff.traceback[0]
+            site = f"{frame.filename}:{frame.lineno}"
+            size, count = stats.allocations.get(site, (0, 0))
+            stats.allocations[site] = (size + diff.size_diff, count + max(0, diff.count_diff))
+
+    def _format_allocations(self, stats: StageProfile) -> str:
+        ranked = sorted(stats.allocations.items(), key=lambda item: item[1][0], reverse=True)
+        lines = [
+            f"Stage: {stats.name}",
+            f"Calls: {stats.calls}",
+            f"Peak traced memory: {stats.peak_memory / 1024 / 1024:.2f} MiB",
+            f"Top {self.top_n} allocation sites (retained at stage end, summed over calls):",
+            "",
+        ]
+        for site, (size, count) in ranked[:self.top_n]:
+            lines.append(f"{size / 1024:12.1f} KiB {count:10d} blocks  {site}")
+        return '\n'.join(lines) + '\n'
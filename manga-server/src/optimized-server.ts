@@ -11,7 +11,9 @@
 
 import { serve, file, write } from "bun";
 import { readdir, stat, watch, readFile } from "node:fs/promises";
+import { unlinkSync } from "node:fs";
 import { join, resolve, extname, relative } from "node:path";
+import { dirname, basename } from "node:path";
 import { createHash } from "node:crypto";
 
 // Import Integrated Optimization System
@@ -261,6 +263,10 @@ const CONFIG = {
   corsOrigin: process.env.CORS_ORIGIN || "*",
   backgroundIndexing: process.env.BACKGROUND_INDEXING !== "false",
   
+  // Cache invalidation from the generators (POST /api/invalidate)
+  notifySocket: process.env.MANGA_NOTIFY_SOCKET || "", // Extra Unix socket listener, e.g. /tmp/manga-server.sock
+  maxInvalidateItems: parseInt(process.env.MAX_INVALIDATE_ITEMS || "10000"),
+  
   // Rate limiting DISABLED for 64GB high-performance setup
   rateLimit: {
     enabled: false, // FORCE DISABLED - user has 64GB RAM
@@ -411,6 +417,23 @@ class UltraFastCacheManager {
     }
   }
 
+  // Targeted eviction (cache invalidation notifications)
+  delete(key: string): boolean {
+    const entry = this.cache.get(key);
+    if (!entry) return false;
+    
+    MEMORY_POOL.return(entry.data);
+    this.cache.delete(key);
+    this.accessTimes.delete(key);
+    this.responseTimes.delete(key);
+    this.currentSize -= entry.size;
+    return true;
+  }
+
+  keys(): IterableIterator<string> {
+    return this.cache.keys();
+  }
+
   // Ultra-aggressive memory pressure adaptation
   adaptToMemoryPressure() {
     const memUsage = process.memoryUsage();
@@ -613,7 +636,7 @@ class PersistentMangaIndex {
       let updated = false;
       
       for (const entry of entries) {
-        if (entry.isDirectory()) {
+        if (entry.isDirectory() && !entry.name.startsWith('.')) {
           const existing = this.index.find(m => m.id === entry.name);
           const mangaPath = join(this.rootPath, entry.name);
           const stats = await stat(mangaPath);
@@ -673,6 +696,47 @@ class PersistentMangaIndex {
     return this.index;
   }
   
+  /**
+   * Re-read only the given books (after a generator notification) instead of
+   * rescanning the collection. Books whose folder is gone are dropped.
+   */
+  async refresh(ids: string[]): Promise<{ updated: string[]; removed: string[] }> {
+    const updated: string[] = [];
+    const removed: string[] = [];
+    
+    for (const id of ids) {
+      const mangaPath = join(this.rootPath, id);
+      let metadata: MangaItem | null = null;
+      try {
+        if ((await stat(mangaPath)).isDirectory()) {
+          metadata = await this.extractMetadata(mangaPath);
+        }
+      } catch {
+        // Folder removed
+      }
+      
+      const existing = this.index.findIndex(m => m.id === id);
+      if (metadata) {
+        if (existing >= 0) {
+          Object.assign(this.index[existing], metadata);
+        } else {
+          this.index.push(metadata);
+          this.index.sort((a, b) => a.id.localeCompare(b.id));
+        }
+        updated.push(id);
+      } else if (existing >= 0) {
+        this.index.splice(existing, 1);
+        removed.push(id);
+      }
+    }
+    
+    if (updated.length || removed.length) {
+      this.buildInvertedIndex();
+      await this.saveToDisk();
+    }
+    return { updated, removed };
+  }
+  
   get(id: string): MangaItem | null {
     return this.index.find(m => m.id === id) || null;
   }
@@ -684,6 +748,12 @@ class PersistentMangaIndex {
   }
 }
 
+// Library-relative path from an invalidation request (no traversal, not absolute)
+function isSafeRelativePath(path: unknown): path is string {
+  return typeof path === 'string' && path.length > 0 && path.length < 1024 &&
+    !path.split(/[/\\]/).some(part => part === '' || part === '.' || part === '..');
+}
+
 // Debounce utility
 function debounce(func: Function, wait: number) {
   let timeout: Timer | null = null;
@@ -707,7 +777,7 @@ class MangaScanner {
       const entries = await readdir(this.rootPath, { withFileTypes: true });
       
       for (const entry of entries) {
-        if (entry.isDirectory()) {
+        if (entry.isDirectory() && !entry.name.startsWith('.')) {
           const mangaPath = join(this.rootPath, entry.name);
           const metadata = await this.extractMetadata(mangaPath);
           
@@ -729,14 +799,15 @@ class MangaScanner {
       const name = mangaPath.split(/[/\\]/).pop() || '';
       const files = await readdir(mangaPath, { recursive: true });
       
-      // Find reader HTML files
-      const readerFile = files.find(f => 
-        f === 'index-mb.html' || f === 'index.html'
-      );
+      // Find reader HTML files; the generator records the reader mode it chose in the book manifest
+      const manifestReader = await this.readManifestReader(mangaPath);
+      const readerFile = (manifestReader && files.includes(manifestReader) ? manifestReader : undefined) ??
+        files.find(f => f === 'index-mb.html' || f === 'index.html');
       
       // Find image files for pages and cover
+      // Hidden folders hold generated files (.manga-gen variants), never pages
       const imageFiles = files.filter(f => 
-        /\.(jpg|jpeg|png|webp|gif|avif)$/i.test(f)
+        /\.(jpg|jpeg|png|webp|gif|avif)$/i.test(f) && !/(^|[/\\])\./.test(f)
       ).sort();
       
       const coverImage = imageFiles[0];
@@ -758,6 +829,16 @@ class MangaScanner {
     }
   }
 
+  private async readManifestReader(mangaPath: string): Promise<string | null> {
+    try {
+      const manifest = JSON.parse(await readFile(join(mangaPath, 'book-manifest.json'), 'utf-8'));
+      const readerFile = manifest?.reader?.file;
+      return typeof readerFile === 'string' ? readerFile : null;
+    } catch {
+      return null;  // No manifest (older generator) or unreadable
+    }
+  }
+
   private extractTitle(folderName: string): string {
     // Extract title from folder name (e.g., "0001.Manga Title" -> "Manga Title")
     return folderName.split('.').slice(-1)[0].trim();
@@ -771,7 +852,7 @@ class MangaScanner {
       
       let chapterNumber = 1;
       for (const entry of entries) {
-        if (entry.isDirectory()) {
+        if (entry.isDirectory() && !entry.name.startsWith('.')) {
           const chapterPath = join(mangaPath, entry.name);
           const images = await this.getImages(chapterPath);
           
@@ -839,6 +920,8 @@ class StaticHandler {
   private activeStreams = 0;
   private readonly maxConcurrentStreams = CONFIG.connectionPoolSize;
   private readonly etagCache = new Map<string, string>();
+  // Book manifest path -> preload hints per reader file, reloaded when the manifest changes
+  private readonly hintsCache = new Map<string, { mtimeMs: number; hints: Record<string, any[]> }>();
 
   constructor(
     private readonly rootPath: string,
@@ -919,9 +1002,12 @@ class StaticHandler {
         return this.handleRangeRequest(bunFile, range, etag);
       }
 
+      // Preload the reader's first pages as soon as the headers arrive
+      const preloadHeaders = ext === '.html' ? await this.getPreloadHeaders(resolvedPath, pathname) : {};
+
       // Use zero-copy streaming for large files (ultra-fast)
       if (fileSize > CONFIG.streamingThreshold) {
-        return this.handleZeroCopyStreaming(bunFile, etag, ext);
+        return this.handleZeroCopyStreaming(bunFile, etag, ext, preloadHeaders);
       }
       
       // Handle small files with compression and caching
@@ -932,8 +1018,9 @@ class StaticHandler {
         'Content-Type': this.getMimeType(ext),
         'Content-Length': String(fileSize),
         'ETag': etag,
-        'Cache-Control': this.getCacheControl(ext),
+        'Cache-Control': this.getCacheControl(ext, pathname),
         'Accept-Ranges': 'bytes',
+        ...preloadHeaders,
         ...this.getCorsHeaders()
       };
 
@@ -960,7 +1047,67 @@ class StaticHandler {
     }
   }
 
-  private async handleZeroCopyStreaming(bunFile: any, etag: string, ext: string): Promise<Response> {
+  /**
+   * Evict cached files after regeneration: exact library-relative paths
+   * and everything below the given book folders.
+   */
+  invalidate(paths: string[], books: string[]): number {
+    const keys = new Set(paths.map(path => `static:/${path}`));
+    const prefixes = books.map(book => `static:/${book}/`);
+    let evicted = 0;
+    
+    for (const key of Array.from(this.cache.keys())) {
+      if (keys.has(key) || prefixes.some(prefix => key.startsWith(prefix))) {
+        if (this.cache.delete(key)) evicted++;
+      }
+    }
+    return evicted;
+  }
+
+  /**
+   * `Link: rel=preload` header for a generated reader, built from the hints the
+   * generator stored in the book manifest. Sent with the page itself; proxies
+   * and CDNs that support it turn it into a 103 Early Hints response.
+   */
+  private async getPreloadHeaders(resolvedPath: string, pathname: string): Promise<Record<string, string>> {
+    const manifestPath = join(dirname(resolvedPath), 'book-manifest.json');
+    try {
+      const { mtimeMs } = await stat(manifestPath);
+      let entry = this.hintsCache.get(manifestPath);
+      if (!entry || entry.mtimeMs !== mtimeMs) {
+        const manifest = JSON.parse(await readFile(manifestPath, 'utf-8'));
+        entry = { mtimeMs, hints: manifest?.hints ?? {} };
+        this.hintsCache.set(manifestPath, entry);
+      }
+
+      // Content-hashed copies (index-mb.<hash>.html) share the hints of their canonical file
+      const name = basename(resolvedPath).replace(/\.[0-9a-f]{10}(\.html)$/, '$1');
+      const hints = entry.hints[name];
+      if (!Array.isArray(hints) || hints.length === 0) return {};
+
+      const baseUrl = pathname.slice(0, pathname.lastIndexOf('/') + 1).split('/').map(encodeURIComponent).join('/');
+      const links = hints
+        .filter(hint => typeof hint?.href === 'string')
+        .map(hint => {
+          const href = baseUrl + hint.href.split('/').map(encodeURIComponent).join('/');
+          const priority = hint.fetchpriority ? `; fetchpriority=${hint.fetchpriority}` : '';
+          // Responsive pages: preload the candidate the <img> will pick, not the original
+          const srcset = typeof hint.imagesrcset === 'string'
+            ? `; imagesrcset="${hint.imagesrcset.split(', ').map((candidate: string) => {
+                const [url, width] = candidate.split(' ');
+                return `${baseUrl}${url} ${width}`;  // Candidate URLs are already percent-encoded
+              }).join(', ')}"; imagesizes="${hint.imagesizes}"`
+            : '';
+          return `<${href}>; rel=preload; as=${hint.as || 'image'}${srcset}${priority}`;
+        });
+      return links.length ? { 'Link': links.join(', ') } : {};
+    } catch {
+      return {};  // Not a generated reader, or generated before manifests existed
+    }
+  }
+
+  private async handleZeroCopyStreaming(bunFile: any, etag: string, ext: string,
+                                        extraHeaders: Record<string, string> = {}): Promise<Response> {
     // NO STREAM LIMITS - 64GB RAM can handle unlimited concurrent streams
     this.activeStreams++; // Monitoring only
     const self = this;
@@ -973,8 +1120,9 @@ class StaticHandler {
         'Content-Type': this.getMimeType(ext),
         'Content-Length': String(bunFile.size),
         'ETag': etag,
-        'Cache-Control': this.getCacheControl(ext),
+        'Cache-Control': this.getCacheControl(ext, bunFile.name || ''),
         'Accept-Ranges': 'bytes',
+        ...extraHeaders,
         ...this.getCorsHeaders()
       }
     });
@@ -1057,7 +1205,15 @@ class StaticHandler {
     return { data, headers: {} };
   }
 
-  private getCacheControl(ext: string): string {
+  private getCacheControl(ext: string, pathname: string = ''): string {
+    // Content-hashed generator output (index-mb.<hash>.html) never changes under its name
+    if (/\.[0-9a-f]{10}\.[a-z0-9]+$/.test(pathname)) {
+      return 'public, max-age=31536000, immutable';
+    }
+    // Generated per book; browsers must see a changed page list right away
+    if (/(^|\/)(reader-sw\.js|book-assets\.json)$/.test(pathname)) {
+      return 'no-cache';
+    }
     if (['.jpg', '.jpeg', '.png', '.webp', '.avif', '.gif'].includes(ext)) {
       return 'public, max-age=31536000, immutable'; // 1 year for images
     }
@@ -1496,7 +1652,10 @@ class MangaServer {
       const url = new URL(request.url);
       let response: Response;
       
-      if (url.pathname.startsWith('/api/')) {
+      if (url.pathname === '/api/invalidate') {
+        // Generator notifications bypass the pipeline's response cache
+        response = await this.handleInvalidate(request, this.isLoopbackRequest(request, server));
+      } else if (url.pathname.startsWith('/api/')) {
         // Handle stats directly through optimization system for full metrics
         if (url.pathname === '/api/stats') {
           response = await this.getStats();
@@ -1525,6 +1684,64 @@ class MangaServer {
     }
   }
 
+  /**
+   * Apply a batched change notification from the generators
+   * (scripts/server_notify.py): evict the changed books' cached files and
+   * re-read just their index entries instead of rescanning the collection.
+   */
+  private async handleInvalidate(request: Request, trusted: boolean): Promise<Response> {
+    const json = (data: any, status: number = 200) => new Response(JSON.stringify(data), {
+      status,
+      headers: { 'Content-Type': 'application/json' }
+    });
+    
+    if (!trusted) {
+      return json({ error: 'Forbidden' }, 403);
+    }
+    if (request.method !== 'POST') {
+      return json({ error: 'Method Not Allowed' }, 405);
+    }
+    
+    let body: any;
+    try {
+      body = await request.json();
+    } catch {
+      return json({ error: 'Invalid JSON body' }, 400);
+    }
+    
+    const books = Array.isArray(body?.books) ? body.books : [];
+    const paths = Array.isArray(body?.paths) ? body.paths : [];
+    if (books.length + paths.length > CONFIG.maxInvalidateItems) {
+      return json({ error: `At most ${CONFIG.maxInvalidateItems} books and paths per request` }, 413);
+    }
+    // Book IDs are top-level folder names
+    const invalid = [
+      ...books.filter((id: unknown) => !isSafeRelativePath(id) || /[/\\]/.test(id) || id.startsWith('.')),
+      ...paths.filter((path: unknown) => !isSafeRelativePath(path))
+    ];
+    if (invalid.length) {
+      return json({ error: 'Invalid book IDs or paths', invalid: invalid.slice(0, 10) }, 400);
+    }
+    
+    let evicted = this.staticHandler.invalidate(paths, books);
+    const { updated, removed } = await this.persistentIndex.refresh(books);
+    
+    // Cached list pages embed the changed index entries
+    if (updated.length || removed.length) {
+      for (const key of Array.from(this.cache.keys())) {
+        if (key.startsWith('api:') && this.cache.delete(key)) evicted++;
+      }
+    }
+    
+    console.log(`♻️ Invalidated ${books.length} books and ${paths.length} files (${evicted} cache entries evicted)`);
+    return json({ evicted, updated, removed });
+  }
+
+  private isLoopbackRequest(request: Request, server?: any): boolean {
+    const address: string = server?.requestIP?.(request)?.address || '';
+    return address === '::1' || address.startsWith('127.') || address.startsWith('::ffff:127.');
+  }
+
   /**
    * Generate comprehensive system stats including optimization metrics
    */
@@ -1648,6 +1865,22 @@ class MangaServer {
     
     // Server instance stored by bulletproof system
     
+    // Local-only invalidation endpoint; access is controlled by the socket file permissions
+    if (CONFIG.notifySocket) {
+      try {
+        unlinkSync(CONFIG.notifySocket); // Left over from a previous run
+      } catch {
+        // Did not exist
+      }
+      serve({
+        unix: CONFIG.notifySocket,
+        fetch: (request) => new URL(request.url).pathname === '/api/invalidate'
+          ? this.handleInvalidate(request, true)
+          : new Response('Not Found', { status: 404 })
+      });
+      console.log(`♻️ Cache invalidation socket: ${CONFIG.notifySocket}`);
+    }
+    
     this.displayStartupMessage();
     return server;
   }
@@ -1680,6 +1913,7 @@ class MangaServer {
 ║  • GET  /api/search?q=[query]   - Search manga collection             ║
 ║  • GET  /api/health             - Health check                        ║
 ║  • GET  /api/stats              - Performance statistics              ║
+║  • POST /api/invalidate         - Evict regenerated books (local)     ║
 ║  • WS   ws://${CONFIG.hostname}:${CONFIG.port}          - Real-time progress sync${' '.repeat(16)} ║
 ╚═══════════════════════════════════════════════════════════════════════╝
     `);